@@ -4,13 +4,24 @@
 #
 # SPDX-License-Identifier: BSD-3-Clause
 #
-import json
 import os
+import sys
 from queue import Queue
-from weakref import WeakSet
-from flask import Flask, Response, request, send_file, send_from_directory, jsonify
+from flask import Flask, request, send_file, send_from_directory, jsonify
+from werkzeug.serving import make_server
+
+# The shared modules in ../common are copied next to the app in the container
+# (COPY --from=common in the Dockerfile); in a checkout they are found in ../common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import appstate
+import diagnostics
+import handoff
+import ledcore
+import ratelimit
+import scheduler
 
 APP_TAG = "[APP]"
+HTTP_PORT = int(os.getenv("PORT", "8000"))
 
 def _env_bool(name: str, default: bool = False) -> bool:
     v = os.getenv(name)
@@ -22,82 +33,107 @@ DEBUG = _env_bool("DEBUG", True)
 
 app = Flask(__name__)
 
-LED_NAMES = ("blue", "green", "red")
-LED_SET_1 = {
-    "blue": "/sys/class/leds/blue:user/brightness",
-    "green": "/sys/class/leds/green:user/brightness",
-    "red": "/sys/class/leds/red:user/brightness",
-}
-LED_SET_2 = {
-    "blue": "/sys/class/leds/blue:bt/brightness",
-    "green": "/sys/class/leds/green:wlan/brightness",
-    "red": "/sys/class/leds/red:panic/brightness",
-}
-
-status_connections = WeakSet()
 current_status = "Click a color to start"
 current_color = ""
 
 def log(msg: str):
     print(f"{APP_TAG} {msg}")
 
-def _write_led(path: str, on: bool):
+# Diagnostics: /debug/profile and /debug/threads (opt-in, DEBUG_ENDPOINTS=1)
+DEBUG_ENDPOINTS = _env_bool("DEBUG_ENDPOINTS", False)
+if DEBUG_ENDPOINTS:
+    # Record when every later thread starts, for /debug/threads ages
+    diagnostics.track_threads()
+
+def _env_float(name: str, default: float) -> float:
+    v = os.getenv(name)
+    if v is None:
+        return default
     try:
-        with open(path, "w") as f:
-            f.write("1" if on else "0")
-        if DEBUG:
-            log(f"LED write {path} -> {1 if on else 0}")
-    except Exception as e:
-        if DEBUG:
-            log(f"LED write failed {path}: {e}")
-
-def set_system_leds(color: str):
-    mapping = {
-        "blue": {"blue"},
-        "green": {"green"},
-        "red": {"red"},
-        "yellow": {"green", "red"},
-        "purple": {"blue", "red"},
-        "off": set(),
-    }
-    wanted = mapping.get((color or "").lower(), set())
-    for name in LED_NAMES:
-        _write_led(LED_SET_1.get(name, ""), name in wanted)
-        _write_led(LED_SET_2.get(name, ""), name in wanted)
-
-def set_led_color(color: str):
-    if color is None:
-        return
-    color = (color or "").lower()
-    if color not in {"blue", "green", "red", "yellow", "purple", "off"}:
-        return
-    set_system_leds(color)
+        return float(v)
+    except ValueError:
+        log(f"ENV {name}='{v}' invalid; using default {default}")
+        return default
+
+# Persistent state snapshot (see the app-state volume in docker-compose.yml)
+STATE_FILE = os.getenv("STATE_FILE", "/var/lib/app-state/state.json")
+
+# Event journal (GET /api/history)
+HISTORY_FILE = os.getenv("HISTORY_FILE", "")
+HISTORY_TYPES = ("color", "status", "voice", "bridge", "bridge_error")
+
+journal = appstate.EventJournal(
+    HISTORY_TYPES,
+    int(_env_float("HISTORY_SIZE", 1024)),
+    HISTORY_FILE,
+    int(_env_float("HISTORY_FILE_MAX_BYTES", 1 << 20)),
+    log=log,
+)
+
+# Admission control: token buckets per client and route class, capped /status streams
+admission = ratelimit.Admission.from_env(_env_float)
+
+# /status streams, /api/state long-polls and the drain on SIGTERM
+streams = appstate.StreamSettings.from_env(_env_float)
+status_hub = ledcore.StatusHub(streams.max_waiters)
+
+leds = ledcore.LedOutput(ledcore.SysfsBackend(log=log if DEBUG else None))
 
 def apply_color(requested_color: str) -> str:
     global current_color
     requested_color = (requested_color or "").lower()
     if requested_color == current_color and requested_color != "":
         requested_color = "off"
-    set_led_color(requested_color)
+    leds.show(requested_color)
     current_color = "" if requested_color == "off" else requested_color
+    journal.record("color", requested_color)
     return requested_color
 
-def _broadcast():
-    payload = {
-        "status": current_status,
-        "color": current_color,
-    }
-    for q in list(status_connections):
-        try:
-            q.put(payload)
-        except Exception:
-            pass
-
-def _set_status(status: str, color: str):
+def _status_payload() -> dict:
+    return {"status": current_status, "color": current_color}
+
+def _broadcast() -> int:
+    seq = status_hub.publish(_status_payload())
+    state_store.mark()
+    return seq
+
+# the state file holds what /status shows
+state_store = appstate.StateStore(STATE_FILE, _status_payload, _env_float("STATE_FLUSH_SECONDS", 1.0), log=log)
+
+def restore_state():
+    """Resume the last saved color and status with a single LED write."""
+    global current_status, current_color
+    state = state_store.load()
+    if state and state.get("color") in {"blue", "green", "red", "yellow", "purple", ""}:
+        current_color = state["color"]
+        current_status = str(state.get("status") or current_status)
+        log(f"Resumed state #{state_store.seq}: color='{current_color}'")
+    leds.show(current_color or "off")
+
+def _set_status(status: str, color: str) -> int:
     global current_status, current_color
+    if status != current_status:
+        journal.record("status", status)
     current_status = status
     current_color = color
-    _broadcast()
+    return _broadcast()
+
+def _show_scheduled(color: str):
+    applied = apply_color(color)
+    label = "Off" if applied == "off" else applied.capitalize()
+    _set_status(f"Scheduled: {label}", "" if applied == "off" else applied)
+
+# Timed and recurring colors (/api/schedule), saved next to the app state
+SCHEDULE_FILE = os.getenv("SCHEDULE_FILE", "/var/lib/app-state/schedule.json")
+schedule_store = appstate.StateStore(SCHEDULE_FILE, lambda: {"jobs": job_scheduler.dump()}, _env_float("STATE_FLUSH_SECONDS", 1.0), log=log)
+job_scheduler = scheduler.Scheduler(
+    appstate.color_job(lambda: current_color, _show_scheduled),
+    max_jobs=int(_env_float("SCHEDULE_MAX_JOBS", 10000)),
+    on_change=schedule_store.mark,
+    log=log,
+)
+
+ratelimit.install_admission(app, admission, status_hub)
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -106,11 +142,11 @@ def index():
         color = (data.get("color") or request.form.get("color") or request.args.get("color") or "").lower()
         if DEBUG:
             log(f"/ POST payload={data} color='{color}'")
-        if color in {"blue", "green", "red", "yellow", "purple", "off"}:
+        if color in ledcore.COLORS:
             applied = apply_color(color)
             label = "Off" if applied == "off" else applied.capitalize()
-            _set_status(f"Color set: {label}", "" if applied == "off" else applied)
-            return jsonify({"status": current_status, "color": current_color})
+            seq = _set_status(f"Color set: {label}", "" if applied == "off" else applied)
+            return jsonify({"status": current_status, "color": current_color, "seq": seq})
         return jsonify({"error": "invalid color"}), 400
 
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -136,18 +172,10 @@ def serve_static(filename):
     return ("Not Found", 404)
 @app.route('/status')
 def status_stream():
-    def event_stream():
-        q = Queue()
-        status_connections.add(q)
-        try:
-            _broadcast()
-            while True:
-                data = q.get()
-                yield f"data: {json.dumps(data)}\n\n"
-        except GeneratorExit:
-            status_connections.discard(q)
-
-    return Response(event_stream(), mimetype="text/event-stream")
+    q = Queue()
+    if not admission.subscribe(status_hub.connections, q):
+        return ratelimit.too_many(5.0)
+    return appstate.event_stream(status_hub.stream(q, _status_payload), streams.compress_level)
 
 @app.route('/api/color', methods=['POST'])
 def api_color():
@@ -161,14 +189,43 @@ def api_color():
     ).lower()
     if DEBUG:
         log(f"/api/color payload={data} color='{color}'")
-    if color not in {"blue", "green", "red", "yellow", "purple", "off"}:
+    if color not in ledcore.COLORS:
         return jsonify({"error": "invalid color"}), 400
     applied = apply_color(color)
     label = "Off" if applied == "off" else applied.capitalize()
-    _set_status(f"Color set: {label}", "" if applied == "off" else applied)
-    return jsonify({"status": current_status, "color": current_color})
+    seq = _set_status(f"Color set: {label}", "" if applied == "off" else applied)
+    return jsonify({"status": current_status, "color": current_color, "seq": seq})
+
+diagnostics.install_debug_api(app, DEBUG_ENDPOINTS)
+
+appstate.install_state_api(app, status_hub, streams.wait_max_seconds)
+
+# /api/schedule body: {"color": "red", "at": "09:00"}, {"color": "green", "for": 5}, "in", "every"
+appstate.install_schedule_api(app, job_scheduler, appstate.color_action)
+
+appstate.install_history_api(app, journal)
+
+def _take_over():
+    """What only one copy may run: under handoff.py, once the old copy has exited."""
+    job_scheduler.restore((schedule_store.load() or {}).get("jobs"))
+    schedule_store.start()
+    job_scheduler.start()
 
 if __name__ == '__main__':
     log("WebApp LED")
-    set_led_color("off")
-    app.run(debug=False, host='0.0.0.0', port=8000, threaded=True)
+    restore_state()
+    _broadcast()
+    state_store.start()
+    journal.start()
+    handoff.after_takeover(_take_over)
+    server = make_server('0.0.0.0', HTTP_PORT, app, threaded=True, fd=handoff.listen_fd())
+    handoff.stop_on_sigterm(server)
+    log(f"Web server: http://0.0.0.0:{server.port}")
+    handoff.notify_ready()
+    server.serve_forever()
+    # the next copy loads the schedule once this one has exited
+    job_scheduler.stop()
+    log("Stopping: closing /status streams")
+    status_hub.drain(streams.drain_retry_ms, streams.drain_seconds)
+    state_store.flush()
+    schedule_store.flush()
@@ -4,6 +4,14 @@
 
 #include <Arduino_RouterBridge.h>
 
+// Build fingerprint, generated by the Dockerfile (see get_sketch_id)
+#if __has_include("sketch_id.h")
+#include "sketch_id.h"
+#endif
+#ifndef SKETCH_ID
+#define SKETCH_ID "dev"
+#endif
+
 // Matrix dimensions
 #define MATRIX_COLS 13
 #define MATRIX_ROWS 8
@@ -65,6 +73,8 @@ void setup() {
   Bridge.provide("set_matrix", set_matrix);
   Bridge.provide("clear_matrix", clear_matrix_bridge);
   Bridge.provide("get_matrix", get_matrix);
+  Bridge.provide("get_state", get_state);
+  Bridge.provide("get_sketch_id", get_sketch_id);
 
   // LED Toggle functions
   Bridge.provide("toggle_led3_r", toggle_led3_r);
@@ -73,6 +83,7 @@ void setup() {
   Bridge.provide("toggle_led4_r", toggle_led4_r);
   Bridge.provide("toggle_led4_g", toggle_led4_g);
   Bridge.provide("toggle_led4_b", toggle_led4_b);
+  Bridge.provide("set_rgb_leds", set_rgb_leds);
 
   // LED Blink start functions
   Bridge.provide("start_blink_led3_r", start_blink_led3_r);
@@ -200,6 +211,33 @@ String get_matrix() {
   return result;
 }
 
+/**
+ * Get RGB LED and matrix state in one compact reply
+ * Returns: "<mask>,<matrix>" with the set_rgb_leds bitmask and the 104
+ * matrix bits (bit i = LED i) as 32 hex digits, e.g. "45,0000000000000000000000000000c3f0"
+ * The app polls this to find drift cheaply instead of reading get_matrix.
+ */
+String get_state() {
+  int mask = (led3_r_state ? 0x01 : 0) | (led3_g_state ? 0x02 : 0) |
+             (led3_b_state ? 0x04 : 0) | (led4_r_state ? 0x08 : 0) |
+             (led4_g_state ? 0x10 : 0) | (led4_b_state ? 0x20 : 0);
+  uint32_t buffer[4];
+  packMatrix(buffer);
+  char matrix[33];
+  snprintf(matrix, sizeof(matrix), "%08lx%08lx%08lx%08lx",
+           (unsigned long)buffer[3], (unsigned long)buffer[2],
+           (unsigned long)buffer[1], (unsigned long)buffer[0]);
+  return String(mask) + "," + String(matrix);
+}
+
+/**
+ * Get the build fingerprint of the running sketch
+ * Lets the Linux side confirm the flashed firmware without an SWD readback
+ */
+String get_sketch_id() {
+  return String(SKETCH_ID);
+}
+
 /**
  * Clear matrix state and display
  */
@@ -211,11 +249,11 @@ void clearMatrix() {
 }
 
 /**
- * Convert uint8_t array to uint32_t buffer and write to matrix
+ * Pack the uint8_t matrix state into a uint32_t buffer (bit i = LED i)
  */
-void updateDisplay() {
-  uint32_t buffer[4] = {0, 0, 0, 0};
-  
+void packMatrix(uint32_t* buffer) {
+  buffer[0] = buffer[1] = buffer[2] = buffer[3] = 0;
+
   for (int i = 0; i < MATRIX_SIZE; i++) {
     if (matrixState[i]) {
       int uint32_index = i / 32;        // Which uint32_t (0-3)
@@ -223,7 +261,14 @@ void updateDisplay() {
       buffer[uint32_index] |= (1UL << bit_position);
     }
   }
-  
+}
+
+/**
+ * Convert uint8_t array to uint32_t buffer and write to matrix
+ */
+void updateDisplay() {
+  uint32_t buffer[4];
+  packMatrix(buffer);
   matrixWrite(buffer);
 }
 
@@ -264,6 +309,27 @@ void toggle_led4_b() {
   digitalWrite(LED_BUILTIN + 5, led4_b_state ? LOW : HIGH);
 }
 
+/**
+ * Set all RGB LEDs at once from a bitmask
+ * bit 0..5 = led3_r, led3_g, led3_b, led4_r, led4_g, led4_b
+ * Unlike the toggles this is idempotent, so it is safe to re-send after
+ * a lost call or an MCU reset.
+ */
+void set_rgb_leds(int mask) {
+  led3_r_state = (mask & 0x01) != 0;
+  led3_g_state = (mask & 0x02) != 0;
+  led3_b_state = (mask & 0x04) != 0;
+  led4_r_state = (mask & 0x08) != 0;
+  led4_g_state = (mask & 0x10) != 0;
+  led4_b_state = (mask & 0x20) != 0;
+  digitalWrite(LED_BUILTIN, led3_r_state ? LOW : HIGH);
+  digitalWrite(LED_BUILTIN + 1, led3_g_state ? LOW : HIGH);
+  digitalWrite(LED_BUILTIN + 2, led3_b_state ? LOW : HIGH);
+  digitalWrite(LED_BUILTIN + 3, led4_r_state ? LOW : HIGH);
+  digitalWrite(LED_BUILTIN + 4, led4_g_state ? LOW : HIGH);
+  digitalWrite(LED_BUILTIN + 5, led4_b_state ? LOW : HIGH);
+}
+
 // Blink start functions
 void start_blink_led3_r() {
   blinking_led3_r = true;
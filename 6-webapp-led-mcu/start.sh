@@ -10,17 +10,47 @@ set -e
 SKETCH_DIR="/app/sketch"
 APP=${APP:-pingpong}
 
-# Verify if firmware is already flashed
-if /opt/openocd/bin/arduino-verify.sh; then
-    echo ">>> Firmware already present, skipping flash"
+STATE_DIR=${FW_STATE_DIR:-/var/lib/fw-state}
+STATE_FILE="$STATE_DIR/fingerprint"
+
+BIN_FILE=$(ls "$SKETCH_DIR"/*.elf-zsk.bin | head -n 1)
+if [ -z "$BIN_FILE" ]; then
+    echo "ERROR: No .elf-zsk.bin found"
+    exit 1
+fi
+
+# Board identity: the MCU is soldered to the board, so the board serial is enough
+device_id() {
+    for f in /sys/firmware/devicetree/base/serial-number /proc/device-tree/serial-number /etc/machine-id; do
+        if [ -r "$f" ]; then
+            tr -d '\0' < "$f"
+            return
+        fi
+    done
+    hostname
+}
+
+FINGERPRINT="$(sha256sum "$BIN_FILE" | cut -d' ' -f1) $(device_id)"
+
+# Fast path: same binary was flashed (or verified) on this board last time.
+# The app confirms it with a cheap get_sketch_id Bridge call and removes the
+# fingerprint and exits with 3 if the MCU disagrees, so the next start does
+# a full verify.
+if [ "${FW_FORCE_VERIFY:-0}" != "1" ] && [ -f "$STATE_FILE" ] && [ "$(cat "$STATE_FILE")" = "$FINGERPRINT" ]; then
+    echo ">>> Firmware fingerprint unchanged, skipping verification"
+    export FW_FAST_PATH=1
+    export FW_STATE_FILE="$STATE_FILE"
 else
-    echo ">>> Firmware not present or differs, flashing now..."
-    BIN_FILE=$(ls "$SKETCH_DIR"/*.elf-zsk.bin | head -n 1)
-    if [ -z "$BIN_FILE" ]; then
-        echo "ERROR: No .elf-zsk.bin found"
-        exit 1
+    rm -f "$STATE_FILE"
+    # Verify if firmware is already flashed
+    if /opt/openocd/bin/arduino-verify.sh; then
+        echo ">>> Firmware already present, skipping flash"
+    else
+        echo ">>> Firmware not present or differs, flashing now..."
+        /opt/openocd/bin/arduino-flash.sh "$BIN_FILE"
     fi
-    /opt/openocd/bin/arduino-flash.sh "$BIN_FILE"
+    mkdir -p "$STATE_DIR"
+    echo "$FINGERPRINT" > "$STATE_FILE.tmp" && mv "$STATE_FILE.tmp" "$STATE_FILE"
 fi
 
 # Always reset the microcontroller to ensure clean state
@@ -31,4 +61,7 @@ echo ">>> Activating virtualenv"
 source /opt/venv/bin/activate
 
 echo ">>> Running Python App..."
-python /app/webapp-led-mcu.py
\ No newline at end of file
+# handoff.py keeps the port open and restarts the app on SIGHUP without downtime.
+# Exit code 3 (the MCU runs another sketch, see above) ends the container, so
+# the restart comes back through the full verification and flashes if needed.
+exec python /app/handoff.py --exit-on 3 -- python /app/webapp-led-mcu.py
@@ -5,14 +5,25 @@
 # SPDX-License-Identifier: BSD-3-Clause
 #
 
-import json
 import os
+import sys
 import threading
 from queue import Queue
-from weakref import WeakSet
-from flask import Flask, Response, request, send_file, send_from_directory, jsonify
+from flask import Flask, request, send_file, send_from_directory, jsonify
+from werkzeug.serving import make_server
+
+# The shared modules in ../common are copied next to the app in the container
+# (COPY --from=common in the Dockerfile); in a checkout they are found in ../common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import appstate
+import diagnostics
+import handoff
+import ledcore
+import ratelimit
+import scheduler
 
 APP_TAG = "[APP]"
+HTTP_PORT = int(os.getenv("PORT", "8000"))
 
 def log(msg: str):
     print(f"{APP_TAG} {msg}")
@@ -23,12 +34,28 @@ def _env_bool(name: str, default: bool = False) -> bool:
         return default
     return str(v).strip().lower() in {"1", "true", "yes", "on"}
 
+def _env_float(name: str, default: float) -> float:
+    v = os.getenv(name)
+    if v is None:
+        return default
+    try:
+        return float(v)
+    except ValueError:
+        log(f"ENV {name}='{v}' invalid; using default {default}")
+        return default
+
 DEBUG = _env_bool("DEBUG", True)
 
 def log_debug(msg: str):
     if DEBUG:
         print(f"{APP_TAG} {msg}")
 
+# Diagnostics: /debug/profile and /debug/threads (opt-in, DEBUG_ENDPOINTS=1)
+DEBUG_ENDPOINTS = _env_bool("DEBUG_ENDPOINTS", False)
+if DEBUG_ENDPOINTS:
+    # Record when every later thread starts, for /debug/threads ages
+    diagnostics.track_threads()
+
 # Try to import Device Bridge, fallback to mock for testing
 try:
     from arduino.app_utils import *
@@ -46,125 +73,159 @@ except ImportError:
 
     Bridge = MockBridge()
 
+bridge_breaker = ledcore.BridgeBreaker(
+    # looked up per call, so a swapped Bridge (tests, benchmarks) is used
+    lambda function_name, *args: Bridge.call(function_name, *args),
+    threshold=int(_env_float("BRIDGE_FAILURE_THRESHOLD", 3)),
+    backoff_min=_env_float("BRIDGE_BACKOFF_MIN_SECONDS", 1.0),
+    backoff_max=_env_float("BRIDGE_BACKOFF_MAX_SECONDS", 30.0),
+    log=log,
+    log_debug=log_debug,
+)
+
 # Wrapper for async Bridge calls
 def bridge_call_async(function_name, *args):
     """Call Bridge asynchronously to avoid blocking the UI thread"""
+    if not bridge_breaker.allow():
+        return
+
     def _call():
         try:
-            Bridge.call(function_name, *args)
+            bridge_breaker.call(function_name, *args)
+        except ledcore.BridgeUnavailable:
+            pass
         except Exception as e:
             log(f"Bridge call failed: {e}")
+            journal.record("bridge_error", f"{function_name}: {e}")
 
     thread = threading.Thread(target=_call, daemon=True)
     thread.start()
 
+# Persistent state snapshot (see the app-state volume in docker-compose.yml)
+STATE_FILE = os.getenv("STATE_FILE", "/var/lib/app-state/state.json")
+
 app = Flask(__name__)
 
-LED_NAMES = ("blue", "green", "red")
-LED_SET_1 = {
-    "blue": "/sys/class/leds/blue:user/brightness",
-    "green": "/sys/class/leds/green:user/brightness",
-    "red": "/sys/class/leds/red:user/brightness",
-}
-LED_SET_2 = {
-    "blue": "/sys/class/leds/blue:bt/brightness",
-    "green": "/sys/class/leds/green:wlan/brightness",
-    "red": "/sys/class/leds/red:panic/brightness",
-}
-
-# MCU LED states tracking (RGB LEDs)
-led_states = {
-    "led3_r": False, "led3_g": False, "led3_b": False,
-    "led4_r": False, "led4_g": False, "led4_b": False,
-}
-
-status_connections = WeakSet()
+# System LEDs (sysfs) and MCU RGB LEDs (one set_rgb_leds per color change)
+sysfs_leds = ledcore.SysfsBackend(log=log if DEBUG else None)
+mcu_leds = ledcore.BridgeBackend(bridge_call_async)
+leds = ledcore.LedOutput(sysfs_leds, mcu_leds)
+
 current_status = "Click a color to start"
 current_color = ""
 
-def _write_led(path: str, on: bool):
-    try:
-        with open(path, "w") as f:
-            f.write("1" if on else "0")
-        if DEBUG:
-            log(f"LED write {path} -> {1 if on else 0}")
-    except Exception as e:
-        if DEBUG:
-            log(f"LED write failed {path}: {e}")
-
-def set_system_leds(color: str):
-    mapping = {
-        "blue": {"blue"},
-        "green": {"green"},
-        "red": {"red"},
-        "yellow": {"green", "red"},
-        "purple": {"blue", "red"},
-        "off": set(),
-    }
-    wanted = mapping.get((color or "").lower(), set())
-    for name in LED_NAMES:
-        _write_led(LED_SET_1.get(name, ""), name in wanted)
-        _write_led(LED_SET_2.get(name, ""), name in wanted)
+# Event journal (GET /api/history)
+HISTORY_FILE = os.getenv("HISTORY_FILE", "")
+HISTORY_TYPES = ("color", "status", "voice", "bridge", "bridge_error")
 
-def set_led_color(color: str):
-    if color is None:
-        return
-    color = (color or "").lower()
-    if color not in {"blue", "green", "red", "yellow", "purple", "off"}:
-        return
+journal = appstate.EventJournal(
+    HISTORY_TYPES,
+    int(_env_float("HISTORY_SIZE", 1024)),
+    HISTORY_FILE,
+    int(_env_float("HISTORY_FILE_MAX_BYTES", 1 << 20)),
+    log=log,
+)
 
-    # System LEDs (sysfs)
-    set_system_leds(color)
+# Admission control: token buckets per client and route class, capped /status streams
+admission = ratelimit.Admission.from_env(_env_float)
 
-    # MCU LEDs (Bridge)
-    try:
-        color_map = {
-            "blue": ["led3_b", "led4_b"],
-            "green": ["led3_g", "led4_g"],
-            "red": ["led3_r", "led4_r"],
-            "yellow": ["led3_r", "led3_g", "led4_r", "led4_g"],
-            "purple": ["led3_r", "led3_b", "led4_r", "led4_b"],
-            "off": [],
-        }
-
-        target_leds = set(color_map[color])
-        for led in list(led_states.keys()):
-            if led_states[led] and led not in target_leds:
-                bridge_call_async(f"toggle_{led}")
-                led_states[led] = False
-
-        for led in color_map[color]:
-            if not led_states[led]:
-                bridge_call_async(f"toggle_{led}")
-                led_states[led] = True
-    except Exception as e:
-        log(f"Set MCU LED color {color} failed: {e}")
+# /status streams, /api/state long-polls and the drain on SIGTERM
+streams = appstate.StreamSettings.from_env(_env_float)
+status_hub = ledcore.StatusHub(streams.max_waiters)
 
 def apply_color(requested_color: str) -> str:
     global current_color
     requested_color = (requested_color or "").lower()
     if requested_color == current_color and requested_color != "":
         requested_color = "off"
-    set_led_color(requested_color)
+    leds.show(requested_color)
     current_color = "" if requested_color == "off" else requested_color
+    journal.record("color", requested_color)
     return requested_color
 
-def _broadcast():
-    payload = {
+def _status_payload() -> dict:
+    return {
         "status": current_status,
         "color": current_color,
+        "bridge": "ok" if bridge_breaker.healthy else "down",
     }
-    for q in list(status_connections):
-        try:
-            q.put(payload)
-        except Exception:
-            pass
 
-def _set_status(status: str, color: str):
+def _broadcast() -> int:
+    seq = status_hub.publish(_status_payload())
+    state_store.mark()
+    return seq
+
+def _on_bridge_change():
+    journal.record("bridge", bridge_breaker.state)
+    _broadcast()
+
+bridge_breaker.on_change = _on_bridge_change
+bridge_breaker.on_recover = mcu_leds.repush
+
+# Periodic get_state check: re-push the LEDs only if the MCU lost them (0 = off)
+mcu_reconciler = ledcore.McuReconciler(
+    read=lambda: bridge_breaker.call("get_state"),
+    expected=lambda: {"leds": mcu_leds.mask},
+    repush={"leds": mcu_leds.repush},
+    interval=_env_float("MCU_RECONCILE_SECONDS", 10.0),
+    log=log,
+)
+
+def _state_snapshot() -> dict:
+    return {
+        "status": current_status,
+        "color": current_color,
+        "mcu_leds": mcu_leds.mask,
+    }
+
+state_store = appstate.StateStore(STATE_FILE, _state_snapshot, _env_float("STATE_FLUSH_SECONDS", 1.0), log=log)
+
+def restore_state():
+    """Resume the last saved state and push it to the hardware once.
+
+    The MCU backend only sends a mask when it changes, so it must match what
+    the MCU shows: the MCU always gets one idempotent set_rgb_leds, snapshot
+    or not.
+    """
+    global current_status, current_color
+    state = state_store.load()
+    if state and state.get("color") in {"blue", "green", "red", "yellow", "purple", ""}:
+        try:
+            mask = int(state.get("mcu_leds") or 0)
+        except (TypeError, ValueError) as e:
+            log(f"State file {state_store.path} has a bad mcu_leds, starting clean: {e}")
+        else:
+            current_color = state["color"]
+            current_status = str(state.get("status") or current_status)
+            mcu_leds.mask = mask
+            log(f"Resumed state #{state_store.seq}: color='{current_color}' mcu_leds={mcu_leds.mask}")
+    sysfs_leds.apply(ledcore.lookup(current_color or "off"))
+    mcu_leds.repush()
+
+def _set_status(status: str, color: str) -> int:
     global current_status, current_color
+    if status != current_status:
+        journal.record("status", status)
     current_status = status
     current_color = color
-    _broadcast()
+    return _broadcast()
+
+def _show_scheduled(color: str):
+    applied = apply_color(color)
+    label = "Off" if applied == "off" else applied.capitalize()
+    _set_status(f"Scheduled: {label}", "" if applied == "off" else applied)
+
+# Timed and recurring colors (/api/schedule), saved next to the app state
+SCHEDULE_FILE = os.getenv("SCHEDULE_FILE", "/var/lib/app-state/schedule.json")
+schedule_store = appstate.StateStore(SCHEDULE_FILE, lambda: {"jobs": job_scheduler.dump()}, _env_float("STATE_FLUSH_SECONDS", 1.0), log=log)
+job_scheduler = scheduler.Scheduler(
+    appstate.color_job(lambda: current_color, _show_scheduled),
+    max_jobs=int(_env_float("SCHEDULE_MAX_JOBS", 10000)),
+    on_change=schedule_store.mark,
+    log=log,
+)
+
+ratelimit.install_admission(app, admission, status_hub)
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -173,11 +234,11 @@ def index():
         color = (data.get("color") or request.form.get("color") or request.args.get("color") or "").lower()
         if DEBUG:
             log(f"/ POST payload={data} color='{color}'")
-        if color in {"blue", "green", "red", "yellow", "purple", "off"}:
+        if color in ledcore.COLORS:
             applied = apply_color(color)
             label = "Off" if applied == "off" else applied.capitalize()
-            _set_status(f"Color set: {label}", "" if applied == "off" else applied)
-            return jsonify({"status": current_status, "color": current_color})
+            seq = _set_status(f"Color set: {label}", "" if applied == "off" else applied)
+            return jsonify({"status": current_status, "color": current_color, "seq": seq})
         return jsonify({"error": "invalid color"}), 400
 
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -203,18 +264,10 @@ def serve_static(filename):
     return ("Not Found", 404)
 @app.route('/status')
 def status_stream():
-    def event_stream():
-        q = Queue()
-        status_connections.add(q)
-        try:
-            _broadcast()
-            while True:
-                data = q.get()
-                yield f"data: {json.dumps(data)}\n\n"
-        except GeneratorExit:
-            status_connections.discard(q)
-
-    return Response(event_stream(), mimetype="text/event-stream")
+    q = Queue()
+    if not admission.subscribe(status_hub.connections, q):
+        return ratelimit.too_many(5.0)
+    return appstate.event_stream(status_hub.stream(q, _status_payload), streams.compress_level)
 
 @app.route('/api/color', methods=['POST'])
 def api_color():
@@ -228,14 +281,58 @@ def api_color():
     ).lower()
     if DEBUG:
         log(f"/api/color payload={data} color='{color}'")
-    if color not in {"blue", "green", "red", "yellow", "purple", "off"}:
+    if color not in ledcore.COLORS:
         return jsonify({"error": "invalid color"}), 400
     applied = apply_color(color)
     label = "Off" if applied == "off" else applied.capitalize()
-    _set_status(f"Color set: {label}", "" if applied == "off" else applied)
-    return jsonify({"status": current_status, "color": current_color})
+    seq = _set_status(f"Color set: {label}", "" if applied == "off" else applied)
+    return jsonify({"status": current_status, "color": current_color, "seq": seq})
+
+diagnostics.install_debug_api(app, DEBUG_ENDPOINTS)
+
+appstate.install_state_api(app, status_hub, streams.wait_max_seconds)
+
+@app.route('/api/bridge')
+def bridge_status():
+    """Bridge health and MCU state checks"""
+    return jsonify({
+        "state": bridge_breaker.state,
+        "fast_failed": bridge_breaker.fast_failed,
+        "reconcile": mcu_reconciler.snapshot(),
+    })
+
+# /api/schedule body: {"color": "red", "at": "09:00"}, {"color": "green", "for": 5}, "in", "every"
+appstate.install_schedule_api(app, job_scheduler, appstate.color_action)
+
+appstate.install_history_api(app, journal)
+
+def _take_over():
+    """What only one copy may run: under handoff.py, once the old copy has exited."""
+    if USE_REAL_BRIDGE:
+        mcu_reconciler.start()
+    job_scheduler.restore((schedule_store.load() or {}).get("jobs"))
+    schedule_store.start()
+    job_scheduler.start()
 
 if __name__ == '__main__':
     log("WebApp LED")
-    set_led_color("off")
-    app.run(debug=False, host='0.0.0.0', port=8000, threaded=True)
+    if USE_REAL_BRIDGE:
+        # see start.sh: checks the firmware fingerprint it trusted
+        threading.Thread(target=ledcore.confirm_firmware, args=(Bridge.call,),
+                         kwargs={"log": log}, name="fw-confirm", daemon=True).start()
+    restore_state()
+    _broadcast()
+    state_store.start()
+    journal.start()
+    handoff.after_takeover(_take_over)
+    server = make_server('0.0.0.0', HTTP_PORT, app, threaded=True, fd=handoff.listen_fd())
+    handoff.stop_on_sigterm(server)
+    log(f"Web server: http://0.0.0.0:{server.port}")
+    handoff.notify_ready()
+    server.serve_forever()
+    # the next copy loads the schedule once this one has exited
+    job_scheduler.stop()
+    log("Stopping: closing /status streams")
+    status_hub.drain(streams.drain_retry_ms, streams.drain_seconds)
+    state_store.flush()
+    schedule_store.flush()
@@ -9,26 +9,25 @@ import os
 import sys
 import getopt
 import signal
+import threading
+import time
 from edge_impulse_linux.audio import AudioImpulseRunner
 
-APP_TAG = "[APP]"
+# The shared modules in ../common are copied next to the app in the container
+# (COPY --from=common in the Dockerfile); in a checkout they are found in ../common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import audiodev
+import ledcore
 
-LED_NAMES = ("blue", "green", "red")
-LED_SET_1 = {
-    "blue": "/sys/class/leds/blue:user/brightness",
-    "green": "/sys/class/leds/green:user/brightness",
-    "red": "/sys/class/leds/red:user/brightness",
-}
-LED_SET_2 = {
-    "blue": "/sys/class/leds/blue:bt/brightness",
-    "green": "/sys/class/leds/green:wlan/brightness",
-    "red": "/sys/class/leds/red:panic/brightness",
-}
+APP_TAG = "[APP]"
 
 COLORS = {"blue", "green", "red", "yellow", "purple"}
 
 runner = None
+pipeline = None
+audio_devices = None
 current_color = ""
+voice_shutdown_event = threading.Event()
 
 def log(msg: str):
     print(f"{APP_TAG} {msg}")
@@ -43,51 +42,37 @@ def _env_float(name: str, default: float) -> float:
         log(f"ENV {name}='{v}' invalid; using default {default}")
         return default
 
-def _env_int(name: str) -> int | None:
-    v = os.getenv(name)
-    if v is None or v == "":
-        return None
-    try:
-        return int(v)
-    except ValueError:
-        log(f"ENV {name}='{v}' invalid; ignoring")
-        return None
-
 THRESH = _env_float("THRESH", 0.80)
+VOICE_STATS_SECONDS = _env_float("VOICE_STATS_SECONDS", 60.0)
 
-def _write_led(path: str, on: bool):
-    if not path:
-        return
-    try:
-        with open(path, "w") as f:
-            f.write("1" if on else "0")
-    except Exception as e:
-        log(f"LED write failed {path}: {e}")
-
-def set_system_leds(color: str):
-    mapping = {
-        "blue": {"blue"},
-        "green": {"green"},
-        "red": {"red"},
-        "yellow": {"green", "red"},
-        "purple": {"blue", "red"},
-        "off": set(),
-    }
-    wanted = mapping.get((color or "").lower(), set())
-    for name in LED_NAMES:
-        _write_led(LED_SET_1.get(name, ""), name in wanted)
-        _write_led(LED_SET_2.get(name, ""), name in wanted)
-
-def set_led_color(color: str):
-    color = (color or "").lower()
-    if color not in {"blue", "green", "red", "yellow", "purple", "off"}:
+# Voice pipeline: capture -> AudioRing -> inference -> ActionQueue -> actions
+VOICE_RING_CAPTURE = os.getenv("VOICE_RING_CAPTURE", "1") != "0"
+VOICE_RING_SECONDS = _env_float("VOICE_RING_SECONDS", 2.0)
+VOICE_WINDOW_HOP = _env_float("VOICE_WINDOW_HOP", 0.25)
+VOICE_ACTION_QUEUE = int(_env_float("VOICE_ACTION_QUEUE", 32))
+
+leds = ledcore.LedOutput(ledcore.SysfsBackend(log=log))
+
+def _log_pipeline_stats():
+    if pipeline is None:
         return
-    set_system_leds(color)
+    stats = pipeline.snapshot()
+    capture, inference, action = stats["capture"], stats["inference"], stats["action"]
+    def ms(v):
+        return "-" if v is None else f"{v}ms"
+    log(
+        f"Pipeline: capture={capture['mode']} overruns={capture.get('ring_overruns', 0)}"
+        f" overflows={capture.get('device_overflows', 0)}"
+        f" inference_lag_p99={ms(inference['lag']['p99_ms'])}"
+        f" action_lag_p99={ms(action['lag']['p99_ms'])} dropped={action['dropped']}"
+    )
 
 def signal_handler(sig, frame):
     log("Interrupted")
+    voice_shutdown_event.set()
+    _log_pipeline_stats()
     try:
-        set_led_color("off")
+        leds.show("off")
     except Exception:
         pass
     if runner:
@@ -97,7 +82,7 @@ def signal_handler(sig, frame):
 signal.signal(signal.SIGINT, signal_handler)
 
 def help_text():
-    print("python led-voice.py <path_to_model.eim> <audio_device_ID, optional>")
+    print("python led-voice.py <path_to_model.eim> <audio_device_ID_or_name, optional>")
 
 def _resolve_model_path(model: str) -> str:
     if os.path.isabs(model):
@@ -114,8 +99,33 @@ def _print_scores(labels, scores, total_ms: int):
         print(f"{label}: {score:.2f}\t", end="")
     print("", flush=True)
 
+def handle_result(res: dict, ts: float):
+    """Action stage: runs on the pipeline's action thread."""
+    global current_color
+    if "classification" in res["result"].keys():
+        total_ms = res["timing"]["dsp"] + res["timing"]["classification"]
+        scores = res["result"]["classification"]
+        _print_scores(res["labels"], scores, total_ms)
+
+        if scores:
+            best_label = max(scores, key=lambda l: scores.get(l, -1.0))
+            best_score = scores.get(best_label, 0.0)
+            if best_label in COLORS and best_score >= THRESH and best_label != current_color:
+                leds.show(best_label)
+                current_color = best_label
+    elif "freeform" in res["result"].keys():
+        total_ms = res["timing"]["dsp"] + res["timing"]["classification"]
+        print(f"Result ({total_ms} ms.)")
+        for i in range(0, len(res["result"]["freeform"])):
+            values = ", ".join(f"{x:.4f}" for x in res["result"]["freeform"][i])
+            print(f"    Freeform output {i}: {values}")
+    else:
+        total_ms = res["timing"]["dsp"] + res["timing"]["classification"]
+        print(f"Result ({total_ms} ms.)")
+        print(res["result"])
+
 def main(argv):
-    global runner, current_color
+    global runner, pipeline, audio_devices
 
     try:
         opts, args = getopt.getopt(argv, "h", ["--help"])
@@ -135,46 +145,27 @@ def main(argv):
 
     model_path = _resolve_model_path(model)
 
-    selected_device_id = None
-    if len(args) >= 2:
-        try:
-            selected_device_id = int(args[1])
-            log(f"Audio device ID: {selected_device_id}")
-        except ValueError:
-            log(f"Invalid audio device ID: {args[1]}")
-    else:
-        env_device = _env_int("PA_ALSA_DEVICE")
-        if env_device is not None:
-            selected_device_id = env_device
-            log(f"Audio device ID (env): {selected_device_id}")
+    # an index, or part of the microphone's name: "USB", "hw:1,0"
+    device_spec = args[1] if len(args) >= 2 else os.getenv("PA_ALSA_DEVICE")
 
+    audio_devices = audiodev.AudioDevices(log=log)
+    pipeline = audiodev.VoicePipeline(handle_result, VOICE_ACTION_QUEUE, audio_devices, voice_shutdown_event,
+                                      VOICE_RING_CAPTURE, VOICE_RING_SECONDS, VOICE_WINDOW_HOP, log=log)
+    pipeline.start()
+    next_stats = time.monotonic() + VOICE_STATS_SECONDS
     with AudioImpulseRunner(model_path) as runner:
         model_info = runner.init()
         labels = model_info["model_parameters"]["labels"]
         log('Loaded runner for "' + model_info["project"]["owner"] + ' / ' + model_info["project"]["name"] + '"')
-
-        for res, audio in runner.classifier(device_id=selected_device_id):
-            if "classification" in res["result"].keys():
-                total_ms = res["timing"]["dsp"] + res["timing"]["classification"]
-                scores = res["result"]["classification"]
-                _print_scores(labels, scores, total_ms)
-
-                if scores:
-                    best_label = max(scores, key=lambda l: scores.get(l, -1.0))
-                    best_score = scores.get(best_label, 0.0)
-                    if best_label in COLORS and best_score >= THRESH and best_label != current_color:
-                        set_led_color(best_label)
-                        current_color = best_label
-            elif "freeform" in res["result"].keys():
-                total_ms = res["timing"]["dsp"] + res["timing"]["classification"]
-                print(f"Result ({total_ms} ms.)")
-                for i in range(0, len(res["result"]["freeform"])):
-                    values = ", ".join(f"{x:.4f}" for x in res["result"]["freeform"][i])
-                    print(f"    Freeform output {i}: {values}")
-            else:
-                total_ms = res["timing"]["dsp"] + res["timing"]["classification"]
-                print(f"Result ({total_ms} ms.)")
-                print(res["result"])
+        selected_device_id = audio_devices.device_id(device_spec, audiodev.model_rate(model_info["model_parameters"]))
+
+        # Inference stage: results go to the action thread, which prints and drives the LEDs
+        for res in pipeline.results(runner, model_info["model_parameters"], selected_device_id):
+            pipeline.submit(dict(res, labels=labels))
+            if VOICE_STATS_SECONDS > 0 and time.monotonic() >= next_stats:
+                next_stats = time.monotonic() + VOICE_STATS_SECONDS
+                _log_pipeline_stats()
+    pipeline.stop()
 
 if __name__ == "__main__":
     main(sys.argv[1:])
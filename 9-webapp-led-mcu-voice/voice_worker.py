@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""Voice worker: one AudioImpulseRunner on one microphone, in its own process.
+
+Started by webapp-led-mcu-voice.py for each entry of VOICE_PIPELINES. Writes
+one JSON line per classifier window to stdout; logs go to stderr. Exits when
+the parent dies or stdout is closed.
+"""
+
+import argparse
+import ctypes
+import itertools
+import json
+import os
+import signal
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import audiodev
+
+PR_SET_PDEATHSIG = 1
+
+def log(name: str, msg: str):
+    print(f"[VOICE:{name}] {msg}", file=sys.stderr, flush=True)
+
+def emit(payload: dict):
+    sys.stdout.write(json.dumps(payload) + "\n")
+    sys.stdout.flush()
+
+def _die_with_parent():
+    try:
+        ctypes.CDLL(None, use_errno=True).prctl(PR_SET_PDEATHSIG, signal.SIGTERM)
+    except (OSError, AttributeError):
+        pass
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--name", default="voice")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--device", default=None, help="PortAudio input index or part of its name")
+    parser.add_argument("--cpus", default="", help="CPU list to pin to, e.g. 2,3")
+    args = parser.parse_args()
+
+    _die_with_parent()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if args.cpus:
+        try:
+            os.sched_setaffinity(0, {int(c) for c in args.cpus.split(",")})
+        except (OSError, ValueError) as e:
+            log(args.name, f"CPU affinity {args.cpus} not applied: {e}")
+
+    from edge_impulse_linux.audio import AudioImpulseRunner
+
+    with AudioImpulseRunner(args.model) as runner:
+        model_info = runner.init()
+        devices = audiodev.AudioDevices(log=lambda msg: log(args.name, msg))
+        device_id = devices.device_id(args.device, audiodev.model_rate(model_info["model_parameters"]))
+        emit({
+            "event": "ready",
+            "pid": os.getpid(),
+            "cpus": sorted(os.sched_getaffinity(0)),
+            "project": f"{model_info['project']['owner']} / {model_info['project']['name']}",
+            "labels": model_info["model_parameters"]["labels"],
+            "audio": devices.snapshot()["selected"],
+        })
+
+        _iter = runner.classifier(device_id=device_id)
+        with audiodev.quiet_stderr():
+            try:
+                first = next(_iter)
+            except StopIteration:
+                return 0
+        try:
+            for res, _ in itertools.chain([first], _iter):
+                emit({
+                    "ts": time.time(),
+                    "timing": res.get("timing", {}),
+                    "classification": res["result"].get("classification", {}),
+                })
+        except BrokenPipeError:
+            pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
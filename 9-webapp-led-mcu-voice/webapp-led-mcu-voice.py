@@ -5,21 +5,46 @@
 # SPDX-License-Identifier: BSD-3-Clause
 #
 
+import time
+STARTUP_T0 = time.monotonic()
+
 import sys
 import os
 import threading
 import json
-import time
-import itertools
+import math
 import socket
-from contextlib import contextmanager
-from queue import Queue
-from weakref import WeakSet
-from flask import Flask, Response, send_file, send_from_directory
+import struct
+import fcntl
+import ctypes
+import importlib.util
+import subprocess
+from collections import deque
+from functools import lru_cache
+from queue import Empty, Full, Queue
+from flask import Flask, jsonify, request, send_file, send_from_directory
+from werkzeug.serving import make_server
 import logging
-from edge_impulse_linux.audio import AudioImpulseRunner
+
+# The shared modules in ../common are copied next to the app in the container
+# (COPY --from=common in the Dockerfile); in a checkout they are found in ../common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import appstate
+import diagnostics
+import handoff
+import ledcore
+import ratelimit
+import scheduler
+import audiodev
 
 APP_TAG = "[APP]"
+HTTP_PORT = int(os.getenv("PORT", "8000"))
+
+# Startup phase timestamps (name, monotonic time), reported once serving
+startup_phases = [("imports", time.monotonic())]
+
+def _startup_phase(name: str):
+    startup_phases.append((name, time.monotonic()))
 
 def log(msg: str):
     print(f"{APP_TAG} {msg}")
@@ -28,6 +53,18 @@ def log_debug(msg: str):
     if DEBUG:
         print(f"{APP_TAG} {msg}")
 
+def _env_bool(name: str, default: bool = False) -> bool:
+    v = os.getenv(name)
+    if v is None:
+        return default
+    return str(v).strip().lower() in {"1", "true", "yes", "on"}
+
+# Diagnostics: /debug/profile and /debug/threads (opt-in, DEBUG_ENDPOINTS=1)
+DEBUG_ENDPOINTS = _env_bool("DEBUG_ENDPOINTS", False)
+if DEBUG_ENDPOINTS:
+    # Record when every later thread starts, for /debug/threads ages
+    diagnostics.track_threads()
+
 # Try to import Device Bridge, fallback to mock for testing
 try:
     from arduino.app_utils import *
@@ -45,103 +82,282 @@ except ImportError:
 
     Bridge = MockBridge()
 
-# Wrapper for async Bridge calls
+class _LaneStats:
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.over_budget = 0
+        self._samples = deque(maxlen=512)
+
+    def record(self, latency_ms: float, ok: bool):
+        self.sent += 1
+        if not ok:
+            self.failed += 1
+        if latency_ms > self.budget_ms:
+            self.over_budget += 1
+        self._samples.append(latency_ms)
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self._samples)
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2) if ordered else None
+        return {
+            "budget_ms": self.budget_ms,
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "over_budget": self.over_budget,
+            "p50_ms": pct(0.50),
+            "p99_ms": pct(0.99),
+        }
+
+class BridgeDispatcher:
+    """Single worker feeding the MCU link from two priority lanes.
+
+    interactive: FIFO, always served first (LED changes, state re-push).
+    frame: one slot per target (e.g. "matrix"), latest wins. A frame that is
+    superseded before it is sent is dropped, so animation traffic never
+    queues up in front of a user command. Latency is measured from enqueue
+    to call completion and checked against a per-lane budget.
+    """
+
+    def __init__(self, interactive_budget_ms: float, frame_budget_ms: float):
+        self._cond = threading.Condition()
+        self._interactive = deque()
+        self._frames = {}
+        self._thread = None
+        self.stats = {
+            "interactive": _LaneStats(interactive_budget_ms),
+            "frame": _LaneStats(frame_budget_ms),
+        }
+
+    def submit(self, function_name, *args):
+        with self._cond:
+            self._interactive.append((function_name, args, time.monotonic()))
+            self._wake()
+
+    def submit_frame(self, slot: str, function_name, *args):
+        with self._cond:
+            if slot in self._frames:
+                self.stats["frame"].dropped += 1
+            self._frames[slot] = (function_name, args, time.monotonic())
+            self._wake()
+
+    def _wake(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="bridge-dispatch", daemon=True)
+            self._thread.start()
+        self._cond.notify()
+
+    def _next(self):
+        with self._cond:
+            while not self._interactive and not self._frames:
+                self._cond.wait()
+            if self._interactive:
+                return "interactive", self._interactive.popleft()
+            slot = next(iter(self._frames))
+            return "frame", self._frames.pop(slot)
+
+    def _run(self):
+        while True:
+            lane, (function_name, args, enqueued) = self._next()
+            ok = True
+            try:
+                bridge_breaker.call(function_name, *args)
+            except ledcore.BridgeUnavailable:
+                self.stats[lane].dropped += 1
+                continue
+            except Exception as e:
+                ok = False
+                log(f"Bridge call failed: {e}")
+                journal.record("bridge_error", f"{function_name}: {e}")
+            self.stats[lane].record((time.monotonic() - enqueued) * 1000.0, ok)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            pending = {"interactive": len(self._interactive), "frame": len(self._frames)}
+        return {lane: {**st.snapshot(), "pending": pending[lane]} for lane, st in self.stats.items()}
+
+# Wrappers for async Bridge calls
 def bridge_call_async(function_name, *args):
-    """Call Bridge asynchronously to avoid blocking the UI thread"""
-    def _call():
-        try:
-            Bridge.call(function_name, *args)
-        except Exception as e:
-            log(f"Bridge call failed: {e}")
+    """Queue an interactive Bridge call; served ahead of animation frames"""
+    if not bridge_breaker.allow():
+        return
+    bridge_dispatcher.submit(function_name, *args)
 
-    thread = threading.Thread(target=_call, daemon=True)
-    thread.start()
+def bridge_send_frame(slot: str, function_name, *args):
+    """Queue a frame for `slot`; replaces any frame still waiting there"""
+    if not bridge_breaker.allow():
+        return
+    bridge_dispatcher.submit_frame(slot, function_name, *args)
 
-# LED states tracking (RGB LEDs)
-led_states = {
-    'led3_r': False, 'led3_g': False, 'led3_b': False,
-    'led4_r': False, 'led4_g': False, 'led4_b': False
-}
+# Persistent state snapshot (see the app-state volume in docker-compose.yml)
+STATE_FILE = os.getenv("STATE_FILE", "/var/lib/app-state/state.json")
 
-# System LED mappings (sysfs)
-LED_NAMES = ("blue", "green", "red")
-LED_SET_1 = {
-    "blue": "/sys/class/leds/blue:user/brightness",
-    "green": "/sys/class/leds/green:user/brightness",
-    "red": "/sys/class/leds/red:user/brightness",
-}
-LED_SET_2 = {
-    "blue": "/sys/class/leds/blue:bt/brightness",
-    "green": "/sys/class/leds/green:wlan/brightness",
-    "red": "/sys/class/leds/red:panic/brightness",
-}
+# Event journal (GET /api/history)
+HISTORY_FILE = os.getenv("HISTORY_FILE", "")
+HISTORY_TYPES = ("color", "status", "voice", "bridge", "bridge_error", "model")
 
-def _write_led(name: str, on: bool):
-    paths = [LED_SET_1.get(name), LED_SET_2.get(name)]
-    for path in paths:
-        if not path:
-            continue
-        try:
-            with open(path, 'w') as f:
-                f.write('1' if on else '0')
-        except Exception as e:
-            if DEBUG:
-                log_debug(f"[LED] could not set {path} -> {on}: {e}")
-
-def set_system_leds(color: str):
-    """Set system LEDs for given color (blue, green, red, yellow, purple, off)."""
-    mapping = {
-        'blue': {'blue'},
-        'green': {'green'},
-        'red': {'red'},
-        'yellow': {'green', 'red'},
-        'purple': {'blue', 'red'},
-    }
-    wanted = mapping.get((color or '').lower(), set())
-    for n in LED_NAMES:
-        _write_led(n, n in wanted)
+# System LEDs (sysfs) and MCU RGB LEDs (one set_rgb_leds per color change)
+sysfs_leds = ledcore.SysfsBackend(log=log_debug)
+mcu_leds = ledcore.BridgeBackend(bridge_call_async)
+leds = ledcore.LedOutput(sysfs_leds, mcu_leds)
+# Last color written to the LEDs (current_color is the user's selection)
+led_color = "off"
 
 def set_led_color(color: str):
     """Set LED color (blue, green, red, yellow, purple, off)."""
-    try:
-        set_system_leds(color)
-        color = (color or "").lower()
-        color_map = {
-            'blue': ['led3_b', 'led4_b'],
-            'green': ['led3_g', 'led4_g'],
-            'red': ['led3_r', 'led4_r'],
-            'yellow': ['led3_r', 'led3_g', 'led4_r', 'led4_g'],
-            'purple': ['led3_r', 'led3_b', 'led4_r', 'led4_b'],
-            'off': []
+    global led_color
+    led_effects.stop()
+    entry = leds.show(color)
+    if entry is None:
+        log(f"Unknown LED color: {color}")
+        return
+    led_color = entry.name
+    state_store.mark()
+
+class LedEffect:
+    """fade, breathe or blink toward `color`; levels are 0.0-1.0 per sysfs LED."""
+
+    KINDS = ("fade", "breathe", "blink")
+
+    def __init__(self, kind: str, color: str, start_levels: dict,
+                 duration: float, period: float):
+        self.kind = kind
+        self.color = color
+        self.start_levels = dict(start_levels)
+        self.target = ledcore.COLORS[color].levels
+        self.duration = duration
+        self.period = max(0.05, period)
+        self.started = time.monotonic()
+
+    def levels(self, now: float) -> tuple[dict, bool]:
+        elapsed = now - self.started
+        done = self.duration > 0 and elapsed >= self.duration
+        if self.kind == "fade":
+            t = 1.0 if done or self.duration <= 0 else elapsed / self.duration
+            return {n: self.start_levels.get(n, 0.0) + (self.target[n] - self.start_levels.get(n, 0.0)) * t
+                    for n in ledcore.SYSTEM_LEDS}, done
+        phase = (elapsed % self.period) / self.period
+        if self.kind == "breathe":
+            k = 0.5 - 0.5 * math.cos(2.0 * math.pi * phase)
+        else:
+            k = 1.0 if phase < 0.5 else 0.0
+        if done:
+            k = 1.0
+        return {n: self.target[n] * k for n in ledcore.SYSTEM_LEDS}, done
+
+    def describe(self) -> dict:
+        return {
+            "effect": self.kind,
+            "color": self.color,
+            "duration": self.duration,
+            "period": self.period,
+            "elapsed": round(time.monotonic() - self.started, 3),
         }
 
-        if color not in color_map:
-            log(f"Unknown LED color: {color}")
-            return
-
-        target_leds = set(color_map[color])
-        for led in list(led_states.keys()):
-            if led_states[led] and led not in target_leds:
-                bridge_call_async(f"toggle_{led}")
-                led_states[led] = False
-
-        for led in color_map[color]:
-            if not led_states[led]:
-                bridge_call_async(f"toggle_{led}")
-                led_states[led] = True
-    except Exception as e:
-        log(f"Set LED color {color} failed: {e}")
+class EffectEngine:
+    """Single scheduler thread driving every active LED effect.
+
+    Each target (a set of sysfs LEDs) holds at most one effect. All effects
+    are advanced on one fixed tick, and through ledcore.SysfsLed only changed
+    brightness values reach the kernel, so the cost is bounded by the tick
+    rate and the LED count, not by how many effects run. The thread parks
+    when nothing is active. MCU LEDs are digital, so their part of an
+    effect is delegated to the sketch (blink) or set once (fade).
+    """
+
+    def __init__(self, tick: float):
+        self.tick = max(0.005, tick)
+        self._effects = {}
+        self._mcu_blinking = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @property
+    def targets(self) -> dict:
+        return sysfs_leds.sets
+
+    def start(self, kind: str, color: str, targets, duration: float, period: float, mcu: bool = True):
+        """Run `kind` toward `color` on the sysfs `targets` and, with `mcu`, the MCU LEDs."""
+        with self._cond:
+            for target in targets:
+                self._effects[target] = LedEffect(kind, color, sysfs_leds.levels(target), duration, period)
+            if self._effects and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name="led-effects", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        if mcu:
+            self._start_mcu(kind, color)
+
+    def stop(self, targets=None, mcu: bool = True):
+        """Stop the effects on `targets` (default: all) and, with `mcu`, the MCU blinking."""
+        with self._cond:
+            for target in list(self._effects if targets is None else targets):
+                self._effects.pop(target, None)
+        if mcu:
+            self._stop_mcu()
+
+    def active(self) -> dict:
+        with self._cond:
+            return {target: e.describe() for target, e in self._effects.items()}
+
+    def _start_mcu(self, kind: str, color: str):
+        self._stop_mcu()
+        entry = ledcore.COLORS[color]
+        mcu_leds.set_mask(entry.mask)
+        if kind in ("breathe", "blink"):
+            for led in entry.mcu:
+                bridge_call_async(f"start_blink_{led}")
+            self._mcu_blinking = list(entry.mcu)
+
+    def _stop_mcu(self):
+        blinking, self._mcu_blinking = self._mcu_blinking, []
+        for led in blinking:
+            bridge_call_async(f"stop_blink_{led}")
+        if blinking:
+            mcu_leds.repush()
+
+    def _run(self):
+        next_ts = time.monotonic()
+        while True:
+            with self._cond:
+                while not self._effects:
+                    self._cond.wait()
+                    next_ts = time.monotonic()
+                effects = list(self._effects.items())
+
+            now = time.monotonic()
+            for target, effect in effects:
+                levels, done = effect.levels(now)
+                sysfs_leds.set_levels(target, levels)
+                if done:
+                    with self._cond:
+                        if self._effects.get(target) is effect:
+                            del self._effects[target]
+
+            next_ts += self.tick
+            delay = next_ts - time.monotonic()
+            if delay < 0:
+                # fell behind: skip the missed ticks instead of bursting
+                next_ts = time.monotonic()
+                delay = 0.0
+            with self._cond:
+                self._cond.wait(delay)
 
 # Flask app
 app = Flask(__name__)
 
 # Status management for Server-Sent Events
-status_connections = WeakSet()
 current_status = "Ready"
 current_color = ""
 
 # Voice recognition configuration
 VOICE_MODEL_PATH = os.getenv("VOICE_MODEL_PATH", "/app/deployment.eim")
+# POST /api/model only takes a file name in this directory
+VOICE_MODEL_DIR = os.getenv("VOICE_MODEL_DIR", os.path.dirname(VOICE_MODEL_PATH) or ".")
 PA_ALSA_DEVICE = os.getenv("PA_ALSA_DEVICE")
 VOICE_ENABLED = os.getenv("VOICE_ENABLED", "1") != "0"
 
@@ -162,32 +378,552 @@ def _env_float(name: str, default: float) -> float:
         log(f"ENV {name}='{v}' invalid; using default {default}")
         return default
 
-def _env_int(name: str) -> int | None:
-    v = os.getenv(name)
-    if v is None or v == "":
-        return None
+# Tunables: env vars give the defaults, CONFIG_FILE and /api/config override
+# them at runtime. name -> (type, default, min, max)
+CONFIG_SCHEMA = {
+    "THRESH": (float, 0.80, 0.0, 1.0),
+    "DEBOUNCE_SECONDS": (float, 2.0, 0.0, 60.0),
+    "SELECT_SUPPRESS_SECONDS": (float, 10.0, 0.0, 300.0),
+    "SELECT_COOLDOWN_SECONDS": (float, 5.0, 0.0, 300.0),
+    "WATCHDOG_POLL_SECONDS": (float, 2.0, 0.2, 60.0),
+    "AUDIO_WATCHDOG_SECONDS": (float, 15.0, 1.0, 3600.0),
+    "AUDIO_RESTART_MIN_SECONDS": (float, 20.0, 0.0, 3600.0),
+    "DEBUG": (bool, False, None, None),
+}
+CONFIG_FILE = os.getenv("CONFIG_FILE", "/var/lib/app-state/config.json")
+
+def _parse_bool(name: str, value) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in {"1", "true", "yes", "on"}:
+        return True
+    if text in {"0", "false", "no", "off", ""}:
+        return False
+    raise ValueError(f"{name}: expected a boolean")
+
+def _config_value(name: str, value):
+    kind, _, lo, hi = CONFIG_SCHEMA[name]
+    if kind is bool:
+        return _parse_bool(name, value)
+    if isinstance(value, bool):
+        raise ValueError(f"{name}: expected a number")
     try:
-        return int(v)
-    except ValueError:
-        log(f"ENV {name}='{v}' invalid; ignoring")
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name}: expected a number") from None
+    if not lo <= value <= hi:
+        raise ValueError(f"{name}: must be between {lo} and {hi}")
+    return value
+
+def validate_config(values: dict, base: dict) -> dict:
+    """`base` with `values` applied; ValueError names the offending setting."""
+    if not isinstance(values, dict):
+        raise ValueError("expected a JSON object")
+    unknown = sorted(set(values) - set(CONFIG_SCHEMA))
+    if unknown:
+        raise ValueError(f"unknown setting(s): {', '.join(unknown)}")
+    merged = dict(base)
+    for name, value in values.items():
+        merged[name] = _config_value(name, value)
+    if merged["AUDIO_WATCHDOG_SECONDS"] <= merged["WATCHDOG_POLL_SECONDS"]:
+        raise ValueError("AUDIO_WATCHDOG_SECONDS must be longer than WATCHDOG_POLL_SECONDS")
+    return merged
+
+def _env_config() -> dict:
+    cfg = {name: spec[1] for name, spec in CONFIG_SCHEMA.items()}
+    for name in CONFIG_SCHEMA:
+        v = os.getenv(name)
+        if v is None:
+            continue
+        try:
+            cfg[name] = _config_value(name, v)
+        except ValueError as e:
+            log(f"ENV {e}; using default {cfg[name]}")
+    return cfg
+
+# `config` is replaced as a whole, never mutated: readers take one reference
+# per decision window / watchdog pass and see a consistent set of values
+config_defaults = _env_config()
+config = config_defaults
+config_overrides = {}
+config_lock = threading.Lock()
+DEBUG = config["DEBUG"]
+
+bridge_breaker = ledcore.BridgeBreaker(
+    # looked up per call, so a swapped Bridge (tests, benchmarks) is used
+    lambda function_name, *args: Bridge.call(function_name, *args),
+    threshold=int(_env_float("BRIDGE_FAILURE_THRESHOLD", 3)),
+    backoff_min=_env_float("BRIDGE_BACKOFF_MIN_SECONDS", 1.0),
+    backoff_max=_env_float("BRIDGE_BACKOFF_MAX_SECONDS", 30.0),
+    log=log,
+    log_debug=log_debug,
+)
+led_effects = EffectEngine(_env_float("EFFECT_TICK_MS", 20.0) / 1000.0)
+journal = appstate.EventJournal(
+    HISTORY_TYPES,
+    int(_env_float("HISTORY_SIZE", 1024)),
+    HISTORY_FILE,
+    int(_env_float("HISTORY_FILE_MAX_BYTES", 1 << 20)),
+    log=log,
+)
+bridge_dispatcher = BridgeDispatcher(
+    interactive_budget_ms=_env_float("BRIDGE_INTERACTIVE_BUDGET_MS", 50.0),
+    frame_budget_ms=_env_float("BRIDGE_FRAME_BUDGET_MS", 150.0),
+)
+
+# Admission control: token buckets per client and route class, capped /status streams
+admission = ratelimit.Admission.from_env(_env_float)
+
+# /status streams, /api/state long-polls and the drain on SIGTERM
+streams = appstate.StreamSettings.from_env(_env_float)
+status_hub = ledcore.StatusHub(streams.max_waiters)
+
+# Voice pipeline: capture -> AudioRing -> inference -> ActionQueue -> decisions
+VOICE_RING_CAPTURE = os.getenv("VOICE_RING_CAPTURE", "1") != "0"
+VOICE_RING_SECONDS = _env_float("VOICE_RING_SECONDS", 2.0)
+VOICE_WINDOW_HOP = _env_float("VOICE_WINDOW_HOP", 0.25)
+VOICE_ACTION_QUEUE = int(_env_float("VOICE_ACTION_QUEUE", 32))
+
+# Hot model swap: the microphone and the ring keep running while the runner changes
+VOICE_SWAP_WARMUP = int(_env_float("VOICE_SWAP_WARMUP", 8))
+VOICE_SWAP_PROBATION = int(_env_float("VOICE_SWAP_PROBATION", 40))
+VOICE_SWAP_MAX_SLOWDOWN = _env_float("VOICE_SWAP_MAX_SLOWDOWN", 1.25)
+VOICE_MODEL_WATCH_SECONDS = _env_float("VOICE_MODEL_WATCH_SECONDS", 2.0)
+
+def _median(values) -> float:
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2] if ordered else 0.0
+
+class ModelSlot:
+    """A loaded runner and its recent per-window classify times."""
+
+    def __init__(self, path: str, runner, info: dict):
+        self.path = path
+        self.runner = runner
+        self.params = info["model_parameters"]
+        self.project = f"{info['project']['owner']} / {info['project']['name']}"
+        self.times = deque(maxlen=64)
+
+    def classify(self, features: list) -> dict:
+        t0 = time.monotonic()
+        res = self.runner.classify(features)
+        self.times.append((time.monotonic() - t0) * 1000.0)
+        return res
+
+    def close(self):
+        try:
+            self.runner.stop()
+        except Exception as e:
+            log(f"Model: stopping {self.path} failed: {e}")
+
+class ModelManager:
+    """Owns the voice runners and replaces the active one between windows.
+
+    `stage(path)` loads a candidate on its own thread, checks its labels and
+    input shape against the running model, then warms it up on copies of
+    live windows and compares classify times. A candidate that passes is
+    switched in at the next window boundary. The old runner stays loaded
+    for VOICE_SWAP_PROBATION windows and comes back at once if the new one
+    raises or turns out slower.
+    """
+
+    def __init__(self):
+        self.path = None  # VOICE_MODEL_PATH until a swap is kept
+        self.active = None
+        self.previous = None
+        self.baseline_ms = 0.0
+        self.probation = 0
+        self.state = "idle"
+        self.history = deque(maxlen=16)
+        self._ready = None
+        self._mailbox = Queue(maxsize=1)
+        self._lock = threading.Lock()
+
+    def load(self, path: str) -> ModelSlot:
+        from edge_impulse_linux.audio import AudioImpulseRunner
+        runner = AudioImpulseRunner(path)
+        try:
+            info = runner.init()
+        except Exception:
+            try:
+                runner.stop()
+            except Exception:
+                pass
+            raise
+        return ModelSlot(path, runner, info)
+
+    def open(self, path: str) -> ModelSlot:
+        """Load the model the voice loop starts with."""
+        slot = self.load(path)
+        with self._lock:
+            self.active = slot
+        return slot
+
+    def close(self):
+        """Stop every runner (voice loop exit or restart)."""
+        with self._lock:
+            slots = [self.active, self.previous, self._ready]
+            self.active = self.previous = self._ready = None
+            self.probation = 0
+        for slot in slots:
+            if slot is not None:
+                slot.close()
+
+    # -- inference thread ---------------------------------------------------
+
+    def classify(self, features: list) -> dict:
+        if self._ready is not None:
+            self._cut_over()
+        try:
+            res = self.active.classify(features)
+        except Exception as e:
+            if self.previous is None:
+                raise
+            self._rollback(f"classify failed: {e}")
+            res = self.active.classify(features)
+        else:
+            if self.previous is not None:
+                self._check_probation()
+        if self.state == "warming":
+            try:
+                self._mailbox.put_nowait(features)
+            except Full:
+                pass
+        return res
+
+    def _cut_over(self):
+        with self._lock:
+            slot, self._ready = self._ready, None
+            self.baseline_ms = _median(self.active.times)
+            self.previous, self.active = self.active, slot
+            self.probation = VOICE_SWAP_PROBATION
+            self.state = "probation"
+        slot.times.clear()
+        log(f"Model: switched to {slot.project} ({slot.path})")
+
+    def _check_probation(self):
+        active = self.active
+        self.probation -= 1
+        if len(active.times) >= max(4, VOICE_SWAP_WARMUP):
+            new_ms = _median(active.times)
+            if new_ms > self.baseline_ms * VOICE_SWAP_MAX_SLOWDOWN:
+                self._rollback(f"slower than the previous model ({new_ms:.1f} ms vs {self.baseline_ms:.1f} ms per window)")
+                return
+        if self.probation <= 0:
+            with self._lock:
+                previous, self.previous = self.previous, None
+                self.path = active.path
+            previous.close()
+            self._finish(active.path, "swapped")
+
+    def _rollback(self, reason: str):
+        with self._lock:
+            failed, self.active, self.previous = self.active, self.previous, None
+            self.probation = 0
+        failed.close()
+        log(f"Model: back to {self.active.project}")
+        self._finish(failed.path, "rolled_back", reason)
+
+    # -- staging ------------------------------------------------------------
+
+    def stage(self, path: str) -> str | None:
+        """Start swapping to `path` in the background; returns why not, or None."""
+        pipeline = voice_pipeline
+        if pipeline is None or pipeline.mode != "ring" or self.active is None:
+            return "hot swap needs the voice loop running with ring capture"
+        with self._lock:
+            if self.state != "idle":
+                return f"a swap is already in progress ({self.state})"
+            self.state = "loading"
+        threading.Thread(target=self._stage, args=(path,), name="voice-model-swap", daemon=True).start()
+        return None
+
+    def _stage(self, path: str):
+        t0 = time.monotonic()
+        log(f"Model: loading {path}")
+        try:
+            slot = self.load(path)
+        except Exception as e:
+            self._finish(path, "rejected", f"load failed: {e}")
+            return
+        reason = self._validate(slot) or self._warm_up(slot)
+        if reason:
+            slot.close()
+            self._finish(path, "rejected", reason)
+            return
+        log(f"Model: {slot.project} ready in {(time.monotonic() - t0) * 1000:.0f} ms "
+            f"({_median(slot.times):.1f} ms per window)")
+        with self._lock:
+            self.state = "ready"
+            self._ready = slot
+
+    def _validate(self, slot: ModelSlot) -> str | None:
+        missing = sorted(LABELS - set(slot.params.get("labels") or []))
+        if missing:
+            return f"labels missing: {', '.join(missing)}"
+        active = self.active
+        if active is None:
+            return "voice loop stopped"
+        for key in ("frequency", "input_features_count"):
+            if slot.params.get(key) != active.params.get(key):
+                return f"{key} {slot.params.get(key)} differs from the running model's {active.params.get(key)}; restart to switch"
+        return None
+
+    def _warm_up(self, slot: ModelSlot) -> str | None:
+        """Classify live windows with the candidate while the active model keeps serving."""
+        try:
+            self._mailbox.get_nowait()
+        except Empty:
+            pass
+        self.state = "warming"
+        for _ in range(max(1, VOICE_SWAP_WARMUP)):
+            try:
+                features = self._mailbox.get(timeout=5.0)
+            except Empty:
+                return "no live audio to warm up on"
+            try:
+                slot.classify(features)
+            except Exception as e:
+                return f"classify failed: {e}"
+        active = self.active
+        new_ms = _median(slot.times)
+        old_ms = _median(active.times) if active else 0.0
+        if old_ms and new_ms > old_ms * VOICE_SWAP_MAX_SLOWDOWN:
+            return f"slower than the running model ({new_ms:.1f} ms vs {old_ms:.1f} ms per window)"
         return None
 
-THRESH = _env_float("THRESH", 0.80)
-DEBUG = _env_float("DEBUG", 0)
-DEBOUNCE_SECONDS = _env_float("DEBOUNCE_SECONDS", 2.0)
-SELECT_SUPPRESS_SECONDS = _env_float("SELECT_SUPPRESS_SECONDS", 10.0)
-SELECT_COOLDOWN_SECONDS = _env_float("SELECT_COOLDOWN_SECONDS", 5.0)
+    def _finish(self, path: str, result: str, reason: str = ""):
+        with self._lock:
+            self.state = "idle"
+            self.history.append({"ts": time.time(), "path": path, "result": result, "reason": reason})
+        journal.record("model", result)
+        log(f"Model {result}: {path}" + (f" ({reason})" if reason else ""))
+
+    def snapshot(self) -> dict:
+        active = self.active
+        return {
+            "path": self.path or VOICE_MODEL_PATH,
+            "project": active.project if active else None,
+            "labels": active.params.get("labels") if active else None,
+            "classify_ms": round(_median(active.times), 2) if active and active.times else None,
+            "state": self.state,
+            "probation_windows": max(0, self.probation) if self.previous else 0,
+            "history": list(self.history),
+        }
+
+models = ModelManager()
+
+def model_watch_loop():
+    """Stage VOICE_MODEL_PATH again when the file is replaced (mv a new .eim over it)."""
+    def signature():
+        try:
+            st = os.stat(VOICE_MODEL_PATH)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    current = seen = signature()
+    while True:
+        time.sleep(VOICE_MODEL_WATCH_SECONDS)
+        sig = signature()
+        if sig is None or sig == current:
+            seen = sig
+            continue
+        if sig != seen:
+            # still being written; wait until it is unchanged for one poll
+            seen = sig
+            continue
+        if models.state != "idle":
+            continue
+        current = sig
+        reason = models.stage(VOICE_MODEL_PATH)
+        if reason:
+            log(f"Model: {VOICE_MODEL_PATH} changed; not swapped: {reason}")
+
+def start_model_watch():
+    if not VOICE_ENABLED or VOICE_PIPELINES or VOICE_MODEL_WATCH_SECONDS <= 0:
+        return
+    threading.Thread(target=model_watch_loop, name="model-watch", daemon=True).start()
+
+# Multi-model / multi-microphone: one voice_worker.py process per pipeline
+VOICE_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voice_worker.py")
+VOICE_FUSION_SECONDS = _env_float("VOICE_FUSION_SECONDS", 0.5)
+
+def _parse_voice_pipelines(text: str) -> list[dict]:
+    """VOICE_PIPELINES: JSON list of {"model", "device", "cpus", "labels", "name"}."""
+    if not text:
+        return []
+    try:
+        items = json.loads(text)
+        if not isinstance(items, list):
+            raise ValueError("expected a JSON list")
+        specs = []
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get("model"):
+                raise ValueError(f"entry {i}: 'model' is required")
+            # a PortAudio index, or part of the microphone's name (see audiodev)
+            device = item.get("device")
+            specs.append({
+                "name": str(item.get("name") or f"p{i}"),
+                "model": str(item["model"]),
+                "device": None if device in (None, "") else str(device),
+                "cpus": [int(c) for c in item.get("cpus") or []],
+                "labels": set(item["labels"]) if item.get("labels") else None,
+            })
+        return specs
+    except (TypeError, ValueError) as e:
+        log(f"ENV VOICE_PIPELINES invalid ({e}); using VOICE_MODEL_PATH")
+        return []
+
+VOICE_PIPELINES = _parse_voice_pipelines(os.getenv("VOICE_PIPELINES", ""))
+
+class VoiceWorker:
+    """One (model, microphone) pipeline in its own process, restarted if it exits.
+
+    The worker has its own AudioImpulseRunner and CPU affinity and does not
+    share the GIL with Flask. It writes one JSON line per window; a reader
+    thread here hands each one to `on_result`.
+    """
+
+    def __init__(self, spec: dict, on_result):
+        self.spec = spec
+        self.name = spec["name"]
+        self.on_result = on_result
+        self.proc = None
+        self.info = {}
+        self.restarts = 0
+        self.windows = 0
+        self.classify = audiodev.StageStats()
+        self.transport = audiodev.StageStats()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"voice-worker-{self.name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        proc = self.proc
+        if proc and proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=2.0)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self._thread.join(timeout=2.0)
+
+    def _command(self) -> list[str]:
+        cmd = [sys.executable, VOICE_WORKER, "--name", self.name, "--model", self.spec["model"]]
+        if self.spec["device"] is not None:
+            cmd += ["--device", str(self.spec["device"])]
+        if self.spec["cpus"]:
+            cmd += ["--cpus", ",".join(map(str, self.spec["cpus"]))]
+        return cmd
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.proc = subprocess.Popen(self._command(), stdout=subprocess.PIPE, text=True, bufsize=1)
+            except OSError as e:
+                log(f"Voice worker {self.name} failed to start: {e}")
+            else:
+                for line in self.proc.stdout:
+                    self._line(line)
+                rc = self.proc.wait()
+                if self._stop.is_set():
+                    return
+                log(f"Voice worker {self.name} exited ({rc}); restarting in {backoff:.0f}s")
+            self.restarts += 1
+            if time.monotonic() - started > 60.0:
+                backoff = 1.0
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def _line(self, line: str):
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            return
+        if msg.get("event") == "ready":
+            self.info = msg
+            log(f"Voice worker {self.name}: {msg.get('project')} pid={msg.get('pid')} cpus={msg.get('cpus')}")
+            return
+        self.windows += 1
+        timing = msg.get("timing") or {}
+        self.classify.record(float(timing.get("dsp", 0)) + float(timing.get("classification", 0)))
+        self.transport.record(max(0.0, time.time() - float(msg.get("ts", time.time()))) * 1000.0)
+        scores = msg.get("classification") or {}
+        if self.spec["labels"] is not None:
+            scores = {l: v for l, v in scores.items() if l in self.spec["labels"]}
+        self.on_result(self.name, scores, timing)
+
+    def snapshot(self) -> dict:
+        proc = self.proc
+        return {
+            "model": self.spec["model"],
+            "device": self.spec["device"],
+            "labels": sorted(self.spec["labels"]) if self.spec["labels"] is not None else None,
+            "pid": proc.pid if proc and proc.poll() is None else None,
+            "cpus": self.info.get("cpus"),
+            "audio": self.info.get("audio"),
+            "restarts": self.restarts,
+            "windows": self.windows,
+            "classify": self.classify.snapshot(),
+            "transport": self.transport.snapshot(),
+        }
+
+class VoiceEngine:
+    """Fuses the workers' results into one decision stream.
+
+    Each new window is merged with the latest window of every other worker
+    seen within VOICE_FUSION_SECONDS, taking the highest score per label, and
+    submitted to the pipeline's action stage like a single-model result.
+    """
+
+    def __init__(self, specs: list[dict], pipeline: audiodev.VoicePipeline):
+        self.pipeline = pipeline
+        self.workers = [VoiceWorker(spec, self._on_result) for spec in specs]
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def _on_result(self, name: str, scores: dict, timing: dict):
+        global last_audio_ts
+        now = time.time()
+        last_audio_ts = now
+        with self._lock:
+            self._latest[name] = (now, scores)
+            fused = {}
+            for ts, latest in self._latest.values():
+                if now - ts > VOICE_FUSION_SECONDS:
+                    continue
+                for label, score in latest.items():
+                    if score > fused.get(label, -1.0):
+                        fused[label] = score
+        self.pipeline.submit({"result": {"classification": fused}, "timing": timing})
+
+    def snapshot(self) -> dict:
+        return {worker.name: worker.snapshot() for worker in self.workers}
+
+voice_pipeline = None
+voice_engine = None
+audio_devices = audiodev.AudioDevices(log=log)
 
 voice_shutdown_event = threading.Event()
 voice_thread = None
 voice_started = False
 last_audio_ts = 0.0
 
-# Watchdog configuration
-WATCHDOG_POLL_SECONDS = _env_float("WATCHDOG_POLL_SECONDS", 2.0)
-AUDIO_WATCHDOG_SECONDS = _env_float("AUDIO_WATCHDOG_SECONDS", 15.0)
-AUDIO_RESTART_MIN_SECONDS = _env_float("AUDIO_RESTART_MIN_SECONDS", 20.0)
-
 watchdog_stop_event = threading.Event()
 watchdog_thread = None
 watchdog_lock = threading.Lock()
@@ -198,6 +934,17 @@ MATRIX_COLS = 13
 MATRIX_ROWS = 8
 MATRIX_SIZE = 104
 
+MATRIX_ROW_MASK = (1 << MATRIX_COLS) - 1
+
+def pack_frame(frame) -> int:
+    """Rows of 0/1 -> int with bit y * MATRIX_COLS + x set for each lit LED."""
+    bits = 0
+    for y, row in enumerate(frame):
+        for x, cell in enumerate(row):
+            if cell:
+                bits |= 1 << (y * MATRIX_COLS + x)
+    return bits
+
 # Matrix microphone frame + select animation frames
 FRAME_MICROPHONE = [
     [0,0,0,0,0,1,1,0,0,0,0,0,0],
@@ -317,32 +1064,262 @@ ANIMATION_COLOR_FRAMES = [
      [0,0,0,1,0,0,0,1,0,0,0,0,0]]
 ]
 
+# Matrix text: 5x7 font, one byte per column, bit 0 = top row
+FONT_5X7 = {
+    ' ': (0x00, 0x00, 0x00, 0x00, 0x00), '!': (0x00, 0x00, 0x5F, 0x00, 0x00),
+    '"': (0x00, 0x07, 0x00, 0x07, 0x00), '#': (0x14, 0x7F, 0x14, 0x7F, 0x14),
+    '%': (0x23, 0x13, 0x08, 0x64, 0x62), "'": (0x00, 0x05, 0x03, 0x00, 0x00),
+    '(': (0x00, 0x1C, 0x22, 0x41, 0x00), ')': (0x00, 0x41, 0x22, 0x1C, 0x00),
+    '+': (0x08, 0x08, 0x3E, 0x08, 0x08), ',': (0x00, 0x50, 0x30, 0x00, 0x00),
+    '-': (0x08, 0x08, 0x08, 0x08, 0x08), '.': (0x00, 0x60, 0x60, 0x00, 0x00),
+    '/': (0x20, 0x10, 0x08, 0x04, 0x02), '0': (0x3E, 0x51, 0x49, 0x45, 0x3E),
+    '1': (0x00, 0x42, 0x7F, 0x40, 0x00), '2': (0x42, 0x61, 0x51, 0x49, 0x46),
+    '3': (0x21, 0x41, 0x45, 0x4B, 0x31), '4': (0x18, 0x14, 0x12, 0x7F, 0x10),
+    '5': (0x27, 0x45, 0x45, 0x45, 0x39), '6': (0x3C, 0x4A, 0x49, 0x49, 0x30),
+    '7': (0x01, 0x71, 0x09, 0x05, 0x03), '8': (0x36, 0x49, 0x49, 0x49, 0x36),
+    '9': (0x06, 0x49, 0x49, 0x29, 0x1E), ':': (0x00, 0x36, 0x36, 0x00, 0x00),
+    '=': (0x14, 0x14, 0x14, 0x14, 0x14), '?': (0x02, 0x01, 0x51, 0x09, 0x06),
+    '@': (0x32, 0x49, 0x79, 0x41, 0x3E), 'A': (0x7E, 0x11, 0x11, 0x11, 0x7E),
+    'B': (0x7F, 0x49, 0x49, 0x49, 0x36), 'C': (0x3E, 0x41, 0x41, 0x41, 0x22),
+    'D': (0x7F, 0x41, 0x41, 0x22, 0x1C), 'E': (0x7F, 0x49, 0x49, 0x49, 0x41),
+    'F': (0x7F, 0x09, 0x09, 0x01, 0x01), 'G': (0x3E, 0x41, 0x41, 0x51, 0x32),
+    'H': (0x7F, 0x08, 0x08, 0x08, 0x7F), 'I': (0x00, 0x41, 0x7F, 0x41, 0x00),
+    'J': (0x20, 0x40, 0x41, 0x3F, 0x01), 'K': (0x7F, 0x08, 0x14, 0x22, 0x41),
+    'L': (0x7F, 0x40, 0x40, 0x40, 0x40), 'M': (0x7F, 0x02, 0x04, 0x02, 0x7F),
+    'N': (0x7F, 0x04, 0x08, 0x10, 0x7F), 'O': (0x3E, 0x41, 0x41, 0x41, 0x3E),
+    'P': (0x7F, 0x09, 0x09, 0x09, 0x06), 'Q': (0x3E, 0x41, 0x51, 0x21, 0x5E),
+    'R': (0x7F, 0x09, 0x19, 0x29, 0x46), 'S': (0x46, 0x49, 0x49, 0x49, 0x31),
+    'T': (0x01, 0x01, 0x7F, 0x01, 0x01), 'U': (0x3F, 0x40, 0x40, 0x40, 0x3F),
+    'V': (0x1F, 0x20, 0x40, 0x20, 0x1F), 'W': (0x7F, 0x20, 0x18, 0x20, 0x7F),
+    'X': (0x63, 0x14, 0x08, 0x14, 0x63), 'Y': (0x03, 0x04, 0x78, 0x04, 0x03),
+    'Z': (0x61, 0x51, 0x49, 0x45, 0x43), '_': (0x40, 0x40, 0x40, 0x40, 0x40),
+}
+
+MATRIX_SCROLL_TEXT = os.getenv("MATRIX_SCROLL_TEXT", "0") == "1"
+MATRIX_SCROLL_DELAY = _env_float("MATRIX_SCROLL_DELAY", 0.1)
+MATRIX_TEXT_MAX = 64
+
+def _rasterize(columns: tuple) -> bytes:
+    """Glyph as packed columns with blank edges trimmed (a space keeps two)."""
+    cols = list(columns)
+    while cols and not cols[0]:
+        cols.pop(0)
+    while cols and not cols[-1]:
+        cols.pop()
+    return bytes(cols or (0, 0))
+
+GLYPHS = {ch: _rasterize(cols) for ch, cols in FONT_5X7.items()}
+
+def text_strip(text: str) -> bytes:
+    """Packed column strip for `text`: glyphs one blank column apart."""
+    return b"\0".join(GLYPHS.get(ch, GLYPHS["?"]) for ch in text)
+
+@lru_cache(maxsize=int(_env_float("MATRIX_TEXT_CACHE", 32)))
+def _text_frames(text: str) -> tuple:
+    strip = text_strip(text)
+    if len(strip) <= MATRIX_COLS:
+        left = (MATRIX_COLS - len(strip)) // 2
+        strip = bytes(left) + strip + bytes(MATRIX_COLS - len(strip) - left)
+    else:
+        # enter from the right, leave to the left
+        strip = bytes(MATRIX_COLS) + strip + bytes(MATRIX_COLS)
+    # one bit plane per row (bit i = strip column i): a frame is a 13-bit
+    # slice of each plane, packed like pack_frame()
+    planes = [sum(((col >> y) & 1) << i for i, col in enumerate(strip)) for y in range(MATRIX_ROWS)]
+    return tuple(
+        sum(((plane >> x) & MATRIX_ROW_MASK) << (y * MATRIX_COLS) for y, plane in enumerate(planes))
+        for x in range(len(strip) - MATRIX_COLS + 1)
+    )
+
+def text_frames(text: str) -> tuple:
+    """Packed matrix frames that show or scroll `text`, cached by text."""
+    text = " ".join(str(text).upper().split())
+    return _text_frames("".join(ch if ch in GLYPHS else "?" for ch in text))
+
 # Initialize matrix state (all LEDs off)
 matrix_state = [[0 for _ in range(MATRIX_COLS)] for _ in range(MATRIX_ROWS)]
-current_matrix_animation = None
-matrix_animation_thread = None
-stop_matrix_animation_flag = threading.Event()
+
+class MatrixLayer:
+    """Packed frames shown from `start`, one every `period` seconds.
+
+    period 0: a still image that stays until replaced. repeat: passes
+    through `frames` before the layer ends (0 = until replaced). Opaque
+    layers hide everything below; the others are ORed on top.
+    """
+
+    def __init__(self, name: str, frames: tuple, period: float = 0.0, repeat: int = 0, opaque: bool = True):
+        self.name = name
+        self.frames = tuple(frames)
+        self.period = period
+        self.repeat = repeat
+        self.opaque = opaque
+        self.start = time.monotonic()
+        self.shown = None
+        self.skipped = 0
+
+    def frame_at(self, now: float) -> int | None:
+        """Frame due at `now`, or None once the layer has ended."""
+        if not self.period:
+            return self.frames[0]
+        index = int((now - self.start) / self.period)
+        if self.repeat and index >= len(self.frames) * self.repeat:
+            return None
+        if self.shown is not None and index > self.shown + 1:
+            self.skipped += index - self.shown - 1
+        self.shown = index
+        return self.frames[index % len(self.frames)]
+
+    def deadline(self) -> float | None:
+        if not self.period or self.shown is None:
+            return None
+        return self.start + (self.shown + 1) * self.period
+
+class MatrixCompositor:
+    """One long-lived thread that composites layers on monotonic deadlines.
+
+    Layers sit in fixed slots, bottom to top (LAYERS). `update()` replaces
+    the slot dict as a whole, so switching animations is a reference swap
+    and never starts or joins a thread. The thread sleeps until the next
+    frame deadline of any layer (or an update). A late wake-up shows the
+    frame due now and counts the ones it skipped. `send` is only called
+    when the composited frame differs from the last one sent.
+    """
+
+    LAYERS = ("background", "icon", "text")
+
+    def __init__(self, send):
+        self.send = send
+        self.last = None
+        self.sent = 0
+        self.late = audiodev.StageStats()
+        self._layers = {}
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="matrix-scheduler", daemon=True)
+                self._thread.start()
+
+    def update(self, **slots):
+        """Set (MatrixLayer) or clear (None) layer slots in one swap."""
+        with self._lock:
+            layers = dict(self._layers)
+            for slot, layer in slots.items():
+                if slot not in self.LAYERS:
+                    raise ValueError(f"unknown matrix layer: {slot}")
+                if layer is None:
+                    layers.pop(slot, None)
+                else:
+                    layers[slot] = layer
+            self._layers = layers
+        self.start()
+        self._wake.set()
+
+    def animation(self) -> str | None:
+        """Name of the topmost moving layer, if any."""
+        layers = self._layers
+        for slot in reversed(self.LAYERS):
+            layer = layers.get(slot)
+            if layer is not None and layer.period:
+                return layer.name
+        return None
+
+    def layer(self, slot: str) -> MatrixLayer | None:
+        return self._layers.get(slot)
+
+    def still_below(self, slot: str) -> int:
+        """Frame of the still layers under `slot`: what is left once it ends."""
+        layers = self._layers
+        bits = 0
+        for below in self.LAYERS[:self.LAYERS.index(slot)]:
+            layer = layers.get(below)
+            if layer is not None and not layer.period:
+                bits = layer.frames[0] if layer.opaque else bits | layer.frames[0]
+        return bits
+
+    def _composite(self, now: float) -> tuple[int, float | None]:
+        layers = self._layers
+        bits = 0
+        deadline = None
+        ended = []
+        for slot in self.LAYERS:
+            layer = layers.get(slot)
+            if layer is None:
+                continue
+            frame = layer.frame_at(now)
+            if frame is None:
+                ended.append((slot, layer))
+                continue
+            bits = frame if layer.opaque else bits | frame
+            due = layer.deadline()
+            if due is not None and (deadline is None or due < deadline):
+                deadline = due
+        if ended:
+            with self._lock:
+                layers = dict(self._layers)
+                for slot, layer in ended:
+                    if layers.get(slot) is layer:
+                        del layers[slot]
+                self._layers = layers
+        return bits, deadline
+
+    def _run(self):
+        deadline = None
+        while True:
+            self._wake.clear()
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                self.late.record((now - deadline) * 1000.0)
+            bits, deadline = self._composite(now)
+            if bits != self.last:
+                self.last = bits
+                try:
+                    self.send(bits)
+                    self.sent += 1
+                except Exception as e:
+                    if DEBUG:
+                        log_debug(f"[MATRIX] Frame error: {e}")
+            self._wake.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def snapshot(self) -> dict:
+        layers = self._layers
+        return {
+            "layers": {
+                slot: {"name": layer.name, "frames": len(layer.frames), "period": layer.period,
+                       "repeat": layer.repeat, "skipped": layer.skipped}
+                for slot, layer in layers.items()
+            },
+            "animation": self.animation(),
+            "sent": self.sent,
+            "late": self.late.snapshot(),
+        }
 
 class WebStatus:
     _lock = threading.Lock()
 
     @classmethod
-    def _broadcast(cls):
-        payload = {
+    def payload(cls) -> dict:
+        return {
             "status": current_status,
             "matrix": [cell for row in matrix_state for cell in row],
-            "color": current_color
+            "color": current_color,
+            "bridge": "ok" if bridge_breaker.healthy else "down",
         }
-        for q in status_connections:
-            try:
-                q.put(payload)
-            except Exception:
-                pass
+
+    @classmethod
+    def _broadcast(cls):
+        status_hub.publish(cls.payload())
+        state_store.mark()
 
     @classmethod
     def update_status(cls, status: str):
         global current_status
         with cls._lock:
+            if status != current_status:
+                journal.record("status", status)
             current_status = status
             cls._broadcast()
 
@@ -350,31 +1327,17 @@ class WebStatus:
     def update_color(cls, color: str):
         global current_color
         with cls._lock:
+            if color != current_color:
+                journal.record("color", color or "off")
             current_color = color
             cls._broadcast()
 
-@contextmanager
-def _suppress_stderr():
-    """Temporarily silences stderr (e.g., ALSA warnings during initialization)."""
-    try:
-        fd = sys.stderr.fileno()
-        old = os.dup(fd)
-        with open(os.devnull, 'w') as devnull:
-            os.dup2(devnull.fileno(), fd)
-        yield
-    finally:
-        try:
-            os.dup2(old, fd)
-            os.close(old)
-        except Exception:
-            pass
-
 def _restart_voice_recognition(reason: str = ""):
     global voice_thread, voice_started, last_audio_ts, last_audio_restart_ts
     if not VOICE_ENABLED:
         return
     now = time.time()
-    if (now - last_audio_restart_ts) < AUDIO_RESTART_MIN_SECONDS:
+    if (now - last_audio_restart_ts) < config["AUDIO_RESTART_MIN_SECONDS"]:
         return
     last_audio_restart_ts = now
     if DEBUG:
@@ -393,115 +1356,170 @@ def _restart_voice_recognition(reason: str = ""):
     voice_started = True
     last_audio_ts = time.time()
 
+class VoiceDecisions:
+    """The 'select' -> color state machine; runs on the pipeline's action thread."""
+
+    def __init__(self):
+        self.last_send_ts = 0.0
+        self.next_ready_ts = 0.0
+        self.ready_announced = True
+        self.select_window_until = 0.0
+        self.select_block_until = 0.0
+        self.select_pending = False
+
+    def handle(self, res: dict, now: float):
+        cfg = config
+        if not self.ready_announced and now >= self.next_ready_ts:
+            log(f"Listening (debounce {cfg['DEBOUNCE_SECONDS']}s)")
+            self.ready_announced = True
+
+        total_ms = res['timing']['dsp'] + res['timing']['classification']
+        scores = res['result']['classification']
+
+        if DEBUG:
+            log_debug(f"Scores ({total_ms} ms): {scores}")
+
+        candidates = [l for l in LABELS if l in scores]
+        best_label = max(candidates, key=lambda l: scores.get(l, -1.0)) if candidates else None
+        best_score = scores.get(best_label, 0.0) if best_label else 0.0
+
+        if (now - self.last_send_ts) >= cfg["DEBOUNCE_SECONDS"] and best_label and best_score >= cfg["THRESH"]:
+            if best_label == "select":
+                if now < self.select_block_until:
+                    self.last_send_ts = now
+                    self.next_ready_ts = now + cfg["DEBOUNCE_SECONDS"]
+                    self.ready_announced = False
+                    return
+
+                journal.record("voice", best_label, best_score)
+                WebStatus.update_status("Select the Color")
+                start_color_animation()
+                self.select_pending = True
+                self.select_window_until = now + cfg["SELECT_SUPPRESS_SECONDS"]
+                self.select_block_until = now + cfg["SELECT_COOLDOWN_SECONDS"]
+                return
+
+            if best_label in COLOR:
+                if self.select_pending and now <= self.select_window_until:
+                    log(f"Result: {best_label} ({best_score:.2f})")
+                    journal.record("voice", best_label, best_score)
+                    WebStatus.update_status("Say 'Select' to start")
+                    WebStatus.update_color(best_label)
+                    show_microphone_icon(f"{best_label} {best_score:.0%}" if MATRIX_SCROLL_TEXT else "")
+                    try:
+                        set_led_color(best_label)
+                    except Exception:
+                        if DEBUG:
+                            log_debug(f"[LED] set_led_color failed for {best_label}")
+
+                    self.select_pending = False
+                    self.last_send_ts = now
+                    self.next_ready_ts = now + cfg["DEBOUNCE_SECONDS"]
+                    self.ready_announced = False
+                    return
+
+        if self.select_pending and now > self.select_window_until:
+            WebStatus.update_status("Say 'Select' to start")
+            WebStatus.update_color("")
+            show_microphone_icon()
+            try:
+                set_led_color("off")
+            except Exception:
+                if DEBUG:
+                    log_debug("[LED] set_led_color failed on window expiry")
+            self.select_pending = False
+
+def _voice_pipeline() -> audiodev.VoicePipeline:
+    return audiodev.VoicePipeline(VoiceDecisions().handle, VOICE_ACTION_QUEUE, audio_devices, voice_shutdown_event,
+                                  VOICE_RING_CAPTURE, VOICE_RING_SECONDS, VOICE_WINDOW_HOP, log=log)
+
 def _voice_recognition_loop():
-    global last_audio_ts
+    global last_audio_ts, voice_pipeline
     if not VOICE_ENABLED:
         log("Voice recognition disabled (VOICE_ENABLED=0)")
         clear_matrix_display()
         return
 
+    if VOICE_PIPELINES:
+        _run_voice_engine()
+        return
+
     if not os.path.exists(VOICE_MODEL_PATH):
         log(f"Voice model not found: {VOICE_MODEL_PATH}")
         WebStatus.update_status("Voice model not found")
         return
 
-    log(f"Voice model: {VOICE_MODEL_PATH}")
-    log(f"THRESH={THRESH:.2f} DEBOUNCE={DEBOUNCE_SECONDS:.2f}")
+    # Deferred to the voice thread so the web server is up before the SDK loads
+    t0 = time.monotonic()
+    try:
+        importlib.import_module("edge_impulse_linux.audio")
+    except ImportError as e:
+        log(f"Edge Impulse SDK not available: {e}")
+        WebStatus.update_status("Voice SDK not available")
+        return
+    log(f"Edge Impulse SDK loaded in {(time.monotonic() - t0) * 1000:.0f} ms")
+
+    log(f"Voice model: {models.path or VOICE_MODEL_PATH}")
+    log(f"THRESH={config['THRESH']:.2f} DEBOUNCE={config['DEBOUNCE_SECONDS']:.2f}")
 
+    pipeline = _voice_pipeline()
+    pipeline.start()
+    voice_pipeline = pipeline
     last_audio_ts = time.time()
-    while not voice_shutdown_event.is_set():
-        # Device ID selection (from environment)
-        selected_device_id = _env_int("PA_ALSA_DEVICE")
-        if selected_device_id is not None:
-            log(f"Audio device (ALSA): {selected_device_id}")
-
-        try:
-            with AudioImpulseRunner(VOICE_MODEL_PATH) as runner:
-                model_info = runner.init()
-                log('Runner: ' + model_info['project']['owner'] + ' / ' + model_info['project']['name'])
-
-                last_send_ts = 0.0
-                next_ready_ts = 0.0
-                ready_announced = True
-                select_window_until = 0.0
-                select_block_until = 0.0
-                select_pending = False
-
-                _iter = runner.classifier(device_id=selected_device_id)
-                with _suppress_stderr():
-                    try:
-                        first_item = next(_iter)
-                    except StopIteration:
+    try:
+        while not voice_shutdown_event.is_set():
+            try:
+                t0 = time.monotonic()
+                slot = models.open(models.path or VOICE_MODEL_PATH)
+                try:
+                    log('Runner: ' + slot.project)
+                    log(f"Runner ready in {(time.monotonic() - t0) * 1000:.0f} ms")
+                    # under handoff.py the old copy holds the microphone until it exits
+                    if not handoff.wait_takeover():
                         return
 
-                for res, audio in itertools.chain([first_item], _iter):
-                    if voice_shutdown_event.is_set():
-                        break
+                    # cached after the first start; probes again only on hotplug or failure
+                    selected_device_id = audio_devices.device_id(PA_ALSA_DEVICE, audiodev.model_rate(slot.params))
 
-                    last_audio_ts = time.time()
+                    # Inference stage: only hand results on; decisions run on the action thread
+                    for res in pipeline.results(slot.runner, slot.params, selected_device_id, classify=models.classify):
+                        if voice_shutdown_event.is_set():
+                            break
+                        last_audio_ts = time.time()
+                        pipeline.submit(res)
+                finally:
+                    models.close()
 
-                    now = time.time()
-                    if not ready_announced and now >= next_ready_ts:
-                        log(f"Listening (debounce {DEBOUNCE_SECONDS}s)")
-                        ready_announced = True
-
-                    total_ms = res['timing']['dsp'] + res['timing']['classification']
-                    scores = res['result']['classification']
-
-                    if DEBUG:
-                        log_debug(f"Scores ({total_ms} ms): {scores}")
-
-                    candidates = [l for l in LABELS if l in scores]
-                    best_label = max(candidates, key=lambda l: scores.get(l, -1.0)) if candidates else None
-                    best_score = scores.get(best_label, 0.0) if best_label else 0.0
-
-                    if (now - last_send_ts) >= DEBOUNCE_SECONDS and best_label and best_score >= THRESH:
-                        if best_label == "select":
-                            if now < select_block_until:
-                                last_send_ts = now
-                                next_ready_ts = now + DEBOUNCE_SECONDS
-                                ready_announced = False
-                                continue
-
-                            WebStatus.update_status("Select the Color")
-                            start_color_animation()
-                            select_pending = True
-                            select_window_until = now + SELECT_SUPPRESS_SECONDS
-                            select_block_until = now + SELECT_COOLDOWN_SECONDS
-                            continue
-
-                        if best_label in COLOR:
-                            if select_pending and now <= select_window_until:
-                                log(f"Result: {best_label} ({best_score:.2f})")
-                                WebStatus.update_status("Say 'Select' to start")
-                                WebStatus.update_color(best_label)
-                                show_microphone_icon()
-                                try:
-                                    set_led_color(best_label)
-                                except Exception:
-                                    if DEBUG:
-                                        log_debug(f"[LED] set_led_color failed for {best_label}")
-
-                                select_pending = False
-                                last_send_ts = now
-                                next_ready_ts = now + DEBOUNCE_SECONDS
-                                ready_announced = False
-                                continue
-
-                    if select_pending and now > select_window_until:
-                        WebStatus.update_status("Say 'Select' to start")
-                        WebStatus.update_color("")
-                        show_microphone_icon()
-                        try:
-                            set_led_color("off")
-                        except Exception:
-                            if DEBUG:
-                                log_debug("[LED] set_led_color failed on window expiry")
-                        select_pending = False
+            except Exception as e:
+                log(f"Voice runner error: {e}")
+                time.sleep(1.0)
+    finally:
+        pipeline.stop()
+
+def _run_voice_engine():
+    """VOICE_PIPELINES mode: worker processes feed the shared decision layer."""
+    global voice_pipeline, voice_engine, last_audio_ts
+    missing = [spec["model"] for spec in VOICE_PIPELINES if not os.path.exists(spec["model"])]
+    if missing:
+        log(f"Voice model not found: {', '.join(missing)}")
+        WebStatus.update_status("Voice model not found")
+        return
 
-        except Exception as e:
-            log(f"Voice runner error: {e}")
-            time.sleep(1.0)
+    log(f"Voice engine: {len(VOICE_PIPELINES)} pipelines")
+    pipeline = _voice_pipeline()
+    pipeline.mode = "workers"
+    engine = VoiceEngine(VOICE_PIPELINES, pipeline)
+    if not handoff.wait_takeover():
+        return
+    pipeline.start()
+    voice_pipeline, voice_engine = pipeline, engine
+    last_audio_ts = time.time()
+    engine.start()
+    try:
+        voice_shutdown_event.wait()
+    finally:
+        engine.stop()
+        pipeline.stop()
 
 def start_voice_recognition():
     global voice_thread, voice_started, last_audio_ts
@@ -515,81 +1533,150 @@ def start_voice_recognition():
     show_microphone_icon()
     return voice_thread
 
-def display_frame(frame):
-    for y in range(MATRIX_ROWS):
-        for x in range(MATRIX_COLS):
-            matrix_state[y][x] = frame[y][x]
-    matrix_flat = []
+@lru_cache(maxsize=256)
+def _unpack_frame(bits: int) -> tuple[tuple, str]:
+    """Cells and the set_matrix argument for a packed frame (animations repeat)."""
+    cells = tuple((bits >> i) & 1 for i in range(MATRIX_SIZE))
+    return cells, ','.join(map(str, cells))
+
+def display_packed(bits: int):
+    """Push a packed frame (the compositor's output path)."""
+    cells, text = _unpack_frame(bits)
     for y in range(MATRIX_ROWS):
-        for x in range(MATRIX_COLS):
-            matrix_flat.append(str(frame[y][x]))
-    bridge_call_async("set_matrix", ','.join(matrix_flat))
+        matrix_state[y][:] = cells[y * MATRIX_COLS:(y + 1) * MATRIX_COLS]
+    if bits:
+        bridge_send_frame("matrix", "set_matrix", text)
+    else:
+        bridge_send_frame("matrix", "clear_matrix")
     WebStatus._broadcast()
 
+matrix_compositor = MatrixCompositor(display_packed)
+MICROPHONE_LAYER = MatrixLayer("microphone", (pack_frame(FRAME_MICROPHONE),))
+COLOR_ANIMATION = tuple(pack_frame(frame) for frame in ANIMATION_COLOR_FRAMES)
+
+def display_frame(frame):
+    """Show a frame (rows of 0/1) directly, outside the compositor's layers."""
+    display_packed(pack_frame(frame))
+    # let the compositor's next frame go out even if it matches its last one
+    matrix_compositor.last = None
+
 def clear_matrix_display():
-    for y in range(MATRIX_ROWS):
-        for x in range(MATRIX_COLS):
-            matrix_state[y][x] = 0
-    try:
-        Bridge.call("clear_matrix")
-    except Exception:
-        pass
+    matrix_compositor.update(background=None, icon=None, text=None)
+
+def _repush_matrix():
+    bridge_send_frame("matrix", "set_matrix", ','.join(str(cell) for row in matrix_state for cell in row))
+
+def _repush_mcu_state():
+    """Send the desired LED and matrix state in one idempotent shot."""
+    mcu_leds.repush()
+    _repush_matrix()
+
+def _on_bridge_change():
+    journal.record("bridge", bridge_breaker.state)
     WebStatus._broadcast()
 
-def show_microphone_icon():
-    stop_matrix_animation()
-    try:
-        display_frame(FRAME_MICROPHONE)
-    except Exception as e:
-        if DEBUG:
-            log_debug(f"[MATRIX] Show microphone failed: {e}")
+bridge_breaker.on_change = _on_bridge_change
+bridge_breaker.on_recover = _repush_mcu_state
+
+# Periodic get_state check: re-push only what the MCU lost (0 = off)
+mcu_reconciler = ledcore.McuReconciler(
+    read=lambda: bridge_breaker.call("get_state"),
+    expected=lambda: {"leds": mcu_leds.mask, "matrix": pack_frame(matrix_state)},
+    repush={"leds": mcu_leds.repush, "matrix": _repush_matrix},
+    interval=_env_float("MCU_RECONCILE_SECONDS", 10.0),
+    log=log,
+)
+
+def _state_snapshot() -> dict:
+    status, matrix = current_status, [cell for row in matrix_state for cell in row]
+    background = matrix_compositor.layer("background")
+    if background is not None and background.name == "color":
+        # A pending 'select' window does not survive a restart: save the
+        # resting state instead of an animation frame
+        status, matrix = "Say 'Select' to start", [cell for row in FRAME_MICROPHONE for cell in row]
+    elif matrix_compositor.layer("text") is not None:
+        # a passing text scroll is not state: save the frame it leaves behind,
+        # so its frames do not rewrite the snapshot either
+        matrix = list(_unpack_frame(matrix_compositor.still_below("text"))[0])
+    return {
+        "status": status,
+        "color": current_color,
+        "leds": led_color,
+        "mcu_leds": mcu_leds.mask,
+        "matrix": matrix,
+    }
 
-def matrix_animation_loop(frames, delay=0.08):
-    while not stop_matrix_animation_flag.is_set():
-        for frame in frames:
-            if stop_matrix_animation_flag.is_set():
-                break
-            try:
-                display_frame(frame)
-            except Exception as e:
-                if DEBUG:
-                    log_debug(f"[MATRIX] Animation frame error: {e}")
-            time.sleep(delay)
+state_store = appstate.StateStore(STATE_FILE, _state_snapshot, _env_float("STATE_FLUSH_SECONDS", 1.0), log=log)
+
+def restore_state():
+    """Resume the last saved state and push it to the hardware once.
+
+    Instead of the startup blue + microphone redraw, the sysfs LEDs get the
+    saved color and the MCU one set_rgb_leds plus one set_matrix, so
+    the MCU backend's mask matches what the MCU shows from the first command on.
+    """
+    global current_status, current_color, led_color
+    state = state_store.load()
+    if not state or state.get("leds") not in ledcore.COLORS:
+        set_led_color('blue')
+        return
+    try:
+        mask = int(state.get("mcu_leds") or 0)
+        matrix = [int(cell) for cell in state.get("matrix") or []]
+    except (TypeError, ValueError) as e:
+        log(f"State file {state_store.path} has a bad mcu_leds or matrix, starting clean: {e}")
+        set_led_color('blue')
+        return
+    current_status = str(state.get("status") or current_status)
+    current_color = state.get("color") if state.get("color") in COLOR else ""
+    led_color = state["leds"]
+    mcu_leds.mask = mask
+    if len(matrix) == MATRIX_SIZE:
+        for i, cell in enumerate(matrix):
+            matrix_state[i // MATRIX_COLS][i % MATRIX_COLS] = cell
+        # the matrix already shows this; the compositor only sends changes
+        matrix_compositor.last = pack_frame(matrix_state)
+    log(f"Resumed state #{state_store.seq}: leds={led_color} color='{current_color}'")
+    sysfs_leds.apply(ledcore.COLORS[led_color])
+    _repush_mcu_state()
+
+def show_microphone_icon(text: str = ""):
+    """Microphone icon, with no animation; `text` scrolls once on top of it."""
+    matrix_compositor.update(background=None, icon=MICROPHONE_LAYER,
+                             text=_text_layer(text, MATRIX_SCROLL_DELAY, 1) if text else None)
 
 def start_color_animation():
-    global current_matrix_animation, matrix_animation_thread
-    stop_matrix_animation()
-    current_matrix_animation = "color"
-    stop_matrix_animation_flag.clear()
-    matrix_animation_thread = threading.Thread(
-        target=matrix_animation_loop,
-        args=(ANIMATION_COLOR_FRAMES, 0.08),
-        daemon=True
-    )
-    matrix_animation_thread.start()
+    matrix_compositor.update(background=MatrixLayer("color", COLOR_ANIMATION, 0.08), icon=None)
+
+def _text_layer(text: str, delay: float, repeat: int) -> MatrixLayer:
+    frames = text_frames(text)
+    # a single frame (short text) stays up as long as one screen takes to scroll
+    return MatrixLayer("text", frames, delay if len(frames) > 1 else delay * MATRIX_COLS, repeat)
+
+def start_text_scroll(text: str, delay: float = MATRIX_SCROLL_DELAY, repeat: int = 1) -> tuple:
+    """Scroll `text` over the matrix `repeat` times (0: until replaced)."""
+    layer = _text_layer(text, delay, repeat)
+    matrix_compositor.update(text=layer)
+    return layer.frames
 
 def stop_matrix_animation():
-    global current_matrix_animation, matrix_animation_thread
-    if matrix_animation_thread and matrix_animation_thread.is_alive():
-        stop_matrix_animation_flag.set()
-        matrix_animation_thread.join(timeout=1.0)
-    current_matrix_animation = None
-    stop_matrix_animation_flag.clear()
+    matrix_compositor.update(background=None, text=None)
 
 def watchdog_loop():
     while not watchdog_stop_event.is_set():
         now = time.time()
+        cfg = config
 
         try:
             if VOICE_ENABLED and voice_started and last_audio_ts > 0:
-                if (now - last_audio_ts) > AUDIO_WATCHDOG_SECONDS:
+                if (now - last_audio_ts) > cfg["AUDIO_WATCHDOG_SECONDS"]:
                     with watchdog_lock:
                         _restart_voice_recognition("stale audio")
         except Exception as e:
             if DEBUG:
                 log_debug(f"[WATCHDOG] error: {e}")
 
-        time.sleep(max(0.2, WATCHDOG_POLL_SECONDS))
+        time.sleep(max(0.2, cfg["WATCHDOG_POLL_SECONDS"]))
 
 def start_watchdog():
     global watchdog_thread
@@ -599,29 +1686,179 @@ def start_watchdog():
     watchdog_thread = threading.Thread(target=watchdog_loop, daemon=True)
     watchdog_thread.start()
 
-def _get_local_ips() -> list[str]:
-    ips = set()
+def _set_config(new: dict, source: str):
+    """Swap in a validated config; the voice loop and watchdog pick it up on their next pass."""
+    global config, DEBUG
+    changed = {k: v for k, v in new.items() if config[k] != v}
+    config = new
+    DEBUG = new["DEBUG"]
+    if changed:
+        log(f"Config ({source}): " + " ".join(f"{k}={v}" for k, v in changed.items()))
+
+def load_config_file():
+    """Apply CONFIG_FILE on top of the env defaults; a missing file means no overrides."""
+    global config_overrides
     try:
-        for info in socket.getaddrinfo(socket.gethostname(), None):
-            addr = info[4][0]
-            if addr and ":" not in addr:
-                ips.add(addr)
-    except Exception:
-        pass
+        with open(CONFIG_FILE) as f:
+            values = json.load(f)
+    except FileNotFoundError:
+        values = {}
+    except (OSError, ValueError) as e:
+        log(f"Config file {CONFIG_FILE} ignored: {e}")
+        return
+    with config_lock:
+        try:
+            new = validate_config(values, config_defaults)
+        except ValueError as e:
+            log(f"Config file {CONFIG_FILE} rejected: {e}")
+            return
+        config_overrides = {k: new[k] for k in values}
+        _set_config(new, "file")
+
+def update_config(values: dict) -> dict:
+    """Apply `values` from the API and persist the overrides to CONFIG_FILE."""
+    global config_overrides
+    if not isinstance(values, dict):
+        raise ValueError("expected a JSON object")
+    with config_lock:
+        overrides = dict(config_overrides, **values)
+        new = validate_config(overrides, config_defaults)
+        config_overrides = {k: new[k] for k in overrides}
+        _set_config(new, "api")
+        if CONFIG_FILE:
+            tmp = f"{CONFIG_FILE}.tmp"
+            try:
+                os.makedirs(os.path.dirname(CONFIG_FILE) or ".", exist_ok=True)
+                with open(tmp, "w") as f:
+                    json.dump(config_overrides, f, indent=2)
+                os.replace(tmp, CONFIG_FILE)
+            except OSError as e:
+                log(f"Config not persisted: {e}")
+    return new
+
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_DELETE = 0x200
+
+def _inotify_watch(directory: str) -> int | None:
+    """inotify fd watching `directory` (editors and update_config replace the file)."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, directory.encode(), IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+def config_watch_loop():
+    directory, name = os.path.split(os.path.abspath(CONFIG_FILE))
+    fd = _inotify_watch(directory)
+    if fd is None:
+        log(f"Config: inotify unavailable for {directory}; polling")
+    last_mtime = None
+    while True:
+        if fd is not None:
+            data = os.read(fd, 4096)
+            names = set()
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = struct.unpack_from("iIII", data, offset)
+                offset += 16
+                names.add(data[offset:offset + length].rstrip(b"\0").decode(errors="replace"))
+                offset += length
+            if name not in names:
+                continue
+        else:
+            time.sleep(2.0)
+            try:
+                mtime = os.stat(CONFIG_FILE).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime == last_mtime:
+                continue
+            last_mtime = mtime
+        load_config_file()
+
+def start_config_watch():
+    if not CONFIG_FILE:
+        return
+    load_config_file()
+    threading.Thread(target=config_watch_loop, name="config-watch", daemon=True).start()
 
+SIOCGIFADDR = 0x8915
+
+def _get_local_ips() -> list[str]:
+    """IPv4 addresses of the local interfaces.
+
+    Reads them straight from the kernel, so it never blocks on DNS or
+    needs a route to the outside world (boards are often offline).
+    """
+    ips = set()
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ips.add(s.getsockname()[0])
+    except OSError:
+        return []
+    try:
+        for _, name in socket.if_nameindex():
+            try:
+                ifreq = struct.pack('256s', name.encode()[:15])
+                addr = fcntl.ioctl(s.fileno(), SIOCGIFADDR, ifreq)[20:24]
+                ips.add(socket.inet_ntoa(addr))
+            except OSError:
+                continue
+    finally:
         s.close()
-    except Exception:
-        pass
 
-    ips.discard("127.0.0.1")
+    ips = {ip for ip in ips if not ip.startswith("127.")}
     ips.discard("0.0.0.0")
     return sorted(ips)
 
+def _announce_local_ips():
+    ips = _get_local_ips()
+    for ip in ips:
+        log(f"Web server: http://{ip}:{HTTP_PORT}")
+    if MATRIX_SCROLL_TEXT and ips:
+        start_text_scroll(" ".join(ips))
+
+def _log_startup_report():
+    parts = []
+    prev = STARTUP_T0
+    for name, ts in startup_phases:
+        parts.append(f"{name}={(ts - prev) * 1000:.0f}ms")
+        prev = ts
+    parts.append(f"total={(prev - STARTUP_T0) * 1000:.0f}ms")
+    log("Startup: " + " ".join(parts))
+
 # Routes
+def _show_scheduled(color: str):
+    WebStatus.update_color("" if color == "off" else color)
+    set_led_color(color)
+
+_run_scheduled_color = appstate.color_job(lambda: current_color, _show_scheduled)
+
+def _run_scheduled(action: dict) -> dict | None:
+    """Scheduler callback: show a color or scroll text; returns the action that undoes a color."""
+    if "text" in action:
+        start_text_scroll(action["text"])
+        return None
+    return _run_scheduled_color(action)
+
+# Timed and recurring colors and text (/api/schedule), saved next to the app state
+SCHEDULE_FILE = os.getenv("SCHEDULE_FILE", "/var/lib/app-state/schedule.json")
+schedule_store = appstate.StateStore(SCHEDULE_FILE, lambda: {"jobs": job_scheduler.dump()}, _env_float("STATE_FLUSH_SECONDS", 1.0), log=log)
+job_scheduler = scheduler.Scheduler(
+    _run_scheduled,
+    max_jobs=int(_env_float("SCHEDULE_MAX_JOBS", 10000)),
+    on_change=schedule_store.mark,
+    log=log,
+)
+
+ratelimit.install_admission(app, admission, status_hub)
+
 @app.route('/')
 def index():
     """Serve the main HTML page"""
@@ -632,18 +1869,169 @@ def index():
 @app.route('/status')
 def status_stream():
     """Server-Sent Events endpoint for real-time status updates"""
-    def event_stream():
-        q = Queue()
-        status_connections.add(q)
-        try:
-            WebStatus._broadcast()
-            while True:
-                data = q.get()
-                yield f"data: {json.dumps(data)}\n\n"
-        except GeneratorExit:
-            status_connections.discard(q)
+    q = Queue()
+    if not admission.subscribe(status_hub.connections, q):
+        return ratelimit.too_many(5.0)
+    return appstate.event_stream(status_hub.stream(q, WebStatus.payload), streams.compress_level)
+
+@app.route('/api/effect', methods=['GET', 'POST'])
+def api_effect():
+    """Start/stop an LED effect: {"effect": "fade|breathe|blink|none", "color": ...}"""
+    if request.method == 'GET':
+        return jsonify({"tick_ms": led_effects.tick * 1000.0, "active": led_effects.active()})
+
+    data = request.get_json(silent=True) or {}
+    kind = str(data.get("effect") or "").lower()
+    target = str(data.get("target") or "all").lower()
+    targets = list(led_effects.targets) if target == "all" else [target]
+    if any(t not in led_effects.targets for t in targets):
+        return jsonify({"error": "invalid target"}), 400
+    # the MCU LEDs are part of "all"; a single sysfs set leaves them alone
+    try:
+        mcu = _parse_bool("mcu", data.get("mcu", target == "all"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    return Response(event_stream(), mimetype='text/event-stream')
+    if kind in ("none", "stop", "off"):
+        led_effects.stop(targets, mcu=mcu)
+        return jsonify({"active": led_effects.active()})
+
+    color = str(data.get("color") or "").lower()
+    if kind not in LedEffect.KINDS or color not in ledcore.COLORS:
+        return jsonify({"error": "invalid effect or color"}), 400
+    try:
+        duration = float(data.get("duration", 1.0 if kind == "fade" else 0.0))
+        period = float(data.get("period", 2.0 if kind == "breathe" else 1.0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid duration or period"}), 400
+    # get_json() accepts NaN and Infinity: NaN levels would kill the effect thread
+    if not (math.isfinite(duration) and math.isfinite(period)) or period < 0:
+        return jsonify({"error": "invalid duration or period"}), 400
+
+    led_effects.start(kind, color, targets, duration, period, mcu=mcu)
+    return jsonify({"active": led_effects.active()})
+
+@app.route('/api/bridge')
+def bridge_status():
+    """Bridge health, per-lane latency against budget and MCU state checks"""
+    return jsonify({
+        "state": bridge_breaker.state,
+        "fast_failed": bridge_breaker.fast_failed,
+        "lanes": bridge_dispatcher.snapshot(),
+        "reconcile": mcu_reconciler.snapshot(),
+    })
+
+appstate.install_state_api(app, status_hub, streams.wait_max_seconds)
+
+def _schedule_action(data: dict) -> dict:
+    """/api/schedule body: {"color": "red", "at": "09:00"}, {"color": "green", "for": 5}, {"text": "hi", "every": 60}"""
+    if "text" in data:
+        text = str(data["text"] or "").strip()
+        if not text or len(text) > MATRIX_TEXT_MAX:
+            raise ValueError(f"text must be 1-{MATRIX_TEXT_MAX} characters")
+        return {"text": text}
+    return appstate.color_action(data)
+
+appstate.install_schedule_api(app, job_scheduler, _schedule_action)
+
+appstate.install_history_api(app, journal)
+
+@app.route('/api/voice')
+def voice_status():
+    """Voice pipeline counters: overruns, per-stage lag and the microphone"""
+    pipeline = voice_pipeline
+    if pipeline is None:
+        return jsonify({"running": False})
+    stats = {"running": bool(voice_thread and voice_thread.is_alive()), **pipeline.snapshot()}
+    if voice_engine is not None and pipeline.mode == "workers":
+        stats["workers"] = voice_engine.snapshot()
+    else:
+        stats["audio"] = audio_devices.snapshot()
+    return jsonify(stats)
+
+@app.route('/api/matrix')
+def api_matrix():
+    """Matrix layers, frames sent and scheduler lateness"""
+    return jsonify(matrix_compositor.snapshot())
+
+@app.route('/api/matrix/text', methods=['GET', 'POST'])
+def api_matrix_text():
+    """Scroll text on the matrix: {"text": "hello", "delay": 0.1, "repeat": 1}"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get("text"), str):
+            return jsonify({"error": "text required"}), 400
+        text = data["text"].strip()
+        if not text or len(text) > MATRIX_TEXT_MAX:
+            return jsonify({"error": f"text must be 1-{MATRIX_TEXT_MAX} characters"}), 400
+        try:
+            delay = float(data.get("delay", MATRIX_SCROLL_DELAY))
+            repeat = int(data.get("repeat", 1))
+        except (TypeError, ValueError):
+            return jsonify({"error": "invalid delay or repeat"}), 400
+        if not 0.02 <= delay <= 1.0 or repeat < 0:
+            return jsonify({"error": "delay must be 0.02-1.0 s and repeat >= 0"}), 400
+        frames = start_text_scroll(text, delay, repeat)
+        return jsonify({"text": text, "frames": len(frames), "repeat": repeat})
+    info = _text_frames.cache_info()
+    return jsonify({
+        "animation": matrix_compositor.animation(),
+        "cache": {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max": info.maxsize},
+    })
+
+def _model_file(name: str) -> str:
+    """VOICE_MODEL_DIR/<name> for a plain .eim file name; ValueError for anything else"""
+    if os.path.basename(name) != name or "\\" in name or not name.endswith(".eim") or name.startswith("."):
+        raise ValueError("model must be a .eim file name, without a directory")
+    base = os.path.realpath(VOICE_MODEL_DIR)
+    path = os.path.join(base, name)
+    # a symlink in the directory must not lead out of it
+    if os.path.dirname(os.path.realpath(path)) != base:
+        raise ValueError("model must be a .eim file name, without a directory")
+    return path
+
+@app.route('/api/model', methods=['GET', 'POST'])
+def api_model():
+    """Active voice model; POST {"model": "new.eim"} (in VOICE_MODEL_DIR) swaps it without stopping audio"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if data is not None and not isinstance(data, dict):
+            return jsonify({"error": "expected a JSON object"}), 400
+        if "path" in (data or {}):
+            return jsonify({"error": "paths are not accepted; send {\"model\": \"<file>.eim\"}"}), 400
+        name = (data or {}).get("model")
+        if name is None:
+            path = VOICE_MODEL_PATH
+        else:
+            try:
+                path = _model_file(str(name))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        if not os.path.isfile(path):
+            return jsonify({"error": f"model not found: {os.path.basename(path)}"}), 400
+        reason = models.stage(path)
+        if reason:
+            return jsonify({"error": reason}), 409
+        return jsonify(models.snapshot()), 202
+    return jsonify(models.snapshot())
+
+@app.route('/api/config', methods=['GET', 'POST'])
+def api_config():
+    """Runtime tunables; POST a partial object, e.g. {"THRESH": 0.75}"""
+    if request.method == 'POST':
+        try:
+            update_config(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "config": config,
+        "overrides": config_overrides,
+        "defaults": config_defaults,
+        "schema": {name: {"type": kind.__name__, "min": lo, "max": hi}
+                   for name, (kind, _, lo, hi) in CONFIG_SCHEMA.items()},
+    })
+
+diagnostics.install_debug_api(app, DEBUG_ENDPOINTS)
 
 @app.route('/assets/<path:filename>')
 def serve_assets(filename):
@@ -659,22 +2047,76 @@ def serve_static(filename):
         return send_from_directory(os.path.join(base_dir, "assets"), filename)
     return ("Not Found", 404)
 
+# Under handoff.py the running copy keeps serving until this one is ready
+HANDOFF_WARMUP_SECONDS = _env_float("HANDOFF_WARMUP_SECONDS", 30.0)
+
+def _wait_for_voice_model(timeout: float):
+    """Let the voice model load (runner init) before taking over from the old copy.
+
+    The microphone is opened later, once the old copy has let go of it
+    (handoff.wait_takeover() in the voice thread).
+    """
+    deadline = time.monotonic() + timeout
+    while (VOICE_ENABLED and not VOICE_PIPELINES and models.active is None
+           and voice_thread is not None and voice_thread.is_alive()
+           and time.monotonic() < deadline):
+        time.sleep(0.1)
+
+def _take_over():
+    """What only one copy may run: under handoff.py, once the old copy has exited."""
+    if USE_REAL_BRIDGE:
+        mcu_reconciler.start()
+    job_scheduler.restore((schedule_store.load() or {}).get("jobs"))
+    schedule_store.start()
+    job_scheduler.start()
+
 def main():
     log("Class Voice LED")
-    log("Web server: http://0.0.0.0:8000")
-    log("Web server: http://127.0.0.1:8000")
-    for ip in _get_local_ips():
-        log(f"Web server: http://{ip}:8000")
-    log(f"Matrix: {MATRIX_COLS}x{MATRIX_ROWS} = {MATRIX_SIZE} LEDs")
 
     try:
         logging.getLogger('werkzeug').setLevel(logging.WARNING)
-        set_led_color('blue')
+
+        # Bind first: browsers can connect (and queue) while the rest starts
+        server = make_server('0.0.0.0', HTTP_PORT, app, threaded=True, fd=handoff.listen_fd())
+        handoff.stop_on_sigterm(server)
+        _startup_phase("bind")
+        log(f"Web server: http://0.0.0.0:{HTTP_PORT}")
+        log(f"Web server: http://127.0.0.1:{HTTP_PORT}")
+        threading.Thread(target=_announce_local_ips, daemon=True).start()
+        log(f"Matrix: {MATRIX_COLS}x{MATRIX_ROWS} = {MATRIX_SIZE} LEDs")
+
+        if USE_REAL_BRIDGE:
+            # see start.sh: checks the firmware fingerprint it trusted
+            threading.Thread(target=ledcore.confirm_firmware, args=(Bridge.call,),
+                             kwargs={"log": log}, name="fw-confirm", daemon=True).start()
+        restore_state()
+        WebStatus._broadcast()
+        state_store.start()
+        journal.start()
+        handoff.after_takeover(_take_over)
+        start_config_watch()
+        _startup_phase("leds")
         start_voice_recognition()
+        start_model_watch()
         start_watchdog()
-        app.run(host='0.0.0.0', port=8000, debug=False, threaded=True)
+        _startup_phase("threads")
+        if handoff.listen_fd() is not None:
+            _wait_for_voice_model(HANDOFF_WARMUP_SECONDS)
+            _startup_phase("warmup")
+        _log_startup_report()
+        handoff.notify_ready()
+        server.serve_forever()
+        # let go of the microphone and the schedule for the next copy
+        voice_shutdown_event.set()
+        job_scheduler.stop()
+        log("Stopping: closing /status streams")
+        status_hub.drain(streams.drain_retry_ms, streams.drain_seconds)
+        state_store.flush()
+        schedule_store.flush()
     except KeyboardInterrupt:
         print("\n\nShutting down...")
+        state_store.flush()
+        schedule_store.flush()
         sys.exit(0)
 
 if __name__ == "__main__":
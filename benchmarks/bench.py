@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""Hardware-free benchmarks for the LED, Bridge, SSE and voice decision paths.
+
+Runs on any Linux box with Flask installed. The real sysfs LEDs are replaced
+by a temporary fake /sys/class/leds tree (LED_SYSFS_ROOT), the Bridge by the apps' own
+MockBridge with injected latency, and AudioImpulseRunner by a scripted
+classifier result stream.
+
+Results are written as JSON so runs can be compared:
+
+    python3 benchmarks/bench.py --output before.json
+    python3 benchmarks/bench.py --output after.json --compare before.json
+"""
+
+import argparse
+import contextlib
+import http.client
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+COMMON_DIR = os.path.join(REPO_DIR, "common")
+
+APPS = {
+    "webapp-led": os.path.join(REPO_DIR, "5-webapp-led", "webapp-led.py"),
+    "webapp-led-mcu": os.path.join(REPO_DIR, "6-webapp-led-mcu", "webapp-led-mcu.py"),
+    "webapp-led-mcu-voice": os.path.join(REPO_DIR, "9-webapp-led-mcu-voice", "webapp-led-mcu-voice.py"),
+}
+
+COLORS = ("blue", "green", "red", "yellow", "purple", "off")
+VOICE_LABELS = ("blue", "green", "purple", "red", "yellow", "select", "noise")
+
+def log(msg: str):
+    print(f"[BENCH] {msg}", file=sys.stderr, flush=True)
+
+# ---------------------------------------------------------------------------
+# Fakes
+# ---------------------------------------------------------------------------
+
+def make_fake_leds(root: str) -> str:
+    """Create a fake /sys/class/leds tree and return its path (LED_SYSFS_ROOT)."""
+    leds_root = os.path.join(root, "leds")
+    for led in ("blue:user", "green:user", "red:user", "blue:bt", "green:wlan", "red:panic"):
+        led_dir = os.path.join(leds_root, led)
+        os.makedirs(led_dir, exist_ok=True)
+        with open(os.path.join(led_dir, "max_brightness"), "w") as f:
+            f.write("1\n")
+        with open(os.path.join(led_dir, "brightness"), "w") as f:
+            f.write("0\n")
+    return leds_root
+
+def scripted_results(count: int, seed: int):
+    """Classifier results: mostly noise, with a 'select' followed by a color."""
+    rng = random.Random(seed)
+    for i in range(count):
+        scores = {label: rng.random() * 0.2 for label in VOICE_LABELS}
+        phase = i % 40
+        if phase == 10:
+            scores["select"] = 0.95
+        elif phase == 20:
+            scores[rng.choice(("blue", "green", "purple", "red", "yellow"))] = 0.92
+        yield {
+            "result": {"classification": scores},
+            "timing": {"dsp": 4, "classification": 2},
+        }, b""
+
+class ScriptedAudioImpulseRunner:
+    """Stand-in for edge_impulse_linux.audio.AudioImpulseRunner."""
+    windows = 0
+    seed = 0
+    on_exhausted = None
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def init(self):
+        return {
+            "project": {"owner": "bench", "name": "scripted"},
+            "model_parameters": {"labels": list(VOICE_LABELS), "frequency": 16000},
+        }
+
+    def classifier(self, device_id=None):
+        yield from scripted_results(self.windows, self.seed)
+        if self.on_exhausted:
+            self.on_exhausted()
+
+    def stop(self):
+        pass
+
+def install_fake_edge_impulse():
+    pkg = types.ModuleType("edge_impulse_linux")
+    audio = types.ModuleType("edge_impulse_linux.audio")
+    audio.AudioImpulseRunner = ScriptedAudioImpulseRunner
+    pkg.audio = audio
+    sys.modules["edge_impulse_linux"] = pkg
+    sys.modules["edge_impulse_linux.audio"] = audio
+
+def load_app(name: str, bridge_latency: float):
+    """Import an app file as a module and point it at the fakes."""
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), APPS[name])
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+
+    mod.DEBUG = False
+
+    mock_cls = getattr(mod, "MockBridge", None)
+    if mock_cls is not None:
+        class LatencyBridge(mock_cls):
+            @staticmethod
+            def call(function_name, *args):
+                if bridge_latency > 0:
+                    time.sleep(bridge_latency)
+                return mock_cls.call(function_name, *args)
+
+        mod.Bridge = LatencyBridge()
+    return mod
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def summarize(samples: list[float]) -> dict:
+    """Latency summary in microseconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1e6
+    return {
+        "count": len(ordered),
+        "mean_us": statistics.fmean(ordered) * 1e6,
+        "p50_us": pct(0.50),
+        "p90_us": pct(0.90),
+        "p99_us": pct(0.99),
+        "max_us": ordered[-1] * 1e6,
+    }
+
+def wait_for_threads(baseline: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while threading.active_count() > baseline and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+class ThreadPeak:
+    """Samples threading.active_count() in the background."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+def bench_apply_color(mod, iterations: int) -> dict:
+    baseline = threading.active_count()
+    samples = []
+    with ThreadPeak() as peak:
+        start = time.perf_counter()
+        for i in range(iterations):
+            color = COLORS[i % len(COLORS)]
+            t0 = time.perf_counter()
+            mod.apply_color(color)
+            samples.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - start
+        wait_for_threads(baseline)
+    return {
+        "ops_per_sec": iterations / elapsed,
+        "latency": summarize(samples),
+        "peak_threads": peak.peak,
+    }
+
+def bench_display_frame(mod, iterations: int) -> dict:
+    frames = mod.ANIMATION_COLOR_FRAMES
+    baseline = threading.active_count()
+    samples = []
+    with ThreadPeak() as peak:
+        for i in range(iterations):
+            t0 = time.perf_counter()
+            mod.display_frame(frames[i % len(frames)])
+            samples.append(time.perf_counter() - t0)
+        wait_for_threads(baseline)
+    return {
+        "frames_per_sec": len(samples) / sum(samples),
+        "latency": summarize(samples),
+        "peak_threads": peak.peak,
+    }
+
+def bench_ledcore(iterations: int, subscribers: int) -> dict:
+    """The shared hot paths once, without an app around them.
+
+    show: LedOutput over the fake sysfs LEDs and a BridgeBackend with a no-op
+    call; publish: one StatusHub broadcast to `subscribers` idle queues;
+    gzip: one compressed /status stream, per event, with its wire size.
+    """
+    import ledcore
+    from queue import SimpleQueue
+
+    bridge_calls = []
+    output = ledcore.LedOutput(ledcore.SysfsBackend(), ledcore.BridgeBackend(lambda *a: bridge_calls.append(a)))
+    show = []
+    for i in range(iterations):
+        color = COLORS[i % len(COLORS)]
+        t0 = time.perf_counter()
+        output.show(color)
+        show.append(time.perf_counter() - t0)
+
+    hub = ledcore.StatusHub()
+    queues = [SimpleQueue() for _ in range(subscribers)]
+    hub.connections.update(queues)
+    payload = {"status": "bench", "color": "blue", "bridge": "ok", "matrix": [0] * 104}
+    publish = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        hub.publish(payload)
+        publish.append(time.perf_counter() - t0)
+
+    # a scrolling matrix: every event differs from the one before
+    events = [hub._event({**payload, "matrix": [int((j + i) % 13 < 5) for j in range(104)]}, i)
+              for i in range(iterations)]
+    stream = ledcore.compressed(events, "gzip")
+    gzip, wire = [], 0
+    for _ in events:
+        t0 = time.perf_counter()
+        wire += len(next(stream))
+        gzip.append(time.perf_counter() - t0)
+    return {
+        "show": summarize(show),
+        "bridge_calls": len(bridge_calls),
+        "publish": summarize(publish),
+        "subscribers": subscribers,
+        "gzip": summarize(gzip),
+        "gzip_ratio": round(sum(map(len, events)) / max(1, wire), 1),
+    }
+
+def _serve(mod):
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, mod.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def bench_api_color(mod, seconds: float, clients: int) -> dict:
+    server = _serve(mod)
+    port = server.server_port
+    samples = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client(idx: int):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        local = []
+        i = idx
+        while time.monotonic() < deadline:
+            body = json.dumps({"color": COLORS[i % len(COLORS)]})
+            i += 1
+            t0 = time.perf_counter()
+            try:
+                conn.request("POST", "/api/color", body=body,
+                             headers={"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    with lock:
+                        errors[0] += 1
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+                continue
+            local.append(time.perf_counter() - t0)
+        conn.close()
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    return {
+        "clients": clients,
+        "requests_per_sec": len(samples) / elapsed,
+        "errors": errors[0],
+        "latency": summarize(samples),
+    }
+
+def bench_sse_fanout(mod, subscribers: int, events: int) -> dict:
+    """Drive /status generators directly; measure broadcast and delivery cost."""
+    seen = [-1] * subscribers
+    received = [0] * subscribers
+    seen_at = [0.0] * subscribers
+    done = threading.Event()
+    generators = []
+
+    with mod.app.test_request_context("/status"):
+        for _ in range(subscribers):
+            gen = mod.status_stream().response
+            next(gen)  # subscribe; the connect-time snapshot is discarded
+            generators.append(gen)
+
+    def consume(idx: int):
+        gen = generators[idx]
+        while not done.is_set():
+            try:
+                chunk = next(gen)
+            except StopIteration:
+                return
+            status = json.loads(chunk[len("data: "):]).get("status", "")
+            if status.startswith("bench-") and status != "bench-done":
+                seen[idx] = int(status[len("bench-"):])
+                received[idx] += 1
+                seen_at[idx] = time.perf_counter()
+
+    threads = [threading.Thread(target=consume, args=(i,), daemon=True) for i in range(subscribers)]
+    for t in threads:
+        t.start()
+
+    broadcast = getattr(mod, "_broadcast", None) or mod.WebStatus._broadcast
+    send_samples = []
+    delivery_samples = []
+    for i in range(events):
+        mod.current_status = f"bench-{i}"
+        t0 = time.perf_counter()
+        broadcast()
+        send_samples.append(time.perf_counter() - t0)
+        deadline = time.monotonic() + 5.0
+        while min(seen) < i and time.monotonic() < deadline:
+            time.sleep(0)
+        delivery_samples.append(max(seen_at) - t0)
+
+    done.set()
+    mod.current_status = "bench-done"
+    broadcast()
+    for t in threads:
+        t.join(timeout=1.0)
+    for gen in generators:
+        try:
+            gen.close()
+        except (RuntimeError, ValueError):
+            pass
+    return {
+        "subscribers": subscribers,
+        "events": events,
+        "broadcast": summarize(send_samples),
+        "delivery_all": summarize(delivery_samples),
+        "missed": sum(max(0, events - r) for r in received),
+    }
+
+def bench_voice_decision(mod, windows: int, seed: int) -> dict:
+    """Per-window overhead of _voice_recognition_loop over the bare classifier."""
+    with tempfile.NamedTemporaryFile(suffix=".eim") as model:
+        mod.VOICE_MODEL_PATH = model.name
+        mod.VOICE_ENABLED = True
+        mod.config = dict(mod.config, DEBOUNCE_SECONDS=0.0, SELECT_COOLDOWN_SECONDS=0.0)
+        # the scripted runner yields instantly: queue every window for the action stage
+        mod.VOICE_ACTION_QUEUE = windows
+
+        start = time.perf_counter()
+        for _ in scripted_results(windows, seed):
+            pass
+        raw = time.perf_counter() - start
+
+        ScriptedAudioImpulseRunner.windows = windows
+        ScriptedAudioImpulseRunner.seed = seed
+        ScriptedAudioImpulseRunner.on_exhausted = mod.voice_shutdown_event.set
+        mod.voice_shutdown_event.clear()
+        # the matrix scheduler is long-lived: start it before the thread baseline
+        mod.matrix_compositor.start()
+        baseline = threading.active_count()
+        with ThreadPeak() as peak:
+            start = time.perf_counter()
+            mod._voice_recognition_loop()
+            elapsed = time.perf_counter() - start
+            mod.stop_matrix_animation()
+            wait_for_threads(baseline)
+        mod.voice_shutdown_event.clear()
+
+    return {
+        "windows": windows,
+        "loop_us_per_window": elapsed / windows * 1e6,
+        "overhead_us_per_window": (elapsed - raw) / windows * 1e6,
+        "peak_threads": peak.peak,
+    }
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def run(args) -> dict:
+    install_fake_edge_impulse()
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench-sysfs-") as root:
+        os.environ["LED_SYSFS_ROOT"] = make_fake_leds(root)
+        sys.path.append(COMMON_DIR)
+
+        log("ledcore")
+        results["ledcore"] = bench_ledcore(args.iterations, max(args.subscribers))
+
+        apps = {name: load_app(name, args.bridge_latency) for name in APPS}
+
+        for name in ("webapp-led", "webapp-led-mcu"):
+            log(f"apply_color: {name}")
+            results[f"apply_color.{name}"] = bench_apply_color(apps[name], args.iterations)
+
+        voice = apps["webapp-led-mcu-voice"]
+        log("display_frame: webapp-led-mcu-voice")
+        results["display_frame.webapp-led-mcu-voice"] = bench_display_frame(voice, args.iterations)
+
+        for name in ("webapp-led", "webapp-led-mcu"):
+            log(f"/api/color: {name}")
+            results[f"api_color.{name}"] = bench_api_color(apps[name], args.seconds, args.clients)
+
+        for n in args.subscribers:
+            for name in ("webapp-led", "webapp-led-mcu-voice"):
+                log(f"SSE fan-out: {name} x{n}")
+                results[f"sse_fanout.{name}.{n}"] = bench_sse_fanout(apps[name], n, args.events)
+
+        log("voice decision: webapp-led-mcu-voice")
+        results["voice_decision.webapp-led-mcu-voice"] = bench_voice_decision(voice, args.windows, args.seed)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "bridge_latency_s": args.bridge_latency,
+        },
+        "results": results,
+    }
+
+# Metrics where a larger value is better; everything else is a cost.
+HIGHER_IS_BETTER = ("ops_per_sec", "frames_per_sec", "requests_per_sec")
+
+def _flatten(prefix: str, value, out: dict):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f"{prefix}.{k}" if prefix else k, v, out)
+    elif isinstance(value, (int, float)):
+        out[prefix] = value
+
+def compare(baseline: dict, current: dict):
+    old, new = {}, {}
+    _flatten("", baseline.get("results", {}), old)
+    _flatten("", current.get("results", {}), new)
+    print(f"{'metric':70} {'before':>12} {'after':>12} {'change':>8}", file=sys.stderr)
+    for key in sorted(new):
+        if key not in old or key.endswith("count"):
+            continue
+        a, b = old[key], new[key]
+        change = ((b - a) / a * 100.0) if a else 0.0
+        better = change > 0 if key.endswith(HIGHER_IS_BETTER) else change < 0
+        mark = "+" if better and abs(change) >= 5 else ("-" if abs(change) >= 5 else " ")
+        print(f"{key:70} {a:12.1f} {b:12.1f} {change:7.1f}% {mark}", file=sys.stderr)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000, help="apply_color / display_frame calls")
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of the /api/color load")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent /api/color clients")
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1, 10, 100], help="SSE fan-out sizes")
+    parser.add_argument("--events", type=int, default=200, help="broadcasts per SSE fan-out run")
+    parser.add_argument("--windows", type=int, default=2000, help="scripted classifier windows")
+    parser.add_argument("--bridge-latency", type=float, default=0.002, help="seconds added to each MockBridge call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DEBUG", "0")
+    # every load client is 127.0.0.1: measure the apps, not their admission limits
+    for name in ("RATE_COMMAND_PER_SECOND", "RATE_STATUS_PER_SECOND", "RATE_ASSET_PER_SECOND", "SSE_MAX_SUBSCRIBERS"):
+        os.environ.setdefault(name, "0")
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        log(f"results written to {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
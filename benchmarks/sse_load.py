@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""SSE subscriber load generator and soak tester for the web apps.
+
+Opens many concurrent EventSource-equivalent connections to /status with
+asyncio, drives color changes through /api/color while LED effects
+(breathe, blink, fade) run through /api/effect, and measures:
+
+- delivery latency from command to event, per subscriber
+- missed, duplicated and reordered events (using the "seq" field)
+- server thread count and RSS over time (when --pid is given)
+
+Short load run:
+
+    python3 benchmarks/sse_load.py --url http://127.0.0.1:8000 --clients 300 --duration 60
+
+Soak run (hours), with connection churn and a JSONL timeline:
+
+    python3 benchmarks/sse_load.py --clients 200 --duration 4h --churn 0.05 \\
+        --pid $(pidof -s python3) --timeline soak.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+
+COLORS = ("blue", "green", "red", "yellow", "purple", "off")
+
+# /api/effect requests cycled by drive_effects(); breathe and blink run until replaced
+EFFECTS = (
+    {"effect": "breathe", "period": 2.0},
+    {"effect": "blink", "period": 0.5},
+    {"effect": "fade", "duration": 1.0},
+)
+
+def log(msg: str):
+    print(f"[LOAD] {msg}", file=sys.stderr, flush=True)
+
+def parse_duration(value: str) -> float:
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+def proc_sample(pid: int | None) -> dict:
+    """Thread count and RSS of the server process, read from /proc."""
+    if not pid:
+        return {}
+    out = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    out["threads"] = int(line.split()[1])
+                elif line.startswith("VmRSS:"):
+                    out["rss_kb"] = int(line.split()[1])
+        out["fds"] = len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError as e:
+        out["error"] = str(e)
+    return out
+
+def _trim(d: dict, limit: int):
+    if len(d) > limit:
+        for key in sorted(d)[:len(d) - limit // 2]:
+            del d[key]
+
+class Stats:
+    MAX_SAMPLES = 100000
+    MAX_TRACKED = 10000
+
+    def __init__(self, seed: int = 1):
+        self.latencies = []
+        self.latency_count = 0
+        self.sent = {}          # seq -> monotonic send time of the command
+        self.pending = {}       # seq -> receive times seen before the command returned
+        self._rng = random.Random(seed)
+        self.events = 0
+        self.missed = 0
+        self.duplicated = 0
+        self.reordered = 0
+        self.connects = 0
+        self.disconnects = 0
+        self.errors = 0
+        self.commands = 0
+        self.command_errors = 0
+        self.effects = 0
+        self.effect_errors = 0
+
+    def add_latency(self, value: float):
+        """Reservoir-sample latencies so soak runs use bounded memory."""
+        self.latency_count += 1
+        if len(self.latencies) < self.MAX_SAMPLES:
+            self.latencies.append(value)
+        else:
+            i = self._rng.randrange(self.latency_count)
+            if i < self.MAX_SAMPLES:
+                self.latencies[i] = value
+
+    def on_received(self, seq: int, ts: float):
+        sent = self.sent.get(seq)
+        if sent is not None:
+            self.add_latency(ts - sent)
+        else:
+            self.pending.setdefault(seq, []).append(ts)
+            _trim(self.pending, self.MAX_TRACKED)
+
+    def on_sent(self, seq: int, ts: float):
+        self.sent[seq] = ts
+        _trim(self.sent, self.MAX_TRACKED)
+        for received in self.pending.pop(seq, ()):
+            self.add_latency(received - ts)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.latencies)
+        def pct(p):
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1e3 if ordered else None
+        return {
+            "events": self.events,
+            "missed": self.missed,
+            "duplicated": self.duplicated,
+            "reordered": self.reordered,
+            "connects": self.connects,
+            "disconnects": self.disconnects,
+            "errors": self.errors,
+            "commands": self.commands,
+            "command_errors": self.command_errors,
+            "effects": self.effects,
+            "effect_errors": self.effect_errors,
+            "latency_ms": {
+                "count": self.latency_count,
+                "mean": statistics.fmean(ordered) * 1e3 if ordered else None,
+                "p50": pct(0.50),
+                "p90": pct(0.90),
+                "p99": pct(0.99),
+                "max": ordered[-1] * 1e3 if ordered else None,
+            },
+        }
+
+async def _read_headers(reader) -> tuple[int, dict]:
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed before response")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        k, _, v = line.decode("latin-1").partition(":")
+        headers[k.strip().lower()] = v.strip()
+    return status, headers
+
+async def _iter_body(reader, headers):
+    """Yield raw body bytes, decoding chunked transfer encoding if used."""
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size_line = await reader.readline()
+            if not size_line:
+                return
+            size = int(size_line.split(b";")[0], 16)
+            if size == 0:
+                return
+            data = await reader.readexactly(size)
+            await reader.readexactly(2)
+            yield data
+    else:
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                return
+            yield data
+
+class Subscriber:
+    def __init__(self, idx: int, host: str, port: int, stats: Stats):
+        self.idx = idx
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.last_seq = None
+        self.seen = set()
+        self.task = None
+
+    def _on_event(self, data: dict):
+        now = time.monotonic()
+        st = self.stats
+        st.events += 1
+        seq = data.get("seq")
+        if seq is None:
+            return
+        if seq in self.seen:
+            st.duplicated += 1
+            return
+        self.seen.add(seq)
+        if len(self.seen) > 4096:
+            self.seen = {s for s in self.seen if s > seq - 2048}
+        if self.last_seq is not None:
+            if seq < self.last_seq:
+                # counted as missed when the gap was first seen
+                st.reordered += 1
+                st.missed -= 1
+            elif seq > self.last_seq + 1:
+                st.missed += seq - self.last_seq - 1
+        self.last_seq = max(seq, self.last_seq or seq)
+        st.on_received(seq, now)
+
+    async def run(self):
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            writer.write(
+                f"GET /status HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                "Accept: text/event-stream\r\nCache-Control: no-cache\r\n\r\n".encode()
+            )
+            await writer.drain()
+            status, headers = await _read_headers(reader)
+            if status != 200:
+                raise ConnectionError(f"HTTP {status}")
+            self.stats.connects += 1
+            buf = b""
+            async for chunk in _iter_body(reader, headers):
+                buf += chunk
+                while b"\n\n" in buf:
+                    event, buf = buf.split(b"\n\n", 1)
+                    for line in event.split(b"\n"):
+                        if line.startswith(b"data:"):
+                            try:
+                                self._on_event(json.loads(line[5:]))
+                            except ValueError:
+                                self.stats.errors += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats.errors += 1
+            log(f"subscriber {self.idx}: {e}")
+        finally:
+            self.stats.disconnects += 1
+            if writer is not None:
+                writer.close()
+
+    def start(self):
+        self.last_seq = None
+        self.seen = set()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+async def _post(reader, writer, host: str, port: int, path: str, payload: dict) -> tuple[int, dict, bytes]:
+    body = json.dumps(payload).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    status, headers = await _read_headers(reader)
+    data = await reader.readexactly(int(headers.get("content-length", "0")))
+    return status, headers, data
+
+async def drive_colors(host: str, port: int, rate: float, stats: Stats, stop: asyncio.Event):
+    """POST /api/color at a fixed rate over one keep-alive connection."""
+    reader = writer = None
+    i = 0
+    interval = 1.0 / rate
+    next_ts = time.monotonic()
+    while not stop.is_set():
+        next_ts += interval
+        color = COLORS[i % len(COLORS)]
+        i += 1
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            sent = time.monotonic()
+            status, headers, data = await _post(reader, writer, host, port, "/api/color", {"color": color})
+            stats.commands += 1
+            if status in (404, 405):
+                log("/api/color not available; observing only")
+                return
+            if status != 200:
+                stats.command_errors += 1
+            else:
+                seq = json.loads(data).get("seq")
+                if seq is not None:
+                    stats.on_sent(seq, sent)
+            if headers.get("connection", "").lower() == "close":
+                writer.close()
+                writer = None
+        except Exception as e:
+            stats.command_errors += 1
+            log(f"driver: {e}")
+            if writer is not None:
+                writer.close()
+            writer = None
+        await asyncio.sleep(max(0.0, next_ts - time.monotonic()))
+
+async def drive_effects(host: str, port: int, rate: float, stats: Stats, stop: asyncio.Event):
+    """Start a new LED effect (EFFECTS, in turn) at a fixed rate, so the
+    subscribers are measured with animations running."""
+    reader = writer = None
+    i = 0
+    interval = 1.0 / rate
+    next_ts = time.monotonic()
+    while not stop.is_set():
+        next_ts += interval
+        payload = dict(EFFECTS[i % len(EFFECTS)], color=COLORS[i % (len(COLORS) - 1)])
+        i += 1
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            status, headers, _ = await _post(reader, writer, host, port, "/api/effect", payload)
+            stats.effects += 1
+            if status in (404, 405):
+                log("/api/effect not available; no effects running")
+                return
+            if status != 200:
+                stats.effect_errors += 1
+            if headers.get("connection", "").lower() == "close":
+                writer.close()
+                writer = None
+        except Exception as e:
+            stats.effect_errors += 1
+            log(f"effects: {e}")
+            if writer is not None:
+                writer.close()
+            writer = None
+        await asyncio.sleep(max(0.0, next_ts - time.monotonic()))
+
+async def run(args) -> dict:
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    stats = Stats(args.seed)
+    stop = asyncio.Event()
+    rng = random.Random(args.seed)
+
+    log(f"opening {args.clients} subscribers to {host}:{port}")
+    subs = [Subscriber(i, host, port, stats) for i in range(args.clients)]
+    for sub in subs:
+        sub.start()
+        if args.ramp:
+            await asyncio.sleep(args.ramp / args.clients)
+
+    drivers = []
+    if args.rate > 0:
+        drivers.append(asyncio.create_task(drive_colors(host, port, args.rate, stats, stop)))
+    if args.effects > 0:
+        drivers.append(asyncio.create_task(drive_effects(host, port, args.effects, stats, stop)))
+
+    timeline = open(args.timeline, "w") if args.timeline else None
+    samples = []
+    started = time.monotonic()
+    deadline = started + args.duration
+    try:
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(args.interval, max(0.0, deadline - time.monotonic())))
+            if args.churn > 0:
+                for sub in rng.sample(subs, max(1, int(len(subs) * args.churn))):
+                    await sub.stop()
+                    sub.start()
+            sample = {
+                "t": round(time.monotonic() - started, 3),
+                "open": sum(1 for s in subs if s.task and not s.task.done()),
+                **proc_sample(args.pid),
+                **{k: v for k, v in stats.summary().items() if k != "latency_ms"},
+            }
+            samples.append(sample)
+            if timeline:
+                timeline.write(json.dumps(sample) + "\n")
+                timeline.flush()
+            log(" ".join(f"{k}={v}" for k, v in sample.items()))
+    finally:
+        stop.set()
+        for driver in drivers:
+            await driver
+        for sub in subs:
+            await sub.stop()
+        if timeline:
+            timeline.close()
+
+    growth = {}
+    if len(samples) >= 2:
+        for key in ("threads", "rss_kb", "fds"):
+            if key in samples[0] and key in samples[-1]:
+                growth[key] = samples[-1][key] - samples[0][key]
+    return {
+        "url": args.url,
+        "clients": args.clients,
+        "duration_s": args.duration,
+        "rate": args.rate,
+        "effects": args.effects,
+        "churn": args.churn,
+        "summary": stats.summary(),
+        "server_first": {k: samples[0].get(k) for k in ("threads", "rss_kb", "fds")} if samples else {},
+        "server_last": {k: samples[-1].get(k) for k in ("threads", "rss_kb", "fds")} if samples else {},
+        "server_growth": growth,
+    }
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="base URL of the web app")
+    parser.add_argument("--clients", type=int, default=100, help="concurrent /status subscribers")
+    parser.add_argument("--duration", type=parse_duration, default=30.0, help="run time, e.g. 60, 10m, 4h")
+    parser.add_argument("--rate", type=float, default=5.0, help="color commands per second (0 = observe only)")
+    parser.add_argument("--effects", type=float, default=0.5, help="LED effects started per second (0 = none)")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds to spread the initial connects over")
+    parser.add_argument("--churn", type=float, default=0.0, help="fraction of subscribers reconnected each interval")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between timeline samples")
+    parser.add_argument("--pid", type=int, help="server PID for thread/RSS/fd sampling (same host only)")
+    parser.add_argument("--timeline", help="write per-interval samples as JSON lines")
+    parser.add_argument("--output", help="write the final summary JSON here (default: stdout)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
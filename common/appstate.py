@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""App state shared by 5-webapp-led, 6-webapp-led-mcu and 9-webapp-led-mcu-voice.
+
+- StreamSettings: /status, /api/state and shutdown drain settings
+- StateStore: the state file that lets an app resume after a restart (see
+  the app-state volume in their docker-compose.yml)
+- install_state_api(): GET /api/state, the versioned state of a
+  ledcore.StatusHub for long-polls and If-None-Match
+- event_stream(): the /status response for a StatusHub stream, compressed
+  for clients that accept it
+- EventJournal and install_history_api(): the typed event ring behind
+  GET /api/history
+- install_schedule_api(): /api/schedule for a scheduler.Scheduler, with
+  color_action() and color_job() for the scheduled color actions
+"""
+
+import json
+import os
+import threading
+import time
+from array import array
+
+from flask import Response, jsonify, request
+
+import ledcore
+
+class StreamSettings:
+    """How /status streams and /api/state long-polls are served and drained."""
+
+    def __init__(self, max_waiters: int = 64, wait_max_seconds: float = 30.0,
+                 drain_retry_ms: tuple[int, int] = (500, 5000), drain_seconds: float = 3.0,
+                 compress_level: int = 6):
+        # /api/state long-polls: how many may be parked at once, and for how long
+        self.max_waiters = max_waiters
+        self.wait_max_seconds = wait_max_seconds
+        # On SIGTERM (stop, or a handoff to a new copy, see handoff.py) /status
+        # clients are closed and told to reconnect after a random delay in this range
+        self.drain_retry_ms = drain_retry_ms
+        self.drain_seconds = drain_seconds
+        # /status is gzip/deflate compressed for clients that accept it; 0 turns it off
+        self.compress_level = compress_level
+
+    @classmethod
+    def from_env(cls, env_float) -> "StreamSettings":
+        """The defaults, overridden by STATE_MAX_WAITERS, STATE_WAIT_MAX_SECONDS,
+        DRAIN_RETRY_MIN_MS/_MAX_MS, DRAIN_SECONDS and SSE_COMPRESS_LEVEL.
+
+        `env_float(name, default)` is the app's reader, so a bad value is
+        logged the app's way.
+        """
+        d = cls()
+        return cls(
+            int(env_float("STATE_MAX_WAITERS", d.max_waiters)),
+            env_float("STATE_WAIT_MAX_SECONDS", d.wait_max_seconds),
+            (int(env_float("DRAIN_RETRY_MIN_MS", d.drain_retry_ms[0])),
+             int(env_float("DRAIN_RETRY_MAX_MS", d.drain_retry_ms[1]))),
+            env_float("DRAIN_SECONDS", d.drain_seconds),
+            int(env_float("SSE_COMPRESS_LEVEL", d.compress_level)),
+        )
+
+class StateStore:
+    """Crash-safe snapshot of the app state, written off the request path.
+
+    `mark()` only sets a flag. A writer thread serializes `snapshot()` and
+    replaces the file atomically (temp file, fsync, rename) at most once per
+    `min_interval`, so a crash leaves the previous or the new snapshot, never
+    a torn one. Each write carries an increasing `seq`.
+    """
+
+    VERSION = 1
+    META = ("version", "seq", "saved_at")
+
+    def __init__(self, path: str, snapshot, min_interval: float = 1.0, log=None):
+        self.path = path
+        self.snapshot = snapshot
+        self.min_interval = min_interval
+        self.log = log
+        self.seq = 0
+        self.last_error = ""
+        self._last = None
+        self._dirty = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def load(self) -> dict | None:
+        if not self.path:
+            return None
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            if self.log:
+                self.log(f"State file {self.path} unreadable, starting clean: {e}")
+            return None
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            if self.log:
+                self.log(f"State file {self.path} has an unknown format, starting clean")
+            return None
+        self.seq = int(data.get("seq") or 0)
+        self._last = {k: v for k, v in data.items() if k not in self.META}
+        return self._last
+
+    def start(self):
+        if not self.path or self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="state-writer", daemon=True)
+        self._thread.start()
+
+    def mark(self):
+        self._dirty.set()
+
+    def flush(self):
+        """Write synchronously if anything changed (shutdown path)."""
+        if self.path:
+            self._dirty.clear()
+            self._write()
+
+    def _run(self):
+        while True:
+            self._dirty.wait()
+            self._dirty.clear()
+            self._write()
+            time.sleep(self.min_interval)
+
+    def _write(self):
+        with self._lock:
+            state = self.snapshot()
+            if state == self._last:
+                return
+            data = dict(state, version=self.VERSION, seq=self.seq + 1, saved_at=round(time.time(), 3))
+            tmp = f"{self.path}.tmp"
+            try:
+                directory = os.path.dirname(self.path) or "."
+                os.makedirs(directory, exist_ok=True)
+                with open(tmp, "w") as f:
+                    json.dump(data, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                dfd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(dfd)
+                finally:
+                    os.close(dfd)
+            except OSError as e:
+                if str(e) != self.last_error and self.log:
+                    self.log(f"State save failed: {e}")
+                self.last_error = str(e)
+                return
+            self.seq += 1
+            self.last_error = ""
+            self._last = state
+
+def event_stream(events, level: int) -> Response:
+    """text/event-stream response, gzip/deflate at `level` (0: off) if the client accepts it."""
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = request.accept_encodings.best_match(list(ledcore.SSE_ENCODINGS)) if level else None
+    if encoding:
+        events = ledcore.compressed(events, encoding, level)
+        headers["Content-Encoding"] = encoding
+    return Response(events, mimetype="text/event-stream", headers=headers)
+
+def install_state_api(app, hub, max_wait: float):
+    """Add GET /api/state for `hub` (a ledcore.StatusHub) to a Flask app.
+
+    ?since=<version>&wait=<seconds> long-polls for up to `max_wait`
+    seconds; an If-None-Match with the current ETag gives 304.
+    """
+
+    def api_state():
+        """Versioned state: ?since=<version>&wait=<seconds> long-polls, If-None-Match gives 304"""
+        try:
+            if "since" in request.args:
+                since = int(request.args["since"])
+            else:
+                since = hub.version_from_etag(request.if_none_match)
+            wait = min(max_wait, max(0.0, float(request.args.get("wait", 0))))
+        except ValueError:
+            return jsonify({"error": "invalid since or wait"}), 400
+        version, state = hub.wait(since, wait)
+        etag = hub.etag(version)
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if etag in request.if_none_match:
+            return "", 304, headers
+        return jsonify({**state, "version": version}), 200, headers
+
+    app.add_url_rule("/api/state", "api_state", api_state)
+
+class EventJournal:
+    """Fixed-capacity ring of typed events.
+
+    `types` lists the event types an app records. Records live in
+    preallocated parallel arrays indexed by seq % capacity: recording fills
+    slots in place and the oldest events are overwritten. Readers page with
+    `since`. With `spill_path`, a background thread appends new events to a
+    JSON lines file, rotated to `<file>.1` once it grows past
+    `spill_max_bytes`.
+    """
+
+    def __init__(self, types, capacity: int, spill_path: str = "", spill_max_bytes: int = 1 << 20, log=None):
+        self.types = tuple(types)
+        self.capacity = max(16, capacity)
+        self.spill_path = spill_path
+        self.spill_max_bytes = spill_max_bytes
+        self.log = log
+        self.seq = 0
+        self._ts = array("d", bytes(8 * self.capacity))
+        self._score = array("d", bytes(8 * self.capacity))
+        self._type = bytearray(self.capacity)
+        self._value = [""] * self.capacity
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, kind: str, value: str = "", score: float = 0.0) -> int:
+        code = self.types.index(kind)
+        with self._lock:
+            self.seq += 1
+            i = self.seq % self.capacity
+            self._ts[i] = time.time()
+            self._type[i] = code
+            self._value[i] = value
+            self._score[i] = score
+            return self.seq
+
+    def query(self, since: int = 0, kinds=None, limit: int = 0) -> dict:
+        """Events after `since`, oldest first; `next` is the `since` for the next poll."""
+        codes = None if not kinds else {self.types.index(k) for k in kinds}
+        events = []
+        with self._lock:
+            last = self.seq
+            if since > last:
+                since = 0  # the app restarted; the client's cursor is from before
+            first = max(since + 1, last - self.capacity + 1, 1)
+            seq = first - 1
+            for seq in range(first, last + 1):
+                i = seq % self.capacity
+                if codes is not None and self._type[i] not in codes:
+                    continue
+                kind = self.types[self._type[i]]
+                event = {"seq": seq, "ts": self._ts[i], "type": kind, "value": self._value[i]}
+                if kind == "voice":
+                    event["score"] = round(self._score[i], 4)
+                events.append(event)
+                if limit and len(events) >= limit:
+                    break
+        # `seq` is the last slot looked at: the newest event unless `limit` cut the page short
+        return {"events": events, "next": seq, "latest": last, "missed": max(0, first - since - 1)}
+
+    def start(self):
+        if not self.spill_path or self._thread:
+            return
+        self._thread = threading.Thread(target=self._spill_loop, name="journal-spill", daemon=True)
+        self._thread.start()
+
+    def _spill_loop(self):
+        spilled = self.seq
+        while True:
+            time.sleep(1.0)
+            batch = self.query(since=spilled)
+            if not batch["events"]:
+                continue
+            spilled = batch["next"]
+            try:
+                if os.path.getsize(self.spill_path) > self.spill_max_bytes:
+                    os.replace(self.spill_path, f"{self.spill_path}.1")
+            except OSError:
+                pass
+            try:
+                with open(self.spill_path, "a") as f:
+                    f.write("".join(json.dumps(e) + "\n" for e in batch["events"]))
+            except OSError as e:
+                if self.log:
+                    self.log(f"History spill failed: {e}")
+
+def install_history_api(app, journal: EventJournal):
+    """Add GET /api/history (?since=<seq>&type=color,status&limit=<n>) for `journal`."""
+
+    def api_history():
+        """Journal page: ?since=<seq>&type=color,status&limit=<n>"""
+        kinds = [k for k in request.args.get("type", "").split(",") if k]
+        if any(k not in journal.types for k in kinds):
+            return jsonify({"error": "invalid type"}), 400
+        try:
+            since = max(0, int(request.args.get("since", 0)))
+            limit = max(0, int(request.args.get("limit", 0)))
+        except ValueError:
+            return jsonify({"error": "invalid since or limit"}), 400
+        return jsonify(journal.query(since, kinds, limit))
+
+    app.add_url_rule("/api/history", "api_history", api_history)
+
+def color_action(data: dict) -> dict:
+    """/api/schedule body -> color action: {"color": "red"} plus an optional "expect"."""
+    color = str(data.get("color") or "").lower()
+    expect = data.get("expect")
+    if color not in ledcore.COLORS or (expect is not None and expect not in ledcore.COLORS):
+        raise ValueError("invalid color")
+    return {"color": color} if expect is None else {"color": color, "expect": expect}
+
+def color_job(current, show):
+    """Scheduler callback for color actions: returns the action that undoes one.
+
+    `current()` is the color shown now ("" or "off" for none), `show(color)`
+    shows another. `expect` skips the job if the color is no longer the one it
+    expects (e.g. a flash's restore after someone picked another color).
+    """
+
+    def run(action: dict) -> dict | None:
+        previous = current() or "off"
+        if action.get("expect", previous) != previous:
+            return None
+        color = action["color"]
+        if color != previous:
+            show(color)
+        return {"color": previous, "expect": color}
+
+    return run
+
+def install_schedule_api(app, jobs, parse_action):
+    """Add /api/schedule (GET lists, POST adds) and DELETE /api/schedule/<id>.
+
+    `jobs` is a scheduler.Scheduler; `parse_action(body)` turns a POST body
+    into the job's action and raises ValueError (the 400 message) if it is
+    not one. `in`, `every`, `at`, `for` and `name` come from the body too.
+    """
+
+    def api_schedule():
+        """Timed actions: GET lists the jobs, POST adds one"""
+        if request.method == 'GET':
+            return jsonify({**jobs.snapshot(), "now": time.time(), "list": jobs.list()})
+        data = request.get_json(silent=True) or {}
+        try:
+            action = parse_action(data)
+            job = jobs.add(action, at=data.get("at"), after=data.get("in"),
+                           every=data.get("every"), duration=data.get("for"), name=data.get("name"))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(job.to_dict()), 201
+
+    def api_schedule_cancel(job_id: int):
+        """Cancel a scheduled job"""
+        if not jobs.cancel(job_id):
+            return jsonify({"error": "no such job"}), 404
+        return jsonify({"cancelled": job_id})
+
+    app.add_url_rule("/api/schedule", "api_schedule", api_schedule, methods=["GET", "POST"])
+    app.add_url_rule("/api/schedule/<int:job_id>", "api_schedule_cancel", api_schedule_cancel, methods=["DELETE"])
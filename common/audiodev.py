@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""Microphone discovery and the voice capture pipeline shared by 8-led-voice
+and 9-webapp-led-mcu-voice.
+
+PortAudio device indexes move when USB devices are plugged in another
+order, so PA_ALSA_DEVICE may name the microphone instead: any part of its
+PortAudio name, case-insensitive, e.g. "USB" or "hw:1,0". A number is still
+taken as an index. Unset, the default input (or the first input that can
+record at the model's rate) is used.
+
+Enumerating means initializing PortAudio, which probes every ALSA card and
+is slow and noisy. AudioDevices does it once and keeps the PyAudio
+instance for the capture streams, so a restarted voice loop does not probe
+again. It probes anew only when /proc/asound/cards changes (hotplug) or
+after invalidate(), e.g. when a stream failed to open.
+
+VoicePipeline ties the stages together: AudioCapture copies the
+microphone into an AudioRing from the PortAudio callback; the voice thread
+classifies ring windows and hands results to the action thread through an
+ActionQueue. StageStats keeps the per-stage latencies the apps report.
+numpy and pyaudio are imported only when a ring or stream is made.
+"""
+
+import importlib.util
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import NamedTuple
+
+ALSA_CARDS = "/proc/asound/cards"
+# Edge Impulse audio models record at 16 kHz unless their parameters say otherwise
+DEFAULT_RATE = 16000
+
+def model_rate(params: dict) -> int:
+    """Sample rate from a runner's model_parameters, DEFAULT_RATE without one."""
+    return int(params.get("frequency") or DEFAULT_RATE)
+
+class AudioInput(NamedTuple):
+    index: int
+    name: str
+    card: str | None        # "hw:1,0" when PortAudio names the ALSA device
+    channels: int
+    default_rate: int
+
+class AudioChoice(NamedTuple):
+    device: AudioInput
+    rate: int
+    rate_ok: bool           # the device opens mono 16-bit input at `rate`
+    how: str                # "name", "index", "default" or "first"
+
+    def describe(self) -> str:
+        fit = "ok" if self.rate_ok else f"not supported, device default {self.device.default_rate} Hz"
+        return f"#{self.device.index} '{self.device.name}' ({self.how}), {self.rate} Hz {fit}"
+
+@contextmanager
+def quiet_stderr():
+    """Silence stderr at the fd level: ALSA prints a warning per card it
+    cannot open whenever PortAudio probes or opens a stream."""
+    try:
+        fd = sys.stderr.fileno()
+        saved = os.dup(fd)
+    except (OSError, ValueError):
+        yield
+        return
+    try:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, fd)
+        os.close(devnull)
+        yield
+    finally:
+        os.dup2(saved, fd)
+        os.close(saved)
+
+def _card(name: str) -> str | None:
+    m = re.search(r"\((hw:\d+,\d+)\)", name)
+    return m.group(1) if m else None
+
+class AudioDevices:
+    def __init__(self, cards_path: str = ALSA_CARDS, log=None):
+        self.cards_path = cards_path
+        self.log = log
+        self.probes = 0
+        self.choice = None
+        self.error = ""
+        self._pa = None
+        self._inputs = None
+        self._default = None
+        self._cards = None
+        self._rates = {}
+        self._lock = threading.Lock()
+
+    def _cards_fingerprint(self) -> str:
+        try:
+            with open(self.cards_path) as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def _probe(self):
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
+        self._inputs, self._default, self._rates = [], None, {}
+        try:
+            import pyaudio
+            with quiet_stderr():
+                self._pa = pyaudio.PyAudio()
+        except Exception as e:
+            # no PortAudio: callers fall back to the SDK's own device choice
+            self.error = str(e)
+            if self.log:
+                self.log(f"[AUDIO] cannot list input devices: {e}")
+            return
+        self.probes += 1
+        self.error = ""
+        inputs = []
+        for i in range(self._pa.get_device_count()):
+            info = self._pa.get_device_info_by_index(i)
+            if int(info.get("maxInputChannels", 0)) > 0:
+                name = str(info.get("name", ""))
+                inputs.append(AudioInput(i, name, _card(name), int(info["maxInputChannels"]),
+                                         int(info.get("defaultSampleRate", 0))))
+        try:
+            self._default = int(self._pa.get_default_input_device_info()["index"])
+        except (IOError, OSError, KeyError):
+            self._default = None
+        self._inputs = inputs
+
+    def _fresh(self):
+        cards = self._cards_fingerprint()
+        if self._inputs is None or cards != self._cards:
+            if self._cards is not None and self.log:
+                self.log("[AUDIO] sound cards changed, probing again")
+            self._cards = cards
+            self._probe()
+
+    def pa(self):
+        """The shared PyAudio instance (probes on first use or after a change).
+
+        Only call this between streams: a new probe ends the old instance.
+        """
+        with self._lock:
+            self._fresh()
+            return self._pa
+
+    def invalidate(self, reason: str = ""):
+        """Probe again on the next use, e.g. after the device failed to open."""
+        with self._lock:
+            if self._inputs is not None and self.log:
+                self.log(f"[AUDIO] probing again on next start{': ' + reason if reason else ''}")
+            self._cards = None
+
+    def _rate_ok(self, device: AudioInput, rate: int) -> bool:
+        key = (device.index, rate)
+        if key not in self._rates:
+            import pyaudio
+            try:
+                self._rates[key] = bool(self._pa.is_format_supported(
+                    rate, input_device=device.index, input_channels=1, input_format=pyaudio.paInt16))
+            except (ValueError, OSError):
+                self._rates[key] = False
+        return self._rates[key]
+
+    def select(self, spec, rate: int) -> AudioChoice | None:
+        """Input for `spec` (name part, index or None) that should record at `rate`.
+
+        None when there is no input at all, or no match for a name; the SDK
+        then picks its own default as before.
+        """
+        spec = "" if spec is None else str(spec).strip()
+        with self._lock:
+            self._fresh()
+            inputs = self._inputs
+            choice = None
+            if spec.isdigit():
+                device = next((d for d in inputs if d.index == int(spec)), None)
+                if device:
+                    choice = AudioChoice(device, rate, self._rate_ok(device, rate), "index")
+                elif self.log and not self.error:
+                    self.log(f"[AUDIO] no input device #{spec}; choosing one")
+            elif spec:
+                device = next((d for d in inputs if spec.lower() in d.name.lower()), None)
+                if device is None:
+                    if self.log and not self.error:
+                        names = ", ".join(f"#{d.index} '{d.name}'" for d in inputs) or "none"
+                        self.log(f"[AUDIO] no input device matches '{spec}'; inputs: {names}")
+                    self.choice = None
+                    return None
+                choice = AudioChoice(device, rate, self._rate_ok(device, rate), "name")
+            if choice is None and inputs:
+                default = next((d for d in inputs if d.index == self._default), None)
+                fitting = [d for d in inputs if self._rate_ok(d, rate)]
+                if default and self._rate_ok(default, rate):
+                    choice = AudioChoice(default, rate, True, "default")
+                elif fitting:
+                    choice = AudioChoice(fitting[0], rate, True, "first")
+                else:
+                    choice = AudioChoice(default or inputs[0], rate, False, "default" if default else "first")
+            if choice != self.choice and choice and self.log:
+                self.log(f"[AUDIO] input {choice.describe()}")
+            self.choice = choice
+            return choice
+
+    def device_id(self, spec, rate: int) -> int | None:
+        """PortAudio index for select(); a numeric `spec` as is if nothing could be listed."""
+        choice = self.select(spec, rate)
+        if choice:
+            return choice.device.index
+        spec = "" if spec is None else str(spec).strip()
+        return int(spec) if spec.isdigit() and not self._inputs else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            choice = self.choice
+            return {
+                "probes": self.probes,
+                "error": self.error,
+                "inputs": [d._asdict() for d in self._inputs or ()],
+                "selected": {**choice.device._asdict(), "rate": choice.rate, "rate_ok": choice.rate_ok,
+                             "how": choice.how} if choice else None,
+            }
+
+class StageStats:
+    def __init__(self):
+        self.count = 0
+        self.max_ms = 0.0
+        self._samples = deque(maxlen=512)
+
+    def record(self, ms: float):
+        self.count += 1
+        if ms > self.max_ms:
+            self.max_ms = ms
+        self._samples.append(ms)
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self._samples)
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2) if ordered else None
+        return {"count": self.count, "p50_ms": pct(0.50), "p99_ms": pct(0.99), "max_ms": round(self.max_ms, 2)}
+
+class AudioRing:
+    """Preallocated int16 ring written by the capture callback.
+
+    The writer never blocks or waits for the reader. A reader that falls a
+    whole ring behind has lost that audio: `read` counts an overrun and
+    jumps to the freshest full window.
+    """
+
+    def __init__(self, capacity: int):
+        import numpy as np
+        self.capacity = capacity
+        self.buf = np.zeros(capacity, dtype=np.int16)
+        self.written = 0
+        self.overruns = 0
+        self._cond = threading.Condition()
+
+    def write(self, samples):
+        n = len(samples)
+        if n > self.capacity:
+            samples, n = samples[-self.capacity:], self.capacity
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.buf[start:start + first] = samples[:first]
+        self.buf[:n - first] = samples[first:]
+        with self._cond:
+            self.written += n
+            self._cond.notify()
+
+    def read(self, pos: int, out, timeout: float) -> int | None:
+        """Copy len(out) samples from `pos` into `out`; returns the position read, None on timeout."""
+        n = len(out)
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.written >= pos + n, timeout):
+                return None
+        while True:
+            if self.written - pos > self.capacity:
+                self.overruns += 1
+                pos = self.written - n
+            start = pos % self.capacity
+            first = min(n, self.capacity - start)
+            out[:first] = self.buf[start:start + first]
+            out[first:] = self.buf[:n - first]
+            # the writer may have lapped us while copying
+            if self.written - pos <= self.capacity:
+                return pos
+
+class AudioCapture:
+    """PortAudio input stream whose callback only copies into an AudioRing.
+
+    `pa` is a PyAudio instance to share (AudioDevices.pa()); it is left
+    running on stop(). Without one, a private instance is made and ended.
+    """
+
+    def __init__(self, ring: AudioRing, rate: int, device_id: int | None, chunk: int = 1024, pa=None):
+        self.ring = ring
+        self.rate = rate
+        self.device_id = device_id
+        self.chunk = chunk
+        self.chunks = 0
+        self.device_overflows = 0
+        self._shared_pa = pa
+        self._pa = None
+        self._stream = None
+
+    def start(self):
+        import numpy as np
+        import pyaudio
+        self._np = np
+        self._pyaudio = pyaudio
+        self._pa = self._shared_pa or pyaudio.PyAudio()
+        self._stream = self._pa.open(
+            format=pyaudio.paInt16, channels=1, rate=self.rate, input=True,
+            frames_per_buffer=self.chunk, input_device_index=self.device_id,
+            stream_callback=self._callback,
+        )
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if status & self._pyaudio.paInputOverflow:
+            self.device_overflows += 1
+        self.ring.write(self._np.frombuffer(in_data, dtype=self._np.int16))
+        self.chunks += 1
+        return None, self._pyaudio.paContinue
+
+    def stop(self):
+        try:
+            if self._stream is not None:
+                self._stream.stop_stream()
+                self._stream.close()
+        finally:
+            if self._pa is not None and self._pa is not self._shared_pa:
+                self._pa.terminate()
+            self._stream = self._pa = None
+
+class ActionQueue:
+    """Bounded hand-off to the action thread; when full the oldest result is dropped."""
+
+    def __init__(self, size: int):
+        self._items = deque(maxlen=max(1, size))
+        self._cond = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append((time.monotonic(), item))
+            self._cond.notify()
+
+    def get(self):
+        """(enqueued, item), or None once closed and drained."""
+        with self._cond:
+            while not self._items and not self.closed:
+                self._cond.wait()
+            return self._items.popleft() if self._items else None
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+class VoicePipeline:
+    """Capture, inference and decisions on separate threads.
+
+    capture: PortAudio callback -> AudioRing (never waits on anything)
+    inference: the voice thread; classifies ring windows, hands results on
+    action: `handle(res, ts)` on its own thread, so LED writes, broadcasts
+    and logging can stall without delaying inference or the microphone.
+
+    Without pyaudio, or with `ring_capture` off, the SDK's classifier()
+    iterator is used for capture + inference and only actions are split off.
+    A microphone that fails to open makes `devices` (an AudioDevices) list
+    the inputs again next time. `stop` (an Event) ends the ring loop.
+    """
+
+    def __init__(self, handle, queue_size: int, devices: AudioDevices, stop: threading.Event,
+                 ring_capture: bool = True, ring_seconds: float = 2.0, window_hop: float = 0.25, log=None):
+        self.handle = handle
+        self.devices = devices
+        self.stop_event = stop
+        self.ring_capture = ring_capture
+        self.ring_seconds = ring_seconds
+        self.window_hop = window_hop
+        self.log = log
+        self.mode = None
+        self.ring = None
+        self.capture = None
+        self.queue = ActionQueue(queue_size)
+        self.capture_lag = StageStats()
+        self.classify = StageStats()
+        self.action_lag = StageStats()
+        self.action_time = StageStats()
+        self._thread = threading.Thread(target=self._action_loop, name="voice-actions", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Let the action thread finish what is queued, then end it."""
+        self.queue.close()
+        self._thread.join(timeout=2.0)
+
+    def results(self, runner, params: dict, device_id: int | None, classify=None):
+        """Classifier results, from the ring when possible.
+
+        `params` are the runner's model_parameters. `classify(features)`
+        defaults to runner.classify; it is called once per window, so it may
+        switch runners between windows (hot model swap).
+        """
+        if self.ring_capture and hasattr(runner, "classify"):
+            missing = [m for m in ("numpy", "pyaudio") if importlib.util.find_spec(m) is None]
+            if not missing:
+                yield from self._ring_results(classify or runner.classify, params, device_id)
+                return
+            if self.log:
+                self.log(f"Ring capture unavailable (no {', '.join(missing)}); using the SDK classifier")
+        self.mode = "sdk"
+        _iter = runner.classifier(device_id=device_id)
+        with quiet_stderr():
+            try:
+                first_item = next(_iter)
+            except StopIteration:
+                return
+            except Exception as e:
+                self.devices.invalidate(str(e))
+                raise
+        for res, _ in itertools.chain([first_item], _iter):
+            yield res
+
+    def _ring_results(self, classify, params: dict, device_id: int | None):
+        import numpy as np
+        rate = model_rate(params)
+        window = int(params["input_features_count"])
+        hop = max(1, int(window * self.window_hop))
+        self.mode = "ring"
+        self.ring = AudioRing(max(2 * window, int(rate * self.ring_seconds)))
+        self.capture = AudioCapture(self.ring, rate, device_id, pa=self.devices.pa())
+        try:
+            with quiet_stderr():
+                self.capture.start()
+        except Exception as e:
+            # e.g. the microphone was unplugged: list the devices again next time
+            self.devices.invalidate(str(e))
+            raise
+        if self.log:
+            self.log(f"Ring capture: {rate} Hz, window {window}, hop {hop}, ring {self.ring.capacity / rate:.1f}s")
+        out = np.zeros(window, dtype=np.int16)
+        pos = self.ring.written
+        try:
+            while not self.stop_event.is_set():
+                got = self.ring.read(pos, out, timeout=1.0)
+                if got is None:
+                    continue
+                self.capture_lag.record((self.ring.written - got - window) * 1000.0 / rate)
+                yield classify(out.tolist())
+                pos = got + hop
+        finally:
+            self.capture.stop()
+
+    def submit(self, res: dict):
+        timing = res.get("timing") or {}
+        self.classify.record(float(timing.get("dsp", 0)) + float(timing.get("classification", 0)))
+        self.queue.put((time.time(), res))
+
+    def _action_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            enqueued, (ts, res) = item
+            t0 = time.monotonic()
+            self.action_lag.record((t0 - enqueued) * 1000.0)
+            try:
+                self.handle(res, ts)
+            except Exception as e:
+                if self.log:
+                    self.log(f"Voice action failed: {e}")
+            self.action_time.record((time.monotonic() - t0) * 1000.0)
+
+    def snapshot(self) -> dict:
+        capture = {"mode": self.mode}
+        if self.mode == "ring":
+            capture.update({
+                "chunks": self.capture.chunks,
+                "device_overflows": self.capture.device_overflows,
+                "ring_overruns": self.ring.overruns,
+                "ring_seconds": round(self.ring.capacity / self.capture.rate, 2),
+            })
+        return {
+            "capture": capture,
+            "inference": {"lag": self.capture_lag.snapshot(), "classify": self.classify.snapshot()},
+            "action": {
+                "pending": len(self.queue),
+                "dropped": self.queue.dropped,
+                "lag": self.action_lag.snapshot(),
+                "handle": self.action_time.snapshot(),
+            },
+        }
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""Opt-in diagnostics shared by 5-webapp-led, 6-webapp-led-mcu and 9-webapp-led-mcu-voice.
+
+- track_threads(): records when every later thread starts, for the ages in
+  /debug/threads; call it early, before the app starts its threads
+- sample_stacks(): a sampling profiler over all threads, as collapsed stacks
+- thread_report(): live threads with their age and where they are
+- install_debug_api(): GET /debug/profile and /debug/threads (404 unless enabled)
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from weakref import WeakKeyDictionary
+
+from flask import Response, jsonify, request
+
+PROCESS_START = time.time()
+
+_thread_started = WeakKeyDictionary()
+_thread_start = threading.Thread.start
+
+def _start_tracked(self, *args, **kwargs):
+    _thread_started[self] = time.time()
+    return _thread_start(self, *args, **kwargs)
+
+def track_threads():
+    threading.Thread.start = _start_tracked
+
+profile_lock = threading.Lock()
+
+def _thread_kind(name: str) -> str:
+    """'Thread-12 (process_request_thread)' -> 'Thread-N (process_request_thread)'"""
+    return re.sub(r"\d+", "N", name)
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def sample_stacks(seconds: float, interval: float) -> tuple[Counter, int]:
+    """Sample every other thread's stack; returns collapsed stacks and sample count."""
+    me = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: _thread_kind(t.name) for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            parts = []
+            while frame is not None:
+                parts.append(_frame_label(frame))
+                frame = frame.f_back
+            parts.append(names.get(ident, "unknown"))
+            stacks[";".join(reversed(parts))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+def thread_report() -> dict:
+    now = time.time()
+    frames = sys._current_frames()
+    threads = []
+    for t in threading.enumerate():
+        started = PROCESS_START if t is threading.main_thread() else _thread_started.get(t)
+        frame = frames.get(t.ident)
+        threads.append({
+            "name": t.name,
+            "ident": t.ident,
+            "native_id": t.native_id,
+            "daemon": t.daemon,
+            "age_s": round(now - started, 1) if started else None,
+            "where": _frame_label(frame) if frame is not None else None,
+        })
+    threads.sort(key=lambda t: -(t["age_s"] or 0))
+    return {
+        "count": len(threads),
+        "by_kind": dict(Counter(_thread_kind(t["name"]) for t in threads).most_common()),
+        "threads": threads,
+    }
+
+def install_debug_api(app, enabled: bool):
+    """Add GET /debug/profile and /debug/threads to a Flask app; both 404 unless `enabled`."""
+
+    def debug_profile():
+        """Collapsed stacks of all threads (flamegraph.pl / speedscope input)"""
+        if not enabled:
+            return ("Not Found", 404)
+        try:
+            seconds = min(120.0, max(0.1, float(request.args.get("seconds", 5))))
+            hz = min(1000.0, max(1.0, float(request.args.get("hz", 100))))
+        except ValueError:
+            return jsonify({"error": "invalid seconds or hz"}), 400
+        if not profile_lock.acquire(blocking=False):
+            return jsonify({"error": "a profile is already running"}), 409
+        try:
+            stacks, samples = sample_stacks(seconds, 1.0 / hz)
+        finally:
+            profile_lock.release()
+        body = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        return Response(body, mimetype="text/plain", headers={"X-Profile-Samples": str(samples)})
+
+    def debug_threads():
+        """Live threads with their age, oldest first"""
+        if not enabled:
+            return ("Not Found", 404)
+        return jsonify(thread_report())
+
+    app.add_url_rule("/debug/profile", "debug_profile", debug_profile)
+    app.add_url_rule("/debug/threads", "debug_threads", debug_threads)
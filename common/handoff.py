@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""Listening-socket handoff: restart a web app without refusing connections.
+
+Supervisor, as the container's command:
+
+    python3 handoff.py -- python3 webapp-led.py
+
+binds PORT once and runs the app with that socket inherited (LISTEN_FD).
+On SIGHUP it starts a second copy of the app, waits until the copy reports
+ready (READY_FD), then sends the old copy SIGTERM: it stops accepting,
+closes its /status streams with a jittered reconnect hint and exits. The
+socket never closes, so connections made during the switch wait in its
+backlog instead of being refused. The two copies overlap until the old
+one has exited: work only one copy may do (a scheduler, the microphone,
+background MCU traffic) waits for wait_takeover(), which returns once the
+old copy is gone. An app that exits on its own is started
+again with backoff, unless its exit code is one of --exit-on: then the
+supervisor exits with that code too, so the container restarts (the MCU
+apps exit with 3 when the flashed firmware is not theirs). SIGTERM or
+SIGINT stop the app and the supervisor.
+
+App side: make_server(..., fd=listen_fd()), stop_on_sigterm(server), then
+notify_ready() once warmed up; after_takeover(fn) for the exclusive work.
+Without the supervisor the app binds PORT itself as before, notify_ready()
+does nothing and wait_takeover() returns at once.
+"""
+
+import argparse
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+def log(msg: str):
+    print(f"[HANDOFF] {msg}", file=sys.stderr, flush=True)
+
+# App side
+
+def listen_fd() -> int | None:
+    """Listening socket inherited from the supervisor, for make_server(fd=...)."""
+    fd = os.getenv("LISTEN_FD", "")
+    return int(fd) if fd.isdigit() else None
+
+def notify_ready():
+    """Tell the supervisor this copy is warmed up and can take the traffic."""
+    fd = os.environ.pop("READY_FD", "")
+    if not fd.isdigit():
+        return
+    try:
+        os.write(int(fd), b"1")
+        os.close(int(fd))
+    except OSError:
+        pass
+
+_takeover = threading.Event()
+_takeover_lock = threading.Lock()
+_takeover_started = False
+_took_over = False
+
+def _read_takeover(fd: int):
+    global _took_over
+    try:
+        # b"1" once the old copy has exited; EOF if this copy is not taking over
+        _took_over = os.read(fd, 1) == b"1"
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+        _takeover.set()
+
+def wait_takeover() -> bool:
+    """Block until the copy this one replaces has exited.
+
+    False if this copy is not taking over (it did not get ready and is
+    being stopped): skip the exclusive work then.
+    """
+    global _takeover_started, _took_over
+    with _takeover_lock:
+        if not _takeover_started:
+            _takeover_started = True
+            fd = os.environ.pop("TAKEOVER_FD", "")
+            if fd.isdigit():
+                threading.Thread(target=_read_takeover, args=(int(fd),), name="takeover", daemon=True).start()
+            else:
+                _took_over = True
+                _takeover.set()
+    _takeover.wait()
+    return _took_over
+
+def after_takeover(fn):
+    """Run `fn()` on a thread once wait_takeover() says this copy took over."""
+    def _run():
+        if wait_takeover():
+            fn()
+
+    threading.Thread(target=_run, name="after-takeover", daemon=True).start()
+
+def stop_on_sigterm(server):
+    """SIGTERM makes server.serve_forever() return, so the caller can drain."""
+    def _handler(signum, frame):
+        # shutdown() waits for the serve loop, which runs in this thread
+        threading.Thread(target=server.shutdown, name="shutdown", daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _handler)
+
+# Supervisor
+
+class Supervisor:
+    def __init__(self, sock: socket.socket, command: list, ready_timeout: float, stop_timeout: float,
+                 exit_on=()):
+        self.sock = sock
+        self.command = command
+        self.ready_timeout = ready_timeout
+        self.stop_timeout = stop_timeout
+        self.exit_on = frozenset(exit_on)
+        self.exit_code = None
+        self.active = None
+        self.upgrade_requested = False
+        self.stop_requested = False
+
+    def _spawn(self) -> tuple[subprocess.Popen, int, int]:
+        """Start a copy; returns it, its ready pipe and its takeover pipe (see _hand_over)."""
+        ready_r, ready_w = os.pipe()
+        takeover_r, takeover_w = os.pipe()
+        env = dict(os.environ, LISTEN_FD=str(self.sock.fileno()), READY_FD=str(ready_w),
+                   TAKEOVER_FD=str(takeover_r))
+        proc = subprocess.Popen(self.command, env=env, pass_fds=(self.sock.fileno(), ready_w, takeover_r))
+        os.close(ready_w)
+        os.close(takeover_r)
+        log(f"started pid {proc.pid}")
+        return proc, ready_r, takeover_w
+
+    @staticmethod
+    def _hand_over(takeover_w: int, took_over: bool):
+        """Tell a copy whether it now runs alone (b"1") or is not taking over (EOF)."""
+        try:
+            if took_over:
+                os.write(takeover_w, b"1")
+        except OSError:
+            pass
+        finally:
+            os.close(takeover_w)
+
+    def _wait_ready(self, proc: subprocess.Popen, ready_r: int) -> bool:
+        """True once `proc` wrote its ready byte; False if it exited or timed out."""
+        try:
+            deadline = time.monotonic() + self.ready_timeout
+            while not self.stop_requested:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    log(f"pid {proc.pid} not ready after {self.ready_timeout:.0f}s")
+                    return False
+                readable, _, _ = select.select([ready_r], [], [], min(remaining, 0.5))
+                if readable:
+                    # EOF (b"") means the app exited before it was ready
+                    return os.read(ready_r, 1) == b"1"
+            return False
+        finally:
+            os.close(ready_r)
+
+    def _stop(self, proc: subprocess.Popen):
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(self.stop_timeout)
+        except subprocess.TimeoutExpired:
+            log(f"pid {proc.pid} did not stop in {self.stop_timeout:.0f}s, killing it")
+            proc.kill()
+            proc.wait()
+
+    def _start(self) -> bool:
+        proc, ready_r, takeover_w = self._spawn()
+        self.active = proc
+        self._hand_over(takeover_w, True)     # no other copy is running
+        if self._wait_ready(proc, ready_r):
+            log(f"pid {proc.pid} ready")
+            return True
+        return False
+
+    def _upgrade(self):
+        self.upgrade_requested = False
+        old = self.active
+        proc, ready_r, takeover_w = self._spawn()
+        if not self._wait_ready(proc, ready_r):
+            self._hand_over(takeover_w, False)
+            self._stop(proc)
+            if proc.returncode in self.exit_on:
+                log(f"new copy pid {proc.pid} exited with {proc.returncode}, stopping")
+                self.exit_code = proc.returncode
+                self.stop_requested = True
+                return
+            log(f"new copy pid {proc.pid} failed, pid {old.pid} keeps serving")
+            return
+        self.active = proc
+        log(f"pid {proc.pid} took over from pid {old.pid}")
+        threading.Thread(target=self._retire, args=(old, takeover_w), name="handoff-drain", daemon=True).start()
+
+    def _retire(self, old: subprocess.Popen, takeover_w: int):
+        """Stop the old copy, then let the new one start its exclusive work."""
+        self._stop(old)
+        self._hand_over(takeover_w, True)
+
+    def run(self) -> int:
+        backoff = 1.0
+        self._start()
+        while not self.stop_requested:
+            if self.active.poll() is not None:
+                if self.active.returncode in self.exit_on:
+                    log(f"pid {self.active.pid} exited with {self.active.returncode}, stopping")
+                    return self.active.returncode
+                log(f"pid {self.active.pid} exited with {self.active.returncode}, restarting in {backoff:.0f}s")
+                time.sleep(backoff)
+                if self.stop_requested:
+                    break
+                backoff = 1.0 if self._start() else min(30.0, backoff * 2)
+            elif self.upgrade_requested:
+                self._upgrade()
+            time.sleep(0.2)
+        self._stop(self.active)
+        if self.exit_code is not None:
+            return self.exit_code
+        return self.active.returncode or 0
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--ready-timeout", type=float, default=120.0, help="seconds a new copy may take to warm up")
+    parser.add_argument("--stop-timeout", type=float, default=10.0, help="seconds a copy may take to drain")
+    parser.add_argument("--exit-on", type=int, action="append", default=[], metavar="CODE",
+                        help="app exit code that stops the supervisor instead of a restart (repeatable)")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="-- app command line")
+    args = parser.parse_args(argv)
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("missing app command")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(128)
+    log(f"listening on {args.host}:{args.port}; SIGHUP hands it to a new copy of: {' '.join(command)}")
+
+    supervisor = Supervisor(sock, command, args.ready_timeout, args.stop_timeout, args.exit_on)
+
+    def _upgrade(signum, frame):
+        supervisor.upgrade_requested = True
+
+    def _stop(signum, frame):
+        supervisor.stop_requested = True
+
+    signal.signal(signal.SIGHUP, _upgrade)
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    return supervisor.run()
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
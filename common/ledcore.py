@@ -0,0 +1,621 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""LED output and status fan-out shared by the LED labs.
+
+Used by 5-webapp-led, 6-webapp-led-mcu, 8-led-voice and
+9-webapp-led-mcu-voice. The Dockerfiles copy this file next to the app (see
+the `common` build context in their READMEs); when an app runs from a
+checkout it is imported from this folder instead.
+
+- COLORS: every color resolved once to the sysfs LEDs, brightness levels and
+  MCU RGB mask it lights
+- SysfsBackend, BridgeBackend, NullBackend: where a color goes
+- BridgeBreaker: circuit breaker in front of the MCU Bridge
+- LedOutput: shows a color on all of its backends, with batch() to coalesce
+- confirm_firmware(): checks the sketch start.sh trusted without openocd
+- McuReconciler: checks now and then that the MCU still shows what was sent
+- StatusHub: the /status Server-Sent Events fan-out, and the versioned
+  state behind /api/state long-polls
+- compressed(): per-stream gzip/deflate for a /status response
+"""
+
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import NamedTuple
+from weakref import WeakSet
+
+SYSFS_ROOT = os.getenv("LED_SYSFS_ROOT", "/sys/class/leds")
+
+# sysfs LED names; both sets mirror the same color
+SYSTEM_LEDS = ("blue", "green", "red")
+SYSFS_LEDS = {
+    "set1": {"blue": "blue:user", "green": "green:user", "red": "red:user"},
+    "set2": {"blue": "blue:bt", "green": "green:wlan", "red": "red:panic"},
+}
+
+# MCU RGB LEDs, in the bit order of the sketch's set_rgb_leds(mask)
+MCU_LEDS = ("led3_r", "led3_g", "led3_b", "led4_r", "led4_g", "led4_b")
+MCU_BITS = {led: 1 << i for i, led in enumerate(MCU_LEDS)}
+
+class ColorEntry(NamedTuple):
+    name: str
+    system: frozenset   # sysfs LED names lit
+    levels: dict        # sysfs LED name -> brightness 0.0-1.0
+    mcu: tuple          # MCU LED names lit
+    mask: int           # set_rgb_leds argument
+
+def _entry(name: str, system: tuple) -> ColorEntry:
+    mcu = tuple(f"led{n}_{c[0]}" for n in (3, 4) for c in system)
+    return ColorEntry(
+        name=name,
+        system=frozenset(system),
+        levels={led: (1.0 if led in system else 0.0) for led in SYSTEM_LEDS},
+        mcu=mcu,
+        mask=sum(MCU_BITS[led] for led in mcu),
+    )
+
+COLORS = {
+    "blue": _entry("blue", ("blue",)),
+    "green": _entry("green", ("green",)),
+    "red": _entry("red", ("red",)),
+    "yellow": _entry("yellow", ("red", "green")),
+    "purple": _entry("purple", ("red", "blue")),
+    "off": _entry("off", ()),
+}
+
+def lookup(color) -> ColorEntry | None:
+    """COLORS entry for a color name (any case) or None; entries pass through."""
+    if isinstance(color, ColorEntry):
+        return color
+    return COLORS.get((color or "").lower())
+
+def mcu_states(mask: int) -> dict:
+    return {led: bool(mask & bit) for led, bit in MCU_BITS.items()}
+
+class SysfsLed:
+    """Persistent handle to one sysfs LED; only writes when the value changes."""
+
+    def __init__(self, path: str, log=None):
+        self.path = path
+        self.log = log
+        self.fd = None
+        self.value = None
+        self.max_brightness = 1
+        try:
+            with open(os.path.join(os.path.dirname(path), "max_brightness")) as f:
+                self.max_brightness = max(1, int(f.read().strip()))
+        except (OSError, ValueError):
+            pass
+
+    def write(self, value: int):
+        if value == self.value:
+            return
+        try:
+            if self.fd is None:
+                self.fd = os.open(self.path, os.O_WRONLY)
+            os.pwrite(self.fd, str(value).encode(), 0)
+            self.value = value
+        except OSError as e:
+            if self.log:
+                self.log(f"[LED] could not set {self.path} -> {value}: {e}")
+            self.close()
+
+    def set_level(self, level: float):
+        self.write(round(max(0.0, min(1.0, level)) * self.max_brightness))
+
+    @property
+    def level(self) -> float:
+        """Brightness as last written (0.0-1.0)."""
+        return (self.value or 0) / self.max_brightness
+
+    def close(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+        self.fd = None
+        self.value = None
+
+class SysfsBackend:
+    """The board's sysfs LEDs, one SysfsLed per LED of every set."""
+
+    name = "sysfs"
+
+    def __init__(self, root: str = SYSFS_ROOT, sets: dict = SYSFS_LEDS, log=None):
+        self.sets = {
+            target: {led: SysfsLed(os.path.join(root, name, "brightness"), log)
+                     for led, name in names.items()}
+            for target, names in sets.items()
+        }
+
+    def apply(self, entry: ColorEntry):
+        for target in self.sets:
+            self.set_levels(target, entry.levels)
+
+    def set_levels(self, target: str, levels: dict):
+        for led, handle in self.sets[target].items():
+            handle.set_level(levels.get(led, 0.0))
+
+    def levels(self, target: str) -> dict:
+        return {led: handle.level for led, handle in self.sets[target].items()}
+
+    def snapshot(self) -> dict:
+        return {target: {led: h.value for led, h in leds.items()} for target, leds in self.sets.items()}
+
+    def close(self):
+        for leds in self.sets.values():
+            for handle in leds.values():
+                handle.close()
+
+class BridgeBackend:
+    """The MCU RGB LEDs: one set_rgb_leds(mask) per change.
+
+    `call(function_name, *args)` is the app's Bridge wrapper (breaker, async
+    dispatch); this backend only decides when a call is needed.
+    """
+
+    name = "bridge"
+
+    def __init__(self, call, function: str = "set_rgb_leds"):
+        self.call = call
+        self.function = function
+        self.mask = 0
+        self.calls = 0
+
+    def apply(self, entry: ColorEntry):
+        self.set_mask(entry.mask)
+
+    def set_mask(self, mask: int):
+        if mask != self.mask:
+            self.mask = mask
+            self.repush()
+
+    def repush(self):
+        """Send the current mask again (after a reconnect or a blink)."""
+        self.calls += 1
+        self.call(self.function, self.mask)
+
+    def snapshot(self) -> dict:
+        return {"mask": self.mask, "leds": mcu_states(self.mask), "calls": self.calls}
+
+class BridgeUnavailable(Exception):
+    pass
+
+class BridgeBreaker:
+    """Circuit breaker around Bridge.call.
+
+    After `threshold` consecutive failures the circuit opens: calls fail fast
+    (no thread, no socket) while a single probe thread retries with
+    exponential backoff ("half-open" while a probe is in flight). The first
+    successful probe closes the circuit and runs `on_recover` once, so the
+    MCU gets the latest desired state instead of a replay of lost calls.
+
+    `bridge_call(function_name, *args)` is the raw Bridge call; failed
+    probes go to `log_debug`, state changes to `log`.
+    """
+
+    def __init__(self, bridge_call, threshold: int = 3, backoff_min: float = 1.0,
+                 backoff_max: float = 30.0, probe: str = "get_sketch_id", log=None, log_debug=None):
+        self.bridge_call = bridge_call
+        self.log = log
+        self.log_debug = log_debug
+        self.threshold = max(1, threshold)
+        self.backoff_min = backoff_min
+        self.backoff_max = max(backoff_min, backoff_max)
+        self.probe = probe
+        self.state = "closed"
+        self.failures = 0
+        self.fast_failed = 0
+        self.on_change = None
+        self.on_recover = None
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        return self.state == "closed"
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        self.fast_failed += 1
+        return False
+
+    def call(self, function_name, *args):
+        if not self.allow():
+            raise BridgeUnavailable(f"Bridge {self.state}, skipped {function_name}")
+        try:
+            result = self.bridge_call(function_name, *args)
+        except Exception:
+            self._failure()
+            raise
+        if self.failures:
+            self.failures = 0
+        return result
+
+    def _failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state != "closed" or self.failures < self.threshold:
+                return
+            self.state = "open"
+        if self.log:
+            self.log(f"Bridge circuit open after {self.failures} failures")
+        threading.Thread(target=self._probe_loop, name="bridge-probe", daemon=True).start()
+        self._notify()
+
+    def _probe_loop(self):
+        backoff = self.backoff_min
+        while True:
+            time.sleep(backoff)
+            self.state = "half-open"
+            try:
+                self.bridge_call(self.probe)
+                break
+            except Exception as e:
+                if self.log_debug:
+                    self.log_debug(f"Bridge probe failed: {e}")
+                self.state = "open"
+                backoff = min(backoff * 2, self.backoff_max)
+
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+        if self.log:
+            self.log(f"Bridge recovered ({self.fast_failed} calls skipped while down)")
+        self.fast_failed = 0
+        self._notify()
+        if self.on_recover:
+            try:
+                self.on_recover()
+            except Exception as e:
+                if self.log:
+                    self.log(f"Bridge recovery push failed: {e}")
+
+    def _notify(self):
+        if self.on_change:
+            try:
+                self.on_change()
+            except Exception:
+                pass
+
+SKETCH_ID_FILE = "/app/sketch/sketch.id"
+FW_STATE_FILE = "/var/lib/fw-state/fingerprint"
+
+def confirm_firmware(call, sketch_id_file: str = SKETCH_ID_FILE, attempts: int = 5,
+                     delay: float = 2.0, log=None):
+    """Confirm the fingerprint start.sh trusted with a cheap get_sketch_id call.
+
+    Only runs when start.sh skipped the openocd verification (FW_FAST_PATH=1).
+    If the MCU reports another sketch, the fingerprint is dropped and the
+    process exits with 3, so the container restarts into the full
+    verify/flash path. A Bridge that does not answer (e.g. the router is
+    still starting) proves nothing either way: that is logged and the
+    fingerprint is kept.
+    """
+    if os.getenv("FW_FAST_PATH") != "1":
+        return
+    try:
+        with open(sketch_id_file) as f:
+            expected = f.read().strip()
+    except OSError as e:
+        if log:
+            log(f"Firmware check skipped: {e}")
+        return
+
+    reported = error = None
+    for _ in range(attempts):
+        try:
+            reported = str(call("get_sketch_id")).strip()
+            break
+        except Exception as e:
+            error = e
+            time.sleep(delay)
+
+    if reported is None:
+        if log:
+            log(f"Firmware check skipped: no get_sketch_id answer after {attempts} tries ({error})")
+        return
+    if reported == expected:
+        if log:
+            log(f"Firmware confirmed: {reported}")
+        return
+
+    if log:
+        log(f"Firmware mismatch (expected {expected}, MCU reports {reported}); forcing full verification")
+    try:
+        os.remove(os.getenv("FW_STATE_FILE", FW_STATE_FILE))
+    except OSError:
+        pass
+    os._exit(3)
+
+def parse_mcu_state(reply) -> dict:
+    """The sketch's get_state reply "<rgb mask>,<matrix hex>" as {"leds", "matrix"}."""
+    mask, _, matrix = str(reply).strip().partition(",")
+    return {"leds": int(mask), "matrix": int(matrix, 16)}
+
+class McuReconciler:
+    """Re-pushes MCU state only when the MCU disagrees with the app.
+
+    Bridge calls are fire-and-forget and the MCU can be reset under the app,
+    so every `interval` seconds `read()` fetches the sketch's get_state reply
+    (about 35 bytes, against 200+ for get_matrix) and compares it with
+    `expected()`, a dict of the parts the app owns ("leds", "matrix"). A part
+    that differs is read again after `confirm` seconds, so a call still in
+    flight is not taken for drift: only a part that still differs from an
+    unchanged expectation is counted and re-pushed with `repush[part]()`.
+    """
+
+    def __init__(self, read, expected, repush: dict, interval: float = 10.0,
+                 confirm: float = 1.0, log=None):
+        self.read = read
+        self.expected = expected
+        self.repush = repush
+        self.interval = interval
+        self.confirm = confirm
+        self.log = log
+        self.checks = 0
+        self.errors = 0
+        self.mismatches = dict.fromkeys(repush, 0)
+        self.last = None
+        self._thread = None
+
+    def _diff(self) -> dict:
+        want = self.expected()
+        got = parse_mcu_state(self.read())
+        return {part: value for part, value in want.items() if got.get(part) != value}
+
+    def check(self) -> str:
+        """One round: "ok", "mismatch" (re-pushed), "busy" (state moved) or "error"."""
+        self.checks += 1
+        try:
+            first = self._diff()
+            if first:
+                time.sleep(self.confirm)
+                second = self._diff()
+                drifted = [part for part, value in first.items() if second.get(part) == value]
+                self.last = "mismatch" if drifted else "busy"
+                for part in drifted:
+                    self.mismatches[part] += 1
+                    if self.log:
+                        self.log(f"[MCU] {part} out of sync, re-pushing")
+                    self.repush[part]()
+            else:
+                self.last = "ok"
+        except Exception as e:
+            self.errors += 1
+            if self.log and self.last != "error":
+                self.log(f"[MCU] state check failed: {e}")
+            self.last = "error"
+        return self.last
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="mcu-reconcile", daemon=True)
+            self._thread.start()
+
+    def snapshot(self) -> dict:
+        return {
+            "interval_s": self.interval,
+            "checks": self.checks,
+            "mismatches": dict(self.mismatches),
+            "errors": self.errors,
+            "last": self.last,
+        }
+
+class NullBackend:
+    """Accepts every color and only remembers it; for tests and benchmarks."""
+
+    name = "null"
+
+    def __init__(self):
+        self.last = None
+        self.applied = 0
+
+    def apply(self, entry: ColorEntry):
+        self.last = entry
+        self.applied += 1
+
+    def snapshot(self) -> dict:
+        return {"last": self.last.name if self.last else None, "applied": self.applied}
+
+class LedOutput:
+    """Shows a color on every backend.
+
+    Inside `with output.batch():` show() only records the color; the last one
+    is written once when the outermost batch exits.
+    """
+
+    def __init__(self, *backends):
+        self.backends = backends
+        self.color = None
+        self._pending = None
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    def show(self, color) -> ColorEntry | None:
+        """Show a color name or COLORS entry; returns None for unknown colors."""
+        entry = lookup(color)
+        if entry is None:
+            return None
+        with self._lock:
+            if self._depth:
+                self._pending = entry
+            else:
+                self._apply(entry)
+        return entry
+
+    @contextmanager
+    def batch(self):
+        with self._lock:
+            self._depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._depth -= 1
+                if not self._depth and self._pending is not None:
+                    entry, self._pending = self._pending, None
+                    self._apply(entry)
+
+    def _apply(self, entry: ColorEntry):
+        for backend in self.backends:
+            backend.apply(entry)
+        self.color = entry
+
+    def backend(self, name: str):
+        return next((b for b in self.backends if b.name == name), None)
+
+    def snapshot(self) -> dict:
+        return {
+            "color": self.color.name if self.color else None,
+            "backends": {b.name: b.snapshot() for b in self.backends},
+        }
+
+class StatusHub:
+    """Fan-out of status payloads to /status streams and /api/state polls.
+
+    Each payload is serialized once per broadcast, not once per subscriber.
+    `connections` is the set of subscriber queues; callers add to it (e.g.
+    through their admission control) and stream() removes on disconnect.
+
+    A new stream starts with a snapshot for that client only, so a wave of
+    reconnects costs one event each instead of a broadcast each.
+
+    Every event gets a new `seq`, but `version` only moves when the payload
+    differs from the last one, so pollers are not woken by repeats. Long-
+    pollers park on one Condition; at most `max_waiters` park at once, the
+    rest are answered right away.
+    """
+
+    def __init__(self, max_waiters: int = 0):
+        self.connections = WeakSet()
+        self._seq = itertools.count(1)
+        # ETags carry the epoch so a version from before a restart never matches
+        self.epoch = format(int(time.time()), "x")
+        self.version = 0
+        self.state = {}
+        self.max_waiters = max_waiters
+        self.waiters = 0
+        self.seq = 0
+        self.draining = False
+        self._retry_ms = (0, 0)
+        self._cond = threading.Condition()
+
+    def publish(self, payload: dict) -> int:
+        seq = self.seq = next(self._seq)
+        with self._cond:
+            if payload != self.state:
+                self.state = dict(payload)
+                self.version += 1
+                self._cond.notify_all()
+        if not self.connections:
+            return seq
+        event = self._event(payload, seq)
+        for q in list(self.connections):
+            q.put(event)
+        return seq
+
+    @staticmethod
+    def _event(payload: dict, seq: int) -> str:
+        return f"data: {json.dumps({**payload, 'seq': seq})}\n\n"
+
+    def _retry_event(self) -> str:
+        # EventSource waits `retry` ms before reconnecting; spread them out
+        return f"retry: {random.randint(*self._retry_ms)}\n\n"
+
+    def stream(self, q, snapshot=None):
+        """Generator for a Response; starts with `snapshot()` for this client only."""
+        try:
+            if self.draining:
+                yield self._retry_event()
+                return
+            if snapshot:
+                # the last seq sent, so other clients' seq stays gap-free
+                yield self._event(snapshot(), self.seq)
+            while True:
+                event = q.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.connections.discard(q)
+
+    def drain(self, retry_ms: tuple[int, int], timeout: float) -> int:
+        """Close every stream with a random reconnect delay in `retry_ms`.
+
+        Parked long-polls return at once. Returns how many streams were
+        still open after `timeout` seconds.
+        """
+        self._retry_ms = (min(retry_ms), max(retry_ms))
+        with self._cond:
+            self.draining = True
+            self._cond.notify_all()
+        for q in list(self.connections):
+            q.put(self._retry_event())
+            q.put(None)
+        deadline = time.monotonic() + timeout
+        while self.connections and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return len(self.connections)
+
+    def wait(self, since: int | None, timeout: float) -> tuple[int, dict]:
+        """(version, state) once the version differs from `since`, or at `timeout`."""
+        with self._cond:
+            if (since == self.version and timeout > 0 and not self.draining
+                    and (not self.max_waiters or self.waiters < self.max_waiters)):
+                self.waiters += 1
+                try:
+                    self._cond.wait_for(lambda: self.version != since or self.draining, timeout)
+                finally:
+                    self.waiters -= 1
+            return self.version, self.state
+
+    def etag(self, version: int) -> str:
+        return f"{self.epoch}-{version}"
+
+    def version_from_etag(self, tags) -> int | None:
+        """Version named by an If-None-Match tag of this process, if any."""
+        for tag in tags:
+            epoch, _, version = tag.partition("-")
+            if epoch == self.epoch and version.isdigit():
+                return int(version)
+        return None
+
+# /status compression. Events repeat the same keys and matrix, so a window
+# of a few events is enough; 4 KiB window + memLevel 5 is ~32 KiB of zlib
+# state per stream, whatever the stream's length.
+SSE_WBITS = 12
+SSE_MEMLEVEL = 5
+SSE_ENCODINGS = {"gzip": 16 + SSE_WBITS, "deflate": SSE_WBITS}
+
+def compressed(events, encoding: str, level: int = 6):
+    """Compress a stream of SSE events with one context for the whole stream.
+
+    Each event is followed by a sync flush, so the client can decode it as
+    soon as it arrives; later events compress against the earlier ones.
+    """
+    stream = zlib.compressobj(level, zlib.DEFLATED, SSE_ENCODINGS[encoding], SSE_MEMLEVEL)
+    try:
+        for event in events:
+            yield stream.compress(event.encode()) + stream.flush(zlib.Z_SYNC_FLUSH)
+        yield stream.flush()
+    finally:
+        # runs the inner generator's cleanup when the client goes away
+        if hasattr(events, "close"):
+            events.close()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""Admission control shared by 5-webapp-led, 6-webapp-led-mcu and 9-webapp-led-mcu-voice.
+
+- Admission: token buckets per client and route class, and a cap on open
+  /status streams; Admission.from_env() reads the limits below
+- too_many(): the 429 response, with Retry-After
+- install_admission(): rate-limits every request before its view runs and
+  adds GET /api/admission (limits, open streams, rejections)
+
+The limits come from each app's environment: RATE_<CLASS>_PER_SECOND and
+RATE_<CLASS>_BURST per route class, and SSE_MAX_SUBSCRIBERS (see the app
+READMEs).
+"""
+
+import math
+import threading
+import time
+from collections import Counter
+from queue import Queue
+from weakref import WeakSet
+
+from flask import jsonify, request
+
+# route class: (requests per second, burst); a rate of 0 disables the limit
+LIMITS = {
+    "command": (10.0, 20.0),
+    "status": (0.5, 5.0),
+    "asset": (20.0, 60.0),
+}
+MAX_SUBSCRIBERS = 32
+
+class Admission:
+    """Per (client address, route class) token buckets and a /status cap.
+
+    `take` runs in before_request, before the body is read or parsed, so a
+    rejected request costs a dict lookup and a small 429. Idle buckets that
+    have refilled are pruned once there are more than `max_clients`.
+    """
+
+    def __init__(self, limits: dict, max_subscribers: int, max_clients: int = 4096):
+        self.limits = limits
+        self.max_subscribers = max_subscribers
+        self.max_clients = max_clients
+        self.rejected = Counter()
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, env_float) -> "Admission":
+        """LIMITS and MAX_SUBSCRIBERS, overridden by the environment.
+
+        `env_float(name, default)` is the app's reader, so a bad value is
+        logged the app's way.
+        """
+        limits = {
+            kind: (env_float(f"RATE_{kind.upper()}_PER_SECOND", rate), env_float(f"RATE_{kind.upper()}_BURST", burst))
+            for kind, (rate, burst) in LIMITS.items()
+        }
+        return cls(limits, int(env_float("SSE_MAX_SUBSCRIBERS", MAX_SUBSCRIBERS)))
+
+    def take(self, client: str, kind: str) -> float:
+        """0 if admitted, else seconds until the client's next token."""
+        rate, burst = self.limits[kind]
+        if rate <= 0:
+            return 0.0
+        key = (client, kind)
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1.0:
+                self._buckets[key] = (tokens - 1.0, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                self.rejected[kind] += 1
+                wait = (1.0 - tokens) / rate
+            if len(self._buckets) > self.max_clients:
+                self._prune(now)
+        return wait
+
+    def _prune(self, now: float):
+        for key, (tokens, last) in list(self._buckets.items()):
+            rate, burst = self.limits[key[1]]
+            if tokens + (now - last) * rate >= burst:
+                del self._buckets[key]
+
+    def subscribe(self, connections: WeakSet, q: Queue) -> bool:
+        """Add a /status queue unless `max_subscribers` streams are open."""
+        with self._lock:
+            if self.max_subscribers > 0 and len(connections) >= self.max_subscribers:
+                self.rejected["subscribers"] += 1
+                return False
+            connections.add(q)
+            return True
+
+    def snapshot(self, connections: WeakSet) -> dict:
+        with self._lock:
+            clients = len({client for client, _ in self._buckets})
+            rejected = dict(self.rejected)
+        return {
+            "limits": {kind: {"per_second": rate, "burst": burst} for kind, (rate, burst) in self.limits.items()},
+            "subscribers": len(connections),
+            "max_subscribers": self.max_subscribers,
+            "clients": clients,
+            "rejected": rejected,
+        }
+
+
+def too_many(wait: float):
+    retry = max(1, math.ceil(wait))
+    return jsonify({"error": "too many requests", "retry_after": retry}), 429, {"Retry-After": str(retry)}
+
+def install_admission(app, admission: Admission, hub, stream_endpoint: str = "status_stream"):
+    """Check `admission` before every view of a Flask app and add GET /api/admission.
+
+    `hub` is the ledcore.StatusHub whose connections are the /status streams;
+    `stream_endpoint` is the view that serves them.
+    """
+
+    def admit():
+        """Rate-limit by client and route class before the view reads the body"""
+        if request.endpoint == stream_endpoint:
+            kind = "status"
+        elif request.method in ("POST", "DELETE"):
+            kind = "command"
+        else:
+            kind = "asset"
+        wait = admission.take(request.remote_addr or "", kind)
+        if wait:
+            return too_many(wait)
+
+    def api_admission():
+        """Rate limits, open /status streams and rejection counters"""
+        return jsonify(admission.snapshot(hub.connections))
+
+    app.before_request(admit)
+    app.add_url_rule("/api/admission", "api_admission", api_admission)
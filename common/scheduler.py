@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""Timed and recurring LED actions: one thread, one timer heap.
+
+Used by 5-webapp-led, 6-webapp-led-mcu and 9-webapp-led-mcu-voice behind
+/api/schedule. A job is an action (e.g. {"color": "red"}) plus when to run
+it:
+
+- "at": "HH:MM" every day, local time
+- "in": seconds from now, once
+- "every": seconds, repeating (first run after "in", or after "every")
+- "for": seconds; run(action) returns the action that undoes it, which is
+  scheduled as a restore job. A second "for" job on the same slot (the
+  action's first key, e.g. "color") takes over the pending restore, so
+  overlapping flashes end on the state from before the first one.
+
+Every pending run is one heap entry keyed on a time.monotonic() deadline;
+the thread sleeps until the earliest one, so idle jobs cost no thread and
+no CPU. Cancelled or rescheduled entries are dropped when they reach the
+top. Daily jobs follow the wall clock: while there are any, the thread also
+wakes once a minute and re-aims them if the clock was set (NTP at boot).
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+
+CLOCK_CHECK_SECONDS = 60.0
+CLOCK_SLACK_SECONDS = 2.0
+
+def next_daily(at: str, now: float) -> float:
+    """Next wall-clock time (epoch) after `now` for a local "HH:MM"."""
+    hour, _, minute = at.partition(":")
+    t = time.localtime(now)
+    for day in (t.tm_mday, t.tm_mday + 1):
+        # mktime normalizes day overflow and picks DST itself (-1)
+        when = time.mktime((t.tm_year, t.tm_mon, day, int(hour), int(minute), 0, 0, 0, -1))
+        if when > now:
+            return when
+    return when
+
+def parse_daily(at) -> str:
+    hour, sep, minute = str(at).partition(":")
+    if not (sep and hour.isdigit() and minute.isdigit() and int(hour) < 24 and int(minute) < 60):
+        raise ValueError("at must be HH:MM")
+    return f"{int(hour):02d}:{int(minute):02d}"
+
+class Job:
+    FIELDS = ("id", "action", "at", "every", "duration", "name", "restore", "next", "runs")
+
+    def __init__(self, id: int, action: dict, at: str = None, every: float = None,
+                 duration: float = None, name: str = "", restore: bool = False,
+                 next: float = 0.0, runs: int = 0):
+        self.id = id
+        self.action = action
+        self.at = at
+        self.every = every
+        self.duration = duration
+        self.name = name
+        self.restore = restore
+        self.next = next            # wall clock (epoch), for people and the state file
+        self.runs = runs
+        self.deadline = 0.0         # time.monotonic() twin of `next`
+
+    @property
+    def slot(self) -> str:
+        return next(iter(self.action), "")
+
+    @property
+    def once(self) -> bool:
+        return not self.at and not self.every
+
+    def to_dict(self) -> dict:
+        return {f: getattr(self, f) for f in self.FIELDS}
+
+class Scheduler:
+    """Runs jobs through `run(action) -> undo action | None`, off the request path.
+
+    `on_change()` is called after every add, cancel and run, e.g. to mark the
+    state file dirty; dump() and restore() are its contents.
+    """
+
+    def __init__(self, run, max_jobs: int = 10000, on_change=None, log=None):
+        self.run = run
+        self.max_jobs = max_jobs
+        self.on_change = on_change
+        self.log = log
+        self.jobs = {}
+        self.ran = 0
+        self.failed = 0
+        self._heap = []
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._offset = time.time() - time.monotonic()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def add(self, action: dict, at=None, after=None, every=None, duration=None,
+            name: str = "") -> Job:
+        """Schedule `action`; raises ValueError for an invalid timing."""
+        if at is not None:
+            at = parse_daily(at)
+        after, every, duration = (None if v is None else float(v) for v in (after, every, duration))
+        if any(v is not None and not math.isfinite(v) for v in (after, every, duration)):
+            raise ValueError("in, every and for must be finite numbers")
+        if at and (after is not None or every is not None):
+            raise ValueError("at cannot be combined with in or every")
+        if every is not None and every < 1:
+            raise ValueError("every must be at least 1 second")
+        if any(v is not None and v < 0 for v in (after, duration)):
+            raise ValueError("in and for must not be negative")
+        with self._cond:
+            if len(self.jobs) >= self.max_jobs:
+                raise ValueError(f"at most {self.max_jobs} jobs")
+            job = Job(next(self._ids), dict(action), at, every, duration, str(name or ""))
+            now = time.time()
+            if at:
+                job.next = next_daily(at, now)
+            else:
+                job.next = now + (after if after is not None else every or 0.0)
+            self._push(job)
+        self._changed()
+        return job
+
+    def cancel(self, job_id: int) -> bool:
+        with self._cond:
+            job = self.jobs.pop(job_id, None)
+            # the entry stays in the heap until it comes up; compact if they pile up
+            if job and len(self._heap) > 2 * len(self.jobs) + 64:
+                self._compact()
+        if job:
+            self._changed()
+        return job is not None
+
+    def list(self) -> list:
+        with self._cond:
+            return [job.to_dict() for job in sorted(self.jobs.values(), key=lambda j: j.next)]
+
+    def dump(self) -> list:
+        return self.list()
+
+    def restore(self, jobs) -> int:
+        """Re-add jobs from dump(). Overdue one-shots (e.g. a restore) run at
+        once; daily and repeating jobs skip to their next time. A job whose id
+        is already taken (added before the restore) gets a new one."""
+        now = time.time()
+        restored = 0
+        with self._cond:
+            taken = set(self.jobs)
+            renumber = []
+            for data in jobs or ():
+                try:
+                    job = Job(**{f: data[f] for f in Job.FIELDS if f in data})
+                    job.id = int(job.id)
+                    if not isinstance(job.action, dict) or not job.action:
+                        continue
+                    if job.at:
+                        job.at = parse_daily(job.at)
+                        job.next = next_daily(job.at, now)
+                    if not all(math.isfinite(v) for v in (job.next, job.every or 0, job.duration or 0)):
+                        continue
+                except (TypeError, ValueError):
+                    continue
+                if job.every and job.next < now:
+                    job.next = now + job.every - (now - job.next) % job.every
+                if job.id in taken:
+                    renumber.append(job)
+                else:
+                    self._push(job)
+                restored += 1
+            self._ids = itertools.count(max(self.jobs, default=0) + 1)
+            for job in renumber:
+                job.id = next(self._ids)
+                self._push(job)
+        return restored
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {"jobs": len(self.jobs), "heap": len(self._heap), "ran": self.ran, "failed": self.failed}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop firing jobs; a job that is running finishes first. Jobs stay for dump()."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _push(self, job: Job):
+        job.deadline = time.monotonic() + (job.next - time.time())
+        self.jobs[job.id] = job
+        heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+        self._cond.notify()
+
+    def _compact(self):
+        self._heap = [(job.deadline, next(self._seq), job) for job in self.jobs.values()]
+        heapq.heapify(self._heap)
+
+    def _live(self, entry) -> bool:
+        deadline, _, job = entry
+        return self.jobs.get(job.id) is job and job.deadline == deadline
+
+    def _check_clock(self):
+        offset = time.time() - time.monotonic()
+        moved = offset - self._offset
+        if abs(moved) < CLOCK_SLACK_SECONDS:
+            return
+        self._offset = offset
+        daily = [job for job in self.jobs.values() if job.at]
+        if self.log and daily:
+            self.log(f"[SCHED] wall clock moved {moved:+.0f}s, re-aiming {len(daily)} daily jobs")
+        for job in self.jobs.values():
+            if not job.at:
+                job.next += moved   # relative jobs keep their deadline
+        for job in daily:
+            job.next = next_daily(job.at, time.time())
+            self._push(job)
+
+    def _due(self) -> list:
+        """Block until at least one job is due; pop and return the due jobs
+        ([] once stopped)."""
+        with self._cond:
+            while not self._stopped:
+                self._check_clock()
+                now = time.monotonic()
+                due = []
+                while self._heap and (self._heap[0][0] <= now or not self._live(self._heap[0])):
+                    entry = heapq.heappop(self._heap)
+                    if self._live(entry):
+                        due.append(entry[2])
+                if due:
+                    return due
+                timeout = self._heap[0][0] - now if self._heap else None
+                if any(job.at for job in self.jobs.values()):
+                    timeout = min(timeout or CLOCK_CHECK_SECONDS, CLOCK_CHECK_SECONDS)
+                self._cond.wait(timeout)
+            return []
+
+    def _loop(self):
+        while not self._stopped:
+            for job in self._due():
+                self._fire(job)
+            self._changed()
+
+    def _fire(self, job: Job):
+        try:
+            undo = self.run(job.action)
+            self.ran += 1
+        except Exception as e:
+            undo = None
+            self.failed += 1
+            if self.log:
+                self.log(f"[SCHED] job {job.id} {job.action} failed: {e}")
+        with self._cond:
+            if self.jobs.get(job.id) is not job:
+                return      # cancelled while it ran
+            job.runs += 1
+            if job.once:
+                del self.jobs[job.id]
+            else:
+                if job.at:
+                    # from after the slot that just ran: a run up to
+                    # CLOCK_SLACK_SECONDS early must not land on it again
+                    job.next = next_daily(job.at, max(time.time(), job.next) + 1)
+                else:
+                    job.next += job.every
+                    if job.next < time.time():
+                        job.next = time.time() + job.every   # fell behind; do not replay
+                self._push(job)
+            if undo is not None and job.duration is not None and not job.restore:
+                self._schedule_restore(job, undo)
+
+    def _schedule_restore(self, job: Job, undo: dict):
+        pending = next((j for j in self.jobs.values() if j.restore and j.slot == job.slot), None)
+        if pending:
+            # restore the slot as it was before the first overlapping job;
+            # anything else in `undo` (e.g. a guard) comes from the latest
+            undo = dict(undo, **{job.slot: pending.action.get(job.slot)})
+            del self.jobs[pending.id]
+        restore = Job(next(self._ids), dict(undo), name=f"restore #{job.id}", restore=True,
+                      next=time.time() + job.duration)
+        self._push(restore)
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import http.client
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from urllib.parse import urlsplit
+from weakref import WeakSet
+from flask import Flask, Response, request, jsonify
+
+APP_TAG = "[FLEET]"
+HTTP_PORT = int(os.getenv("PORT", "8080"))
+BOARDS_FILE = os.getenv("FLEET_BOARDS", "/app/boards.json")
+
+def log(msg: str):
+    print(f"{APP_TAG} {msg}", flush=True)
+
+def _env_float(name: str, default: float) -> float:
+    v = os.getenv(name)
+    if v is None:
+        return default
+    try:
+        return float(v)
+    except ValueError:
+        log(f"ENV {name}='{v}' invalid; using default {default}")
+        return default
+
+COMMAND_TIMEOUT_SECONDS = _env_float("FLEET_TIMEOUT_SECONDS", 2.0)
+POOL_SIZE = int(_env_float("FLEET_POOL_SIZE", 4))
+STREAM_RETRY_MAX_SECONDS = _env_float("FLEET_STREAM_RETRY_MAX_SECONDS", 10.0)
+
+COLORS = {"blue", "green", "red", "yellow", "purple", "off"}
+
+app = Flask(__name__)
+
+status_connections = WeakSet()
+status_seq = itertools.count(1)
+
+class Board:
+    """One board: pooled keep-alive connections, command stats, status stream."""
+
+    def __init__(self, name: str, url: str):
+        parts = urlsplit(url if "://" in url else f"http://{url}")
+        self.name = name
+        self.url = f"http://{parts.hostname}:{parts.port or 8000}"
+        self.host = parts.hostname
+        self.port = parts.port or 8000
+        self.state = {}
+        self.stream_connected = False
+        self.commands = 0
+        self.failures = 0
+        self.last_error = ""
+        self.last_latency_ms = None
+        self._latencies = deque(maxlen=256)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stream_thread = None
+
+    # -- pooled requests ----------------------------------------------------
+
+    def _get_conn(self) -> http.client.HTTPConnection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return http.client.HTTPConnection(self.host, self.port, timeout=COMMAND_TIMEOUT_SECONDS)
+
+    def _put_conn(self, conn: http.client.HTTPConnection):
+        with self._lock:
+            if len(self._idle) < POOL_SIZE:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method: str, path: str, payload: dict | None = None) -> tuple[int, dict]:
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        t0 = time.monotonic()
+        for attempt in range(2):
+            conn = self._get_conn()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                # a pooled connection may have been closed by the board; retry once fresh
+                if attempt == 0 and not isinstance(e, TimeoutError):
+                    continue
+                self._record(t0, str(e) or e.__class__.__name__)
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._put_conn(conn)
+            self._record(t0, "" if resp.status < 400 else f"HTTP {resp.status}")
+            try:
+                return resp.status, json.loads(data or b"{}")
+            except ValueError:
+                return resp.status, {}
+
+    def _record(self, t0: float, error: str):
+        latency = (time.monotonic() - t0) * 1000.0
+        with self._lock:
+            self.commands += 1
+            self.last_latency_ms = round(latency, 2)
+            self._latencies.append(latency)
+            if error:
+                self.failures += 1
+                self.last_error = error
+
+    # -- status stream ------------------------------------------------------
+
+    def start_stream(self):
+        self._stream_thread = threading.Thread(target=self._stream_loop, name=f"stream-{self.name}", daemon=True)
+        self._stream_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _stream_loop(self):
+        backoff = 0.5
+        while not self._stop.is_set():
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                conn.request("GET", "/status", headers={"Accept": "text/event-stream"})
+                resp = conn.getresponse()
+                if resp.status != 200:
+                    raise ConnectionError(f"HTTP {resp.status}")
+                self.stream_connected = True
+                backoff = 0.5
+                _broadcast(self)
+                while not self._stop.is_set():
+                    line = resp.readline()
+                    if not line:
+                        break
+                    if line.startswith(b"data:"):
+                        try:
+                            self.state = json.loads(line[5:])
+                        except ValueError:
+                            continue
+                        _broadcast(self)
+            except (OSError, http.client.HTTPException) as e:
+                self.last_error = f"stream: {e}"
+            finally:
+                conn.close()
+            if self.stream_connected:
+                self.stream_connected = False
+                _broadcast(self)
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, STREAM_RETRY_MAX_SECONDS)
+
+    def describe(self) -> dict:
+        with self._lock:
+            ordered = sorted(self._latencies)
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2) if ordered else None
+        return {
+            "name": self.name,
+            "url": self.url,
+            "connected": self.stream_connected,
+            "color": self.state.get("color"),
+            "status": self.state.get("status"),
+            "commands": self.commands,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "latency_ms": {"last": self.last_latency_ms, "p50": pct(0.50), "p99": pct(0.99)},
+        }
+
+boards = {}
+boards_lock = threading.Lock()
+executor = ThreadPoolExecutor(max_workers=int(_env_float("FLEET_WORKERS", 32)), thread_name_prefix="fanout")
+
+def add_board(name: str, url: str) -> Board:
+    board = Board(name, url)
+    with boards_lock:
+        old = boards.get(name)
+        boards[name] = board
+    if old:
+        old.stop()
+    board.start_stream()
+    log(f"Board {name}: {board.url}")
+    return board
+
+def remove_board(name: str) -> bool:
+    with boards_lock:
+        board = boards.pop(name, None)
+    if board:
+        board.stop()
+    return board is not None
+
+def load_boards(path: str):
+    """boards.json: {"name": "http://host:port", ...} or [{"name": ..., "url": ...}]"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except OSError:
+        log(f"No board registry at {path}; add boards via POST /api/boards")
+        return
+    except ValueError as e:
+        log(f"Invalid board registry {path}: {e}")
+        return
+    items = data.items() if isinstance(data, dict) else ((b["name"], b["url"]) for b in data)
+    for name, url in items:
+        add_board(name, url)
+
+def _select(names) -> list[Board]:
+    with boards_lock:
+        if not names:
+            return list(boards.values())
+        return [boards[n] for n in names if n in boards]
+
+def fan_out(commands: dict) -> dict:
+    """Send {board: color} concurrently; per-board result with latency."""
+    def send(board: Board, color: str) -> dict:
+        t0 = time.monotonic()
+        try:
+            # apply_color toggles a color that is already set; keep scenes idempotent
+            if color != "off" and board.stream_connected and board.state.get("color") == color:
+                return {"ok": True, "skipped": True, "color": color}
+            status, data = board.request("POST", "/api/color", {"color": color})
+            return {"ok": status == 200, "http": status, "color": data.get("color"),
+                    "latency_ms": round((time.monotonic() - t0) * 1000.0, 2)}
+        except Exception as e:
+            return {"ok": False, "error": str(e) or e.__class__.__name__,
+                    "latency_ms": round((time.monotonic() - t0) * 1000.0, 2)}
+
+    futures = {board.name: executor.submit(send, board, color) for board, color in commands.items()}
+    return {name: f.result() for name, f in futures.items()}
+
+def _broadcast(board: Board | None = None):
+    payload = {"seq": next(status_seq)}
+    if board is not None:
+        payload.update({
+            "board": board.name,
+            "connected": board.stream_connected,
+            "state": board.state,
+        })
+    else:
+        with boards_lock:
+            payload["boards"] = {b.name: {"connected": b.stream_connected, "state": b.state}
+                                 for b in boards.values()}
+    for q in list(status_connections):
+        try:
+            q.put(payload)
+        except Exception:
+            pass
+
+@app.route('/api/boards', methods=['GET', 'POST'])
+def api_boards():
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        name, url = data.get("name"), data.get("url")
+        if not name or not url:
+            return jsonify({"error": "name and url required"}), 400
+        return jsonify(add_board(str(name), str(url)).describe())
+    return jsonify([b.describe() for b in _select(None)])
+
+@app.route('/api/boards/<name>', methods=['DELETE'])
+def api_board_delete(name):
+    if not remove_board(name):
+        return jsonify({"error": "unknown board"}), 404
+    return jsonify({"removed": name})
+
+@app.route('/api/color', methods=['POST'])
+def api_color():
+    """{"color": "red", "boards": ["a", "b"]} -- boards optional (all)"""
+    data = request.get_json(silent=True) or {}
+    color = str(data.get("color") or "").lower()
+    if color not in COLORS:
+        return jsonify({"error": "invalid color"}), 400
+    targets = _select(data.get("boards"))
+    if not targets:
+        return jsonify({"error": "no boards"}), 404
+    t0 = time.monotonic()
+    results = fan_out({board: color for board in targets})
+    return jsonify({
+        "results": results,
+        "failed": sum(1 for r in results.values() if not r["ok"]),
+        "elapsed_ms": round((time.monotonic() - t0) * 1000.0, 2),
+    })
+
+@app.route('/api/scene', methods=['POST'])
+def api_scene():
+    """{"scene": {"board-a": "red", "board-b": "blue"}}"""
+    data = request.get_json(silent=True) or {}
+    scene = data.get("scene") or {}
+    if not isinstance(scene, dict) or any(str(c).lower() not in COLORS for c in scene.values()):
+        return jsonify({"error": "invalid scene"}), 400
+    with boards_lock:
+        unknown = [n for n in scene if n not in boards]
+        commands = {boards[n]: str(c).lower() for n, c in scene.items() if n in boards}
+    t0 = time.monotonic()
+    results = fan_out(commands)
+    for name in unknown:
+        results[name] = {"ok": False, "error": "unknown board"}
+    return jsonify({
+        "results": results,
+        "failed": sum(1 for r in results.values() if not r["ok"]),
+        "elapsed_ms": round((time.monotonic() - t0) * 1000.0, 2),
+    })
+
+@app.route('/')
+@app.route('/api/fleet')
+def api_fleet():
+    items = [b.describe() for b in _select(None)]
+    return jsonify({
+        "boards": items,
+        "connected": sum(1 for b in items if b["connected"]),
+        "total": len(items),
+    })
+
+@app.route('/status')
+def status_stream():
+    """Merged Server-Sent Events stream of every board's /status"""
+    def event_stream():
+        q = Queue()
+        status_connections.add(q)
+        try:
+            _broadcast()
+            while True:
+                data = q.get()
+                yield f"data: {json.dumps(data)}\n\n"
+        except GeneratorExit:
+            status_connections.discard(q)
+
+    return Response(event_stream(), mimetype="text/event-stream")
+
+if __name__ == '__main__':
+    log("Fleet controller")
+    load_boards(BOARDS_FILE)
+    app.run(debug=False, host='0.0.0.0', port=HTTP_PORT, threaded=True)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""appstate: EventJournal paging, StateStore files, settings and color jobs."""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import appstate
+
+TYPES = ("color", "status", "voice")
+
+class EventJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.journal = appstate.EventJournal(TYPES, 16)
+
+    def record(self, n: int, kind: str = "color"):
+        for i in range(n):
+            self.journal.record(kind, f"v{i}")
+
+    def test_query_all(self):
+        self.record(5)
+        page = self.journal.query()
+        self.assertEqual([e["seq"] for e in page["events"]], [1, 2, 3, 4, 5])
+        self.assertEqual((page["next"], page["latest"], page["missed"]), (5, 5, 0))
+
+    def test_paging_with_limit(self):
+        self.record(5)
+        page = self.journal.query(limit=2)
+        self.assertEqual([e["seq"] for e in page["events"]], [1, 2])
+        self.assertEqual(page["next"], 2)
+        page = self.journal.query(since=page["next"], limit=2)
+        self.assertEqual([e["seq"] for e in page["events"]], [3, 4])
+        page = self.journal.query(since=page["next"])
+        self.assertEqual([e["seq"] for e in page["events"]], [5])
+        page = self.journal.query(since=page["next"])
+        self.assertEqual((page["events"], page["next"]), ([], 5))
+
+    def test_wrap_reports_missed(self):
+        self.record(40)
+        page = self.journal.query()
+        self.assertEqual([e["seq"] for e in page["events"]], list(range(25, 41)))
+        self.assertEqual(page["events"][0]["value"], "v24")
+        self.assertEqual(page["missed"], 24)
+        page = self.journal.query(since=30)
+        self.assertEqual(page["events"][0]["seq"], 31)
+        self.assertEqual(page["missed"], 0)
+
+    def test_cursor_from_before_a_restart(self):
+        self.record(3)
+        page = self.journal.query(since=1000)
+        self.assertEqual([e["seq"] for e in page["events"]], [1, 2, 3])
+
+    def test_type_filter(self):
+        self.journal.record("color", "red")
+        self.journal.record("status", "Ready")
+        self.journal.record("voice", "green", 0.91234)
+        page = self.journal.query(kinds=["status", "voice"])
+        self.assertEqual([e["type"] for e in page["events"]], ["status", "voice"])
+        self.assertEqual(page["events"][1]["score"], 0.9123)
+        self.assertEqual(page["next"], 3)
+
+    def test_filter_with_limit_pages_by_slot(self):
+        for kind in ("color", "status", "color", "status"):
+            self.journal.record(kind)
+        page = self.journal.query(kinds=["status"], limit=1)
+        self.assertEqual([e["seq"] for e in page["events"]], [2])
+        page = self.journal.query(since=page["next"], kinds=["status"], limit=1)
+        self.assertEqual([e["seq"] for e in page["events"]], [4])
+
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            self.journal.record("nope")
+
+    def test_minimum_capacity(self):
+        self.assertEqual(appstate.EventJournal(TYPES, 1).capacity, 16)
+
+class StateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "state.json")
+        self.logged = []
+        self.state = {"color": "red", "status": "Ready"}
+        self.store = appstate.StateStore(self.path, lambda: dict(self.state), log=self.logged.append)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, text: str):
+        with open(self.path, "w") as f:
+            f.write(text)
+
+    def test_missing_file(self):
+        self.assertIsNone(self.store.load())
+        self.assertEqual(self.logged, [])
+
+    def test_no_path(self):
+        store = appstate.StateStore("", dict)
+        self.assertIsNone(store.load())
+        store.flush()
+
+    def test_corrupt_files_start_clean(self):
+        for text in ("", "{", "not json", "[1, 2]", "null", '{"version": 99, "color": "red"}',
+                     '{"color": "red"}'):
+            with self.subTest(text=text):
+                self.write(text)
+                self.logged.clear()
+                self.assertIsNone(self.store.load())
+                self.assertEqual(len(self.logged), 1)
+
+    def test_round_trip(self):
+        self.store.flush()
+        with open(self.path) as f:
+            data = json.load(f)
+        self.assertEqual((data["version"], data["seq"], data["color"]), (1, 1, "red"))
+        store = appstate.StateStore(self.path, dict)
+        self.assertEqual(store.load(), self.state)
+        self.assertEqual(store.seq, 1)
+        self.assertFalse(os.path.exists(f"{self.path}.tmp"))
+
+    def test_unchanged_state_is_not_rewritten(self):
+        self.store.flush()
+        mtime = os.stat(self.path).st_mtime_ns
+        self.store.flush()
+        self.assertEqual(self.store.seq, 1)
+        self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+        self.state["color"] = "blue"
+        self.store.flush()
+        self.assertEqual(self.store.seq, 2)
+
+    def test_loaded_state_is_not_rewritten(self):
+        self.store.flush()
+        store = appstate.StateStore(self.path, lambda: dict(self.state))
+        store.load()
+        store.flush()
+        self.assertEqual(store.seq, 1)
+
+    def test_write_failure_is_logged_once(self):
+        store = appstate.StateStore(os.path.join(self.path, "sub", "state.json"), lambda: dict(self.state),
+                                    log=self.logged.append)
+        self.write("a file, not a directory")
+        store.flush()
+        self.state["color"] = "blue"
+        store.flush()
+        self.assertEqual(len(self.logged), 1)
+        self.assertEqual(store.seq, 0)
+        self.assertTrue(store.last_error)
+
+class StreamSettingsTest(unittest.TestCase):
+    def test_defaults(self):
+        settings = appstate.StreamSettings.from_env(lambda name, default: default)
+        self.assertEqual(vars(settings), vars(appstate.StreamSettings()))
+
+    def test_from_env(self):
+        env = {"STATE_MAX_WAITERS": 8, "DRAIN_RETRY_MAX_MS": 900, "SSE_COMPRESS_LEVEL": 0}
+        settings = appstate.StreamSettings.from_env(lambda name, default: env.get(name, default))
+        self.assertEqual(settings.max_waiters, 8)
+        self.assertEqual(settings.drain_retry_ms, (500, 900))
+        self.assertEqual(settings.compress_level, 0)
+
+class ColorJobTest(unittest.TestCase):
+    def test_color_action(self):
+        self.assertEqual(appstate.color_action({"color": "RED"}), {"color": "red"})
+        self.assertEqual(appstate.color_action({"color": "off", "expect": "red"}), {"color": "off", "expect": "red"})
+        for data in ({}, {"color": "pink"}, {"color": "red", "expect": "pink"}):
+            with self.subTest(data=data):
+                with self.assertRaises(ValueError):
+                    appstate.color_action(data)
+
+    def test_flash_and_restore(self):
+        shown = ["blue"]
+        run = appstate.color_job(lambda: shown[-1], shown.append)
+        undo = run({"color": "red"})
+        self.assertEqual(undo, {"color": "blue", "expect": "red"})
+        self.assertIsNotNone(run(undo))
+        self.assertEqual(shown, ["blue", "red", "blue"])
+
+    def test_restore_skipped_after_another_color(self):
+        shown = ["blue"]
+        run = appstate.color_job(lambda: shown[-1], shown.append)
+        undo = run({"color": "red"})
+        shown.append("green")
+        self.assertIsNone(run(undo))
+        self.assertEqual(shown[-1], "green")
+
+    def test_no_color_counts_as_off(self):
+        shown = [""]
+        run = appstate.color_job(lambda: shown[-1], shown.append)
+        self.assertEqual(run({"color": "off"}), {"color": "off", "expect": "off"})
+        self.assertEqual(shown, [""])
+
+if __name__ == "__main__":
+    unittest.main()
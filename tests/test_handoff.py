@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""handoff: the takeover signal and the supervisor's --exit-on."""
+
+import importlib
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+COMMON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common")
+sys.path.append(COMMON)
+import handoff
+
+# A copy that reports ready, says whether it took over, then exits with argv[1]
+CHILD = f"""
+import os, sys
+sys.path.append({COMMON!r})
+import handoff
+handoff.notify_ready()
+print("took over" if handoff.wait_takeover() else "not taking over", flush=True)
+sys.exit(int(sys.argv[1]))
+"""
+
+class TakeoverTest(unittest.TestCase):
+    def setUp(self):
+        # wait_takeover() reads TAKEOVER_FD once per process
+        importlib.reload(handoff)
+
+    def tearDown(self):
+        os.environ.pop("TAKEOVER_FD", None)
+
+    def test_without_a_supervisor(self):
+        self.assertTrue(handoff.wait_takeover())
+
+    def test_waits_for_the_old_copy(self):
+        r, w = os.pipe()
+        os.environ["TAKEOVER_FD"] = str(r)
+        threading.Timer(0.1, handoff.Supervisor._hand_over, args=(w, True)).start()
+        t0 = time.monotonic()
+        self.assertTrue(handoff.wait_takeover())
+        self.assertGreaterEqual(time.monotonic() - t0, 0.05)
+        # later callers get the same answer without waiting
+        self.assertTrue(handoff.wait_takeover())
+
+    def test_not_taking_over(self):
+        r, w = os.pipe()
+        os.environ["TAKEOVER_FD"] = str(r)
+        handoff.Supervisor._hand_over(w, False)
+        self.assertFalse(handoff.wait_takeover())
+
+    def test_after_takeover(self):
+        r, w = os.pipe()
+        os.environ["TAKEOVER_FD"] = str(r)
+        ran = threading.Event()
+        handoff.after_takeover(ran.set)
+        self.assertFalse(ran.wait(0.1))
+        handoff.Supervisor._hand_over(w, True)
+        self.assertTrue(ran.wait(2.0))
+
+class SupervisorTest(unittest.TestCase):
+    def setUp(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(8)
+
+    def tearDown(self):
+        self.sock.close()
+
+    def supervisor(self, code: int) -> handoff.Supervisor:
+        return handoff.Supervisor(self.sock, [sys.executable, "-c", CHILD, str(code)],
+                                  ready_timeout=10.0, stop_timeout=5.0, exit_on=(3,))
+
+    def test_exit_on_code_stops_the_supervisor(self):
+        self.assertEqual(self.supervisor(3).run(), 3)
+
+    def test_stop_request(self):
+        supervisor = self.supervisor(0)
+        threading.Timer(0.5, setattr, args=(supervisor, "stop_requested", True)).start()
+        self.assertEqual(supervisor.run(), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""ratelimit.Admission: token buckets, the /status cap and from_env()."""
+
+import os
+import sys
+import time
+import unittest
+from queue import Queue
+from weakref import WeakSet
+
+from flask import Flask
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import ratelimit
+
+class AdmissionTest(unittest.TestCase):
+    def test_burst_then_wait(self):
+        admission = ratelimit.Admission({"command": (1.0, 2.0)}, 0)
+        self.assertEqual(admission.take("a", "command"), 0.0)
+        self.assertEqual(admission.take("a", "command"), 0.0)
+        wait = admission.take("a", "command")
+        self.assertGreater(wait, 0.9)
+        self.assertLessEqual(wait, 1.0)
+        self.assertEqual(admission.rejected["command"], 1)
+
+    def test_refill(self):
+        admission = ratelimit.Admission({"command": (100.0, 1.0)}, 0)
+        self.assertEqual(admission.take("a", "command"), 0.0)
+        self.assertGreater(admission.take("a", "command"), 0.0)
+        time.sleep(0.05)
+        self.assertEqual(admission.take("a", "command"), 0.0)
+
+    def test_clients_and_classes_are_separate(self):
+        admission = ratelimit.Admission({"command": (1.0, 1.0), "asset": (1.0, 1.0)}, 0)
+        self.assertEqual(admission.take("a", "command"), 0.0)
+        self.assertEqual(admission.take("b", "command"), 0.0)
+        self.assertEqual(admission.take("a", "asset"), 0.0)
+        self.assertGreater(admission.take("a", "command"), 0.0)
+
+    def test_zero_rate_disables(self):
+        admission = ratelimit.Admission({"command": (0.0, 0.0)}, 0)
+        for _ in range(100):
+            self.assertEqual(admission.take("a", "command"), 0.0)
+        self.assertEqual(admission._buckets, {})
+
+    def test_idle_clients_are_pruned(self):
+        admission = ratelimit.Admission({"asset": (1000.0, 1.0)}, 0, max_clients=4)
+        for i in range(4):
+            admission.take(f"c{i}", "asset")
+        time.sleep(0.01)
+        admission.take("c4", "asset")
+        self.assertLessEqual(len(admission._buckets), 1)
+
+    def test_subscriber_cap(self):
+        admission = ratelimit.Admission({}, 2)
+        connections = WeakSet()
+        queues = [Queue() for _ in range(3)]
+        self.assertTrue(admission.subscribe(connections, queues[0]))
+        self.assertTrue(admission.subscribe(connections, queues[1]))
+        self.assertFalse(admission.subscribe(connections, queues[2]))
+        self.assertEqual(admission.rejected["subscribers"], 1)
+        connections.discard(queues[0])
+        self.assertTrue(admission.subscribe(connections, queues[2]))
+        self.assertEqual(admission.snapshot(connections)["subscribers"], 2)
+
+    def test_no_subscriber_cap(self):
+        admission = ratelimit.Admission({}, 0)
+        connections = WeakSet()
+        queues = [Queue() for _ in range(50)]
+        self.assertTrue(all(admission.subscribe(connections, q) for q in queues))
+
+    def test_from_env(self):
+        env = {"RATE_COMMAND_PER_SECOND": 0.0, "RATE_STATUS_BURST": 9.0, "SSE_MAX_SUBSCRIBERS": 4.0}
+        admission = ratelimit.Admission.from_env(lambda name, default: env.get(name, default))
+        self.assertEqual(admission.limits["command"], (0.0, ratelimit.LIMITS["command"][1]))
+        self.assertEqual(admission.limits["status"], (ratelimit.LIMITS["status"][0], 9.0))
+        self.assertEqual(admission.limits["asset"], ratelimit.LIMITS["asset"])
+        self.assertEqual(admission.max_subscribers, 4)
+
+    def test_too_many(self):
+        with Flask(__name__).app_context():
+            body, status, headers = ratelimit.too_many(0.2)
+        self.assertEqual(status, 429)
+        self.assertEqual(headers["Retry-After"], "1")
+        self.assertEqual(body.get_json()["retry_after"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
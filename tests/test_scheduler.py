@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""scheduler.Scheduler: in/every/at/for timings, restore() and stop()."""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import scheduler
+
+class Colors:
+    """A run callback that shows colors and undoes them, like the apps' color jobs."""
+
+    def __init__(self):
+        self.color = "off"
+        self.shown = []
+        self.ran = threading.Event()
+
+    def run(self, action: dict) -> dict:
+        previous = self.color
+        self.color = action["color"]
+        self.shown.append(self.color)
+        self.ran.set()
+        return {"color": previous}
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.colors = Colors()
+        self.jobs = scheduler.Scheduler(self.colors.run)
+
+    def tearDown(self):
+        self.jobs.stop(timeout=1.0)
+
+    def test_in_runs_once(self):
+        self.jobs.start()
+        job = self.jobs.add({"color": "red"}, after=0.05)
+        self.assertTrue(self.colors.ran.wait(2.0))
+        time.sleep(0.05)
+        self.assertEqual(self.colors.shown, ["red"])
+        self.assertNotIn(job.id, self.jobs.jobs)
+
+    def test_every_repeats_from_its_schedule(self):
+        before = time.time()
+        job = self.jobs.add({"color": "green"}, every=5)
+        self.assertAlmostEqual(job.next, before + 5, delta=0.5)
+        planned = job.next
+        self.jobs._fire(job)
+        self.assertEqual(job.runs, 1)
+        self.assertEqual(job.next, planned + 5)
+        self.assertIn(job.id, self.jobs.jobs)
+
+    def test_every_fell_behind_does_not_replay(self):
+        job = self.jobs.add({"color": "green"}, every=5)
+        job.next = time.time() - 60
+        self.jobs._fire(job)
+        self.assertGreater(job.next, time.time())
+
+    def test_at_aims_at_the_next_daily_time(self):
+        job = self.jobs.add({"color": "blue"}, at="7:05")
+        self.assertEqual(job.at, "07:05")
+        self.assertEqual(job.next, scheduler.next_daily("07:05", time.time()))
+        self.assertGreater(job.next, time.time())
+
+    def test_at_early_run_moves_to_the_next_day(self):
+        job = self.jobs.add({"color": "blue"}, at="07:05")
+        slot = job.next
+        job.next = slot
+        # a run up to CLOCK_SLACK_SECONDS early must not land on the same slot again
+        self.jobs._fire(job)
+        self.assertGreater(job.next, slot + 20 * 3600)
+
+    def test_for_schedules_a_restore(self):
+        job = self.jobs.add({"color": "red"}, after=0, duration=30)
+        self.jobs._fire(job)
+        restores = [j for j in self.jobs.jobs.values() if j.restore]
+        self.assertEqual(len(restores), 1)
+        self.assertEqual(restores[0].action, {"color": "off"})
+        self.assertAlmostEqual(restores[0].next, time.time() + 30, delta=1.0)
+
+    def test_overlapping_for_keeps_the_first_restore(self):
+        first = self.jobs.add({"color": "red"}, after=0, duration=30)
+        self.jobs._fire(first)
+        second = self.jobs.add({"color": "green"}, after=0, duration=30)
+        self.jobs._fire(second)
+        restores = [j for j in self.jobs.jobs.values() if j.restore]
+        self.assertEqual(len(restores), 1)
+        self.assertEqual(restores[0].action["color"], "off")
+
+    def test_invalid_timings(self):
+        for kwargs in ({"after": float("nan")}, {"after": "inf"}, {"every": float("inf")},
+                       {"duration": float("nan")}, {"after": -1}, {"every": 0.5},
+                       {"at": "25:00"}, {"at": "noon"}, {"at": "09:00", "after": 5}):
+            with self.subTest(**{k: str(v) for k, v in kwargs.items()}):
+                with self.assertRaises(ValueError):
+                    self.jobs.add({"color": "red"}, **kwargs)
+        self.assertEqual(self.jobs.jobs, {})
+
+    def test_max_jobs(self):
+        jobs = scheduler.Scheduler(self.colors.run, max_jobs=2)
+        jobs.add({"color": "red"}, after=60)
+        jobs.add({"color": "red"}, after=60)
+        with self.assertRaises(ValueError):
+            jobs.add({"color": "red"}, after=60)
+
+    def test_cancel(self):
+        job = self.jobs.add({"color": "red"}, after=60)
+        self.assertTrue(self.jobs.cancel(job.id))
+        self.assertFalse(self.jobs.cancel(job.id))
+
+    def test_restore_round_trip(self):
+        self.jobs.add({"color": "red"}, after=60)
+        self.jobs.add({"color": "blue"}, at="07:05")
+        dump = self.jobs.dump()
+        jobs = scheduler.Scheduler(self.colors.run)
+        self.assertEqual(jobs.restore(dump), 2)
+        self.assertEqual(sorted(jobs.jobs), sorted(j["id"] for j in dump))
+        # new ids continue after the restored ones
+        self.assertGreater(jobs.add({"color": "green"}, after=60).id, max(jobs.jobs) - 1)
+
+    def test_restore_skips_bad_jobs(self):
+        good = {"id": 1, "action": {"color": "red"}, "next": time.time() + 60}
+        bad = [
+            {"id": 2, "action": {"color": "red"}, "next": float("nan")},
+            {"id": 3, "action": {"color": "red"}, "every": float("inf"), "next": time.time()},
+            {"id": 4, "action": {"color": "red"}, "at": "99:99"},
+            {"action": {"color": "red"}},
+            "not a job",
+        ]
+        self.assertEqual(self.jobs.restore([good] + bad), 1)
+        self.assertEqual(list(self.jobs.jobs), [1])
+
+    def test_restore_renumbers_taken_ids(self):
+        added = self.jobs.add({"color": "green"}, after=60)
+        restored = self.jobs.restore([{"id": added.id, "action": {"color": "red"}, "next": time.time() + 60}])
+        self.assertEqual(restored, 1)
+        self.assertEqual(len(self.jobs.jobs), 2)
+        self.assertIs(self.jobs.jobs[added.id], added)
+
+    def test_stop_before_a_due_job(self):
+        self.jobs.start()
+        self.jobs.stop()
+        self.jobs.add({"color": "red"}, after=0)
+        self.assertFalse(self.colors.ran.wait(0.2))
+        self.assertEqual(len(self.jobs.dump()), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2025 Foundries.io
+#
+# SPDX-License-Identifier: BSD-3-Clause
+#
+"""9-webapp-led-mcu-voice with the mock Bridge: state file and effect input."""
+
+import importlib.util
+import json
+import os
+import tempfile
+import time
+import unittest
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "9-webapp-led-mcu-voice",
+                   "webapp-led-mcu-voice.py")
+
+app = None
+tmp = None
+
+def setUpModule():
+    global app, tmp
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update({
+        "LED_SYSFS_ROOT": tmp.name,
+        "STATE_FILE": os.path.join(tmp.name, "state.json"),
+        "SCHEDULE_FILE": os.path.join(tmp.name, "schedule.json"),
+        "CONFIG_FILE": os.path.join(tmp.name, "config.json"),
+        "FW_STATE_DIR": tmp.name,
+        "VOICE_ENABLED": "0",
+        "DEBUG": "0",
+    })
+    spec = importlib.util.spec_from_file_location("webapp_led_mcu_voice", APP)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+
+def tearDownModule():
+    tmp.cleanup()
+
+def flat(frame) -> list:
+    return [cell for row in frame for cell in row]
+
+class StateSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        app.clear_matrix_display()
+        app.show_microphone_icon()
+        time.sleep(0.1)
+        app.state_store.flush()
+
+    def test_text_scroll_does_not_rewrite_the_snapshot(self):
+        seq = app.state_store.seq
+        app.start_text_scroll("HELLO", 0.01, 1)
+        for _ in range(5):
+            time.sleep(0.02)
+            self.assertEqual(app._state_snapshot()["matrix"], flat(app.FRAME_MICROPHONE))
+            app.state_store.flush()
+        self.assertEqual(app.state_store.seq, seq)
+
+    def test_text_scroll_keeps_the_status(self):
+        app.WebStatus.update_status("Ready")
+        app.start_text_scroll("192.168.1.2", 0.01, 0)
+        time.sleep(0.05)
+        self.assertEqual(app._state_snapshot()["status"], "Ready")
+        app.stop_matrix_animation()
+
+    def test_select_window_saves_the_resting_state(self):
+        app.start_color_animation()
+        time.sleep(0.05)
+        snapshot = app._state_snapshot()
+        self.assertEqual(snapshot["status"], "Say 'Select' to start")
+        self.assertEqual(snapshot["matrix"], flat(app.FRAME_MICROPHONE))
+        app.stop_matrix_animation()
+
+class RestoreStateTest(unittest.TestCase):
+    def restore(self, **state) -> list:
+        with open(app.STATE_FILE, "w") as f:
+            json.dump(dict({"version": 1, "seq": 7, "leds": "red", "color": "red", "status": "Saved"}, **state), f)
+        logged = []
+        log, app.log = app.log, logged.append
+        try:
+            app.restore_state()
+        finally:
+            app.log = log
+        return logged
+
+    def test_bad_values_start_clean(self):
+        for state in ({"mcu_leds": "x"}, {"mcu_leds": [1]}, {"matrix": [None] * app.MATRIX_SIZE},
+                      {"matrix": ["x"] * app.MATRIX_SIZE}):
+            with self.subTest(state=state):
+                logged = self.restore(**state)
+                self.assertTrue(any("starting clean" in line for line in logged), logged)
+
+    def test_resume(self):
+        self.restore(mcu_leds=5, matrix=flat(app.FRAME_MICROPHONE))
+        self.assertEqual((app.current_status, app.led_color, app.mcu_leds.mask), ("Saved", "red", 5))
+
+class EffectInputTest(unittest.TestCase):
+    def test_non_finite_or_negative_timings(self):
+        client = app.app.test_client()
+        for body in ('{"effect": "fade", "color": "red", "duration": NaN}',
+                     '{"effect": "fade", "color": "red", "duration": Infinity}',
+                     '{"effect": "blink", "color": "red", "period": -Infinity}',
+                     '{"effect": "blink", "color": "red", "period": -1}'):
+            with self.subTest(body=body):
+                r = client.post("/api/effect", data=body, content_type="application/json")
+                self.assertEqual(r.status_code, 400)
+        self.assertEqual(app.led_effects.active(), {})
+
+if __name__ == "__main__":
+    unittest.main()